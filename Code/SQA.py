@@ -1,311 +1,251 @@
-import streamlit as st
-import tempfile
-import os
 import json
-from openai import OpenAI
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    CSVLoader,
-    EverNoteLoader,
-    PyMuPDFLoader,
-    TextLoader,
-    UnstructuredEmailLoader,
-    UnstructuredEPubLoader,
-    UnstructuredHTMLLoader,
-    UnstructuredMarkdownLoader,
-    UnstructuredODTLoader,
-    UnstructuredPowerPointLoader,
-    UnstructuredWordDocumentLoader,
+import os
+import tempfile
+import time
+import streamlit as st
+from client_pool import parse_endpoint_lines
+from exporters import export_sft_jsonl
+from incremental import ingest_sources_incremental
+from ingestion import IngestionSource, collect_chunks, ingest_sources, stream_chunks
+from metrics import DEFAULT_REGISTRY, MetricsRegistry, start_metrics_server
+from planner import plan_job
+from qa_engine import (
+    EngineConfig,
+    QAEngine,
+    build_json_export,
+    build_sft_export,
+    get_default_json_system_prompt,
+    get_default_qa_prompt,
+)
+from qa_stats import QAPairStats
+from work_queue import (
+    DEFAULT_QUEUE_PATH,
+    WORKER_ACTIVE_SECONDS,
+    WorkQueue,
+    collect_job_results,
+    start_local_workers,
+    submit_job,
+    wait_for_job,
 )
-from typing import List
-
-# OpenAI客户端配置（將在運行時根據用戶設定初始化）
-client = None
-
-# Document loaders mapping
-LOADER_MAPPING = {
-    ".csv": (CSVLoader, {}),
-    ".doc": (UnstructuredWordDocumentLoader, {}),
-    ".docx": (UnstructuredWordDocumentLoader, {}),
-    ".enex": (EverNoteLoader, {}),
-    ".eml": (UnstructuredEmailLoader, {}),
-    ".epub": (UnstructuredEPubLoader, {}),
-    ".html": (UnstructuredHTMLLoader, {}),
-    ".md": (UnstructuredMarkdownLoader, {}),
-    ".odt": (UnstructuredODTLoader, {}),
-    ".pdf": (PyMuPDFLoader, {}),
-    ".ppt": (UnstructuredPowerPointLoader, {}),
-    ".pptx": (UnstructuredPowerPointLoader, {}),
-    ".txt": (TextLoader, {"encoding": "utf8"}),
-}
-
-def init_openai_client():
-    """初始化OpenAI客戶端"""
-    global client
-    try:
-        api_key = st.session_state.get('api_key', '')
-        base_url = st.session_state.get('base_url', 'https://api.openai.com/v1')
-        
-        if not api_key:
-            st.error("請先設定API Key")
-            return False
-            
-        client = OpenAI(
-            api_key=api_key,
-            base_url=base_url,
-        )
-        return True
-    except Exception as e:
-        st.error(f"初始化OpenAI客戶端失敗: {e}")
-        return False
-
-def get_completion(prompt, model=None, temperature=None, max_tokens=None):
-    """獲取模型的響應"""
-    global client
-    
-    # 如果客戶端未初始化，嘗試初始化
-    if client is None:
-        if not init_openai_client():
-            return None
-    
-    # 使用用戶設定的參數或默認值
-    model = model or st.session_state.get('model_name', 'gpt-4.1-nano')
-    temperature = temperature if temperature is not None else st.session_state.get('temperature', 0.1)
-    max_tokens = max_tokens or st.session_state.get('max_tokens', 4096)
-    
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        st.error(f"調用API時發生錯誤: {e}")
-        return None
 
-def get_default_qa_prompt():
-    """獲取默認的QA生成提示詞"""
-    return """基於以下給定的文本，生成多組高質量的問答對。請遵循以下指南：
+def get_engine_config():
+    """根據session_state中的用戶設定構建引擎設定"""
+    return EngineConfig.from_dict(st.session_state)
 
-1. 問題部分：
-- 為不同的主題和概念創建多個問答對
-- 每個問題應考慮用戶可能的多種問法，例如：
-- 直接詢問（如"什麼是...？"）
-- 請求確認（如"是否可以說...？"）
-- 尋求解釋（如"請解釋一下...的含義。"）
-- 假設性問題（如"如果...會怎樣？"）
-- 例子請求（如"能否舉個例子說明...？"）
-- 問題應涵蓋文本中的關鍵信息、主要概念和細節，確保不遺漏重要內容。
+def get_engine():
+    """獲取本會話的QA生成引擎並換用當前設定，錯誤通過st.error顯示，指標記錄到本次運行
 
-2. 答案部分：
-- 提供一個全面、信息豐富的答案，涵蓋問題的所有可能角度，確保邏輯連貫。
-- 答案應直接基於給定文本，確保準確性和一致性。
-- 包含相關的細節，如日期、名稱、職位等具體信息，必要時提供背景信息以增強理解。
+    引擎保存在session_state中，界面重繪時復用同一個響應緩存連接和客戶端池（含端點健康狀態）。
+    """
+    engine = st.session_state.get('engine')
+    if engine is None:
+        engine = QAEngine(get_engine_config(), error_handler=st.error, metrics=st.session_state.get('run_metrics'))
+        st.session_state.engine = engine
+    else:
+        engine.update_config(get_engine_config(), st.session_state.get('run_metrics'))
+    return engine
 
-3. 格式：
-- 使用 "Q:" 標記每個問題的開始
-- 使用 "A:" 標記對應答案的開始
-- 問答對之間用兩個空行分隔
+@st.cache_resource
+def start_metrics_endpoint(port):
+    """每個進程只啟動一次 /metrics 端點"""
+    return start_metrics_server(port)
 
-4. 內容要求：
-- 確保問答對緊密圍繞文本主題，避免偏離主題。
-- 避免添加文本中未提及的信息，確保信息的真實性。
+def test_api_connection(api_key, base_url, model_name, endpoints=None):
+    """測試API連接，設定了多個端點時逐個測試"""
+    config = EngineConfig(api_key=api_key, base_url=base_url, model_name=model_name, endpoints=endpoints or [])
+    return QAEngine(config, error_handler=st.error).test_connection(model_name)
 
-給定文本：
-{text_content}
+def process_files(uploaded_files):
+    """使用進程池並行處理上傳的多個文件並生成文本塊"""
+    sources = [IngestionSource(name=uploaded_file.name, data=uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    config = get_engine_config()
+    if config.incremental:
+        reports = ingest_sources_incremental(
+            sources, get_engine().get_incremental_store(), config.ingest_workers, config.chunking_options()
+        )
+    else:
+        reports = ingest_sources(sources, max_workers=config.ingest_workers, options=config.chunking_options())
+    st.session_state.run_metrics = MetricsRegistry(parent=DEFAULT_REGISTRY)
+    record_ingestion_reports(reports)
+    return collect_chunks(reports, error_handler=st.error)
 
-請基於這個文本生成多個問答對。"""
+def record_ingestion_reports(reports):
+    """記錄文件處理耗時和token統計，供界面顯示"""
+    st.session_state.removed_chunks = sum(report.removed_chunks for report in reports)
+    st.session_state.run_metrics.observe_ingestion(reports)
+    st.session_state.ingestion_timings = [
+        {
+            "文件": report.name,
+            "文本段": len(report.chunks) or report.chunk_count,
+            "載入耗時(秒)": round(report.load_seconds, 3),
+            "分割耗時(秒)": round(report.split_seconds, 3),
+            "Token數": report.chunk_tokens,
+            "重疊Token數": report.overlap_tokens,
+            "狀態": "失敗" if report.error else "未變更（復用）" if report.reused else "成功",
+        }
+        for report in reports
+    ]
+    st.session_state.chunk_token_stats = {
+        "chunk_tokens": sum(report.chunk_tokens for report in reports),
+        "overlap_tokens": sum(report.overlap_tokens for report in reports),
+    }
 
-def get_default_json_system_prompt():
-    """獲取默認的JSON轉換系統提示詞"""
-    return """你是一個JSON格式轉換專家。將原始問答對文本轉換為標準JSON數組，每個問題必須成為獨立的QA對。
+def show_job_plan(text_chunks):
+    """顯示預估的請求數、token用量、成本和耗時，按本進程已有的運行記錄校準"""
+    engine = get_engine()
+    plan = plan_job(engine, text_chunks, history=DEFAULT_REGISTRY)
+    st.info(f"📋 預估：{plan.describe()}")
+    budget_warning = plan.budget_warning(engine.config)
+    if budget_warning:
+        st.warning(f"💰 {budget_warning}")
+    return plan
 
-CRITICAL RULES:
-- ONLY output valid JSON array format: [...]
-- SEPARATE each question into individual QA pairs
-- If one "Q:" contains multiple questions, split them into separate objects
-- Each question gets its own JSON object with the same answer
-- NO explanations, comments, or additional text
-- NO markdown code blocks
+def generate_qa_pairs_streaming(uploaded_files):
+    """流式載入文件並同時生成問答對，第一個請求無需等待全部文件載入完成，返回 (問答對, 文本段數)"""
+    sources = [IngestionSource(name=uploaded_file.name, data=uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    st.session_state.run_metrics = MetricsRegistry(parent=DEFAULT_REGISTRY)
+    engine = get_engine()
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    status_text.text("邊載入文件邊生成QA對...")
+    
+    def update_progress(stage1_done, stage2_done, total):
+        progress_bar.progress((stage1_done + stage2_done) / (total * 2) if total else 0.0)
+        status_text.text(f"已載入 {total} 個文本段 ｜ 第一階段：{stage1_done} ｜ 第二階段：{stage2_done}")
+    
+    # 載入在後台線程中進行，錯誤在生成結束後統一顯示
+    reports, errors = [], []
+    chunk_stream = stream_chunks(sources, engine.config.chunking_options(), errors.append, reports)
+    final_qa_pairs = list(engine.iter_qa_pairs(chunk_stream, update_progress))
+    for error in errors:
+        st.error(error)
+    record_ingestion_reports(reports)
+    st.session_state.pipeline_stats = engine.last_stats
+    st.session_state.dead_letters = engine.dead_letters
+    st.session_state.metrics_summary = engine.metrics.summary()
+    status_text.text(f"✅ 完成！共生成 {len(final_qa_pairs)} 個QA對")
+    return final_qa_pairs, sum(report.chunk_count for report in reports)
 
-TASK:
-1. Find all Q: and A: pairs
-2. If Q: contains multiple questions (separated by newlines), create separate QA pairs for each
-3. Each question should be paired with the corresponding answer
+def generate_qa_pairs_via_queue(text_chunks):
+    """提交到任務隊列，由本機和其他機器上的worker處理，並顯示隊列進度"""
+    config = get_engine_config()
+    queue_path = st.session_state.get('queue_path') or DEFAULT_QUEUE_PATH
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    queue = WorkQueue(queue_path)
+    try:
+        job_id, skipped = submit_job(queue, config, text_chunks)
+        counters_before = queue.job_metrics(job_id)
+        processes = start_local_workers(queue_path, config, int(st.session_state.get('queue_workers', 2)), job_id)
 
-EXAMPLE:
-If input has: Q: Question1? Question2? Question3? A: Answer content
-Output: [
-  {"question": "Question1?", "answer": "Answer content"},
-  {"question": "Question2?", "answer": "Answer content"},
-  {"question": "Question3?", "answer": "Answer content"}
-]"""
+        def show_progress(progress):
+            finished = progress['done'] + progress['failed'] + progress['skipped']
+            progress_bar.progress(finished / max(progress['total'], 1))
+            status_text.text(
+                f"任務 {job_id[:8]}：完成 {progress['done']}/{progress['total']} ｜ 處理中 {progress['leased']} ｜ "
+                f"失敗 {progress['failed']} ｜ 活躍worker {progress['active_workers']}"
+            )
 
-def test_api_connection(api_key, base_url, model_name):
-    """測試API連接"""
-    try:
-        test_client = OpenAI(
-            api_key=api_key,
-            base_url=base_url,
-        )
-        
-        # 簡單的測試請求
-        response = test_client.chat.completions.create(
-            model=model_name,
-            messages=[{"role": "user", "content": "Hello"}],
-            max_tokens=10,
-            temperature=0.1
-        )
-        
-        return True
-    except Exception as e:
-        st.error(f"API測試失敗: {e}")
-        return False
+        if not wait_for_job(queue, job_id, processes, show_progress):
+            st.warning(
+                f"{WORKER_ACTIVE_SECONDS:.0f} 秒內沒有活躍的worker，停止等待；未完成的文本段保留在隊列中，"
+                "啟動worker（本機worker進程數大於0或運行 queue_worker.py）後重新運行即可繼續"
+            )
+        for process in processes:
+            process.join()
+        final_qa_pairs, failures = collect_job_results(queue, config, job_id)
+        budget_skipped = queue.progress(job_id)['skipped']
+        # 匯總各worker在本次運行期間的調用計數器；隊列模式沒有單次調用的延遲分佈
+        run_metrics = st.session_state.get('run_metrics') or MetricsRegistry(parent=DEFAULT_REGISTRY)
+        run_metrics.merge_counters({
+            key: value - counters_before.get(key, 0.0) for key, value in queue.job_metrics(job_id).items()
+        })
+    finally:
+        queue.close()
+    st.session_state.pipeline_stats = {'chunks_deduplicated': skipped, 'budget_skipped': budget_skipped}
+    st.session_state.dead_letters = failures
+    st.session_state.metrics_summary = run_metrics.summary()
+    status_text.text(f"✅ 完成！共生成 {len(final_qa_pairs)} 個QA對")
+    return final_qa_pairs
 
 def generate_qa_pairs_with_progress(text_chunks):
     """生成問答對並顯示進度"""
-    raw_qa_responses = []
+    if st.session_state.get('use_queue'):
+        return generate_qa_pairs_via_queue(text_chunks)
+    engine = get_engine()
     progress_bar = st.progress(0)
     status_text = st.empty()
+    status_text.text("生成並結構化QA對...")
     
-    # 第一階段：生成原始QA對
-    status_text.text("第一階段：生成原始QA對...")
-    for i, chunk in enumerate(text_chunks):
-        # 使用自定義的QA生成prompt
-        qa_prompt = st.session_state.get('qa_generation_prompt', get_default_qa_prompt())
-        prompt = qa_prompt.format(text_content=chunk.page_content)
-        
-        response = get_completion(prompt)
-        if response:
-            raw_qa_responses.append({
-                "raw_response": response,
-                "source_chunk": chunk.page_content
-            })
-        
-        progress = (i + 1) / (len(text_chunks) * 2)  # 總進度的一半
-        progress_bar.progress(progress)
+    preview = st.empty()
+    live_qa_pairs = {}
+    last_preview = {"time": 0.0}
     
-    # 第二階段：將原始響應轉換為結構化JSON
-    status_text.text("第二階段：處理並結構化QA對...")
-    final_qa_pairs = []
-    
-    for i, qa_response in enumerate(raw_qa_responses):
-        structured_qa_pairs = process_raw_qa_to_json(qa_response["raw_response"], qa_response["source_chunk"])
-        final_qa_pairs.extend(structured_qa_pairs)
-        
-        progress = 0.5 + ((i + 1) / len(raw_qa_responses)) * 0.5  # 後半段進度
-        progress_bar.progress(progress)
+    def update_progress(stage1_done, stage2_done, total):
+        progress_bar.progress((stage1_done + stage2_done) / (total * 2))
+        status_text.text(f"第一階段：{stage1_done}/{total} ｜ 第二階段：{stage2_done}/{total}")
     
-    status_text.text(f"✅ 完成！共生成 {len(final_qa_pairs)} 個QA對")
-    return final_qa_pairs
-
-def process_raw_qa_to_json(raw_response, source_chunk):
-    """直接使用OpenAI API將原始QA響應轉換為結構化的JSON格式"""
-    global client
+    def update_preview(index, qa_pairs):
+        # 按文本段保存最新結果（最近更新的排在最後），每0.5秒最多刷新一次預覽
+        live_qa_pairs.pop(index, None)
+        live_qa_pairs[index] = qa_pairs
+        now = time.monotonic()
+        if now - last_preview["time"] < 0.5:
+            return
+        last_preview["time"] = now
+        count = sum(len(pairs) for pairs in live_qa_pairs.values())
+        latest = [qa for pairs in list(live_qa_pairs.values())[-3:] for qa in pairs][-5:]
+        preview.markdown(
+            f"**已生成 {count} 個QA對（預覽最新 {len(latest)} 個）**\n\n"
+            + "\n".join(f"- ❓ {qa['question']}\n  ✅ {qa['answer']}" for qa in latest)
+        )
     
-    # 如果客戶端未初始化，嘗試初始化
-    if client is None:
-        if not init_openai_client():
-            return []
+    final_qa_pairs = engine.generate_qa_pairs(text_chunks, update_progress, update_preview)
+    preview.empty()
+    stats = engine.last_stats
+    st.session_state.pipeline_stats = stats
+    st.session_state.dead_letters = engine.dead_letters
+    st.session_state.metrics_summary = engine.metrics.summary()
+    if stats.get('resumed'):
+        st.info(f"♻️ 從檢查點恢復：{stats['resumed']}/{len(text_chunks)} 個文本段已完成，已跳過")
     
-    try:
-        # 使用自定義的JSON轉換system prompt
-        json_system_prompt = st.session_state.get('json_system_prompt', get_default_json_system_prompt())
-        
-        # 使用用戶設定的參數，JSON轉換可以使用獨立的模型
-        model = st.session_state.get('json_model_name', st.session_state.get('model_name', 'gpt-4.1-nano'))
-        temperature = st.session_state.get('json_temperature', 0.1)
-        max_tokens = st.session_state.get('max_tokens', 4096)
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": json_system_prompt
-                },
-                {
-                    "role": "user", 
-                    "content": f"INPUT TEXT:\n{raw_response}\n\nJSON OUTPUT:"
-                }
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=1
-        )
-        
-        json_response = response.choices[0].message.content.strip()
-        
-        # 直接解析JSON，不做額外處理
-        start_bracket = json_response.find('[')
-        end_bracket = json_response.rfind(']')
-        
-        if start_bracket != -1 and end_bracket != -1:
-            json_response = json_response[start_bracket:end_bracket + 1]
-            qa_list = json.loads(json_response)
-            
-            # 添加source_chunk到每個QA對
-            for qa in qa_list:
-                if isinstance(qa, dict) and 'question' in qa and 'answer' in qa:
-                    qa["source_chunk"] = source_chunk
-            
-            return qa_list
-        else:
-            st.error("LLM未返回有效的JSON格式")
-            return []
-            
-    except Exception as e:
-        st.error(f"API調用失敗: {e}")
-        return []
-
+    status_text.text(
+        f"✅ 完成！共生成 {len(final_qa_pairs)} 個QA對"
+        f"（本地解析節省 {stats['local_parsed']} 次JSON轉換調用）"
+    )
+    return final_qa_pairs
 
+def set_qa_pairs(qa_pairs):
+    """更新QA對，同時重建統計並使已緩存的導出內容失效"""
+    st.session_state.qa_pairs = qa_pairs
+    st.session_state.qa_stats = QAPairStats(qa_pairs)
+    st.session_state.export_cache = {}
 
-def load_single_document(file_path: str) -> List[Document]:
-    """載入單個文檔"""
-    ext = "." + file_path.rsplit(".", 1)[-1]
-    if ext in LOADER_MAPPING:
-        loader_class, loader_args = LOADER_MAPPING[ext]
-        loader = loader_class(file_path, **loader_args)
-        return loader.load()
-    raise ValueError(f"Unsupported file extension '{ext}'")
+def get_qa_stats():
+    if 'qa_stats' not in st.session_state:
+        st.session_state.qa_stats = QAPairStats(st.session_state.get('qa_pairs', []))
+    return st.session_state.qa_stats
 
-def process_files(uploaded_files):
-    """處理上傳的多個文件並生成文本塊"""
-    all_text_chunks = []
-    for uploaded_file in uploaded_files:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
-        try:
-            documents = load_single_document(tmp_file_path)
-            if not documents:
-                st.error(f"文件 {uploaded_file.name} 處理失敗，請檢查文件格式是否正確。")
-                continue
+def get_export_payload(key, build):
+    """首次需要時才生成導出內容，QA對更新前重繪界面直接重用
 
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=500)
-            text_chunks = text_splitter.split_documents(documents)
-            all_text_chunks.extend(text_chunks)
-        except Exception as e:
-            st.error(f"處理文件 {uploaded_file.name} 時發生錯誤: {e}")
-        finally:
-            os.unlink(tmp_file_path)
-    
-    return all_text_chunks
+    key 為 (導出格式, 參數)，每種格式只保留最近一組參數的內容，修改系統提示詞不會累積多份導出內容。
+    """
+    export_cache = st.session_state.setdefault('export_cache', {})
+    kind, variant = key
+    cached = export_cache.get(kind)
+    if cached is None or cached[0] != variant:
+        cached = export_cache[kind] = (variant, build())
+    return cached[1]
 
 def download_qa_pairs_as_json(qa_pairs, filename="qa_pairs.json"):
     """下載QA對為標準JSON文件"""
     if qa_pairs:
-        json_data = {
-            "qa_pairs": qa_pairs,
-            "total_count": len(qa_pairs),
-            "generated_timestamp": st.session_state.get('generation_timestamp', '')
-        }
-        
-        # 格式化JSON數據以提高可讀性
-        json_str = json.dumps(json_data, ensure_ascii=False, indent=4)
+        generated_timestamp = st.session_state.get('generation_timestamp', '')
+        json_str = get_export_payload(
+            ("json", generated_timestamp),
+            lambda: build_json_export(qa_pairs, generated_timestamp),
+        )
         
         # 創建下載按鈕
         st.download_button(
@@ -318,19 +258,7 @@ def download_qa_pairs_as_json(qa_pairs, filename="qa_pairs.json"):
 def download_qa_pairs_as_sft_format(qa_pairs, system_prompt="你是一個有用的AI助手。", filename="sft_qa_pairs.json"):
     """下載QA對為SFTTrainer格式的JSON文件"""
     if qa_pairs:
-        sft_data = []
-        for qa in qa_pairs:
-            sft_entry = {
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": qa.get('question', '')},
-                    {"role": "assistant", "content": qa.get('answer', '')}
-                ]
-            }
-            sft_data.append(sft_entry)
-        
-        # 格式化JSON數據
-        json_str = json.dumps(sft_data, ensure_ascii=False, indent=2)
+        json_str = get_export_payload(("sft", system_prompt), lambda: build_sft_export(qa_pairs, system_prompt))
         
         # 創建下載按鈕
         st.download_button(
@@ -340,6 +268,28 @@ def download_qa_pairs_as_sft_format(qa_pairs, system_prompt="你是一個有用
             mime="application/json"
         )
 
+def build_sft_jsonl_bytes(qa_pairs, system_prompt, filename):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, filename)
+        export_sft_jsonl(qa_pairs, path, system_prompt)
+        with open(path, "rb") as f:
+            return f.read()
+
+def download_qa_pairs_as_sft_jsonl(qa_pairs, system_prompt="你是一個有用的AI助手。", filename="sft_qa_pairs.jsonl"):
+    """下載QA對為SFTTrainer格式的JSONL文件（逐行寫出，可直接用datasets載入）"""
+    if qa_pairs:
+        data = get_export_payload(
+            ("sft-jsonl", system_prompt),
+            lambda: build_sft_jsonl_bytes(qa_pairs, system_prompt, filename),
+        )
+
+        st.download_button(
+            label="下載SFTTrainer格式JSONL文件",
+            data=data,
+            file_name=filename,
+            mime="application/jsonl"
+        )
+
 def main():
     """主函數，設置Streamlit界面"""
     st.set_page_config(page_title="QA對生成器", layout="wide")
@@ -365,34 +315,151 @@ def main():
             for file in uploaded_files:
                 st.write(f"📄 {file.name} ({file.size} bytes)")
         
+        if st.button("📋 預估用量和成本（不調用API）"):
+            with st.spinner("正在處理文件..."):
+                text_chunks = process_files(uploaded_files)
+            if not text_chunks:
+                st.error("文件處理失敗，請檢查文件格式是否正確。")
+                return
+            show_job_plan(text_chunks)
+        
         if st.button("🚀 開始處理文件並生成QA對", type="primary"):
             # 檢查API設定
             if not st.session_state.get('api_key'):
                 st.error("❌ 請先在側邊欄設定API Key")
                 return
             
-            # 初始化OpenAI客戶端
-            if not init_openai_client():
-                st.error("❌ API初始化失敗，請檢查設定")
-                return
-            
-            # 處理文件
-            with st.spinner("正在處理文件..."):
-                text_chunks = process_files(uploaded_files)
-                if not text_chunks:
-                    st.error("文件處理失敗，請檢查文件格式是否正確。")
-                    return
-                st.info(f"✅ 文件已分割成 {len(text_chunks)} 個文本段")
+            if st.session_state.get('streaming_ingest'):
+                # 流式載入：文件邊載入邊生成
+                st.session_state.generation_timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+                qa_pairs, chunk_count = generate_qa_pairs_streaming(uploaded_files)
+                set_qa_pairs(qa_pairs)
+                with st.expander("查看文件處理耗時", expanded=False):
+                    st.dataframe(st.session_state.ingestion_timings)
+            else:
+                # 處理文件
+                with st.spinner("正在處理文件..."):
+                    text_chunks = process_files(uploaded_files)
+                    if not text_chunks:
+                        st.error("文件處理失敗，請檢查文件格式是否正確。")
+                        return
+                    token_stats = st.session_state.chunk_token_stats
+                    st.info(
+                        f"✅ 文件已分割成 {len(text_chunks)} 個文本段，共 {token_stats['chunk_tokens']} tokens，"
+                        f"其中重疊部分 {token_stats['overlap_tokens']} tokens"
+                    )
+                    with st.expander("查看文件處理耗時", expanded=False):
+                        st.dataframe(st.session_state.ingestion_timings)
+                show_job_plan(text_chunks)
 
-            # 生成QA對
-            import time
-            st.session_state.generation_timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            st.session_state.qa_pairs = generate_qa_pairs_with_progress(text_chunks)
+                # 生成QA對
+                st.session_state.generation_timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+                set_qa_pairs(generate_qa_pairs_with_progress(text_chunks))
+                chunk_count = len(text_chunks)
             if st.session_state.qa_pairs:
                 st.success(f"🎉 生成完成！共產生 {len(st.session_state.qa_pairs)} 個獨立的QA對")
-                st.info(f"💡 每個文本段平均產生 {len(st.session_state.qa_pairs)/len(text_chunks):.1f} 個QA對")
+                st.info(f"💡 每個文本段平均產生 {len(st.session_state.qa_pairs)/max(chunk_count, 1):.1f} 個QA對")
+                pipeline_stats = st.session_state.get('pipeline_stats', {})
+                if pipeline_stats.get('local_parsed'):
+                    st.info(
+                        f"⚡ 本地解析 {pipeline_stats['local_parsed']} 個響應，"
+                        f"節省 {pipeline_stats['local_parsed']} 次JSON轉換API調用；"
+                        f"{pipeline_stats.get('llm_converted', 0)} 個響應使用LLM轉換"
+                    )
+                if pipeline_stats.get('chunks_deduplicated') or pipeline_stats.get('qa_pairs_deduplicated'):
+                    st.info(
+                        f"🧹 去重：跳過 {pipeline_stats.get('chunks_deduplicated', 0)} 個近似重複文本段"
+                        f"（節省約 {pipeline_stats.get('chunks_deduplicated', 0) * 2} 次API調用），"
+                        f"合併 {pipeline_stats.get('qa_pairs_deduplicated', 0)} 個近似重複QA對"
+                    )
+                if 'grounding_dropped' in pipeline_stats or 'grounding_flagged' in pipeline_stats:
+                    if 'grounding_dropped' in pipeline_stats:
+                        grounding_note = f"丟棄 {pipeline_stats['grounding_dropped']} 個"
+                    else:
+                        grounding_note = f"標記 {pipeline_stats['grounding_flagged']} 個（grounded 為 false）"
+                    st.info(f"🔎 依據檢查：{grounding_note}答案與來源文本段重合度低於閾值的QA對")
+                if pipeline_stats.get('budget_skipped'):
+                    st.warning(
+                        f"💰 已達預算上限，跳過 {pipeline_stats['budget_skipped']} 個請求；"
+                        "提高預算後重新運行即可繼續生成這些文本段"
+                    )
+                if pipeline_stats.get('retries'):
+                    st.info(
+                        f"🔁 重試 {pipeline_stats['retries']} 次，其中限流 {pipeline_stats.get('rate_limited', 0)} 次"
+                    )
+                if pipeline_stats.get('packed_requests'):
+                    st.info(
+                        f"📦 {pipeline_stats['packed_chunks']} 個短文本段合併為 {pipeline_stats['packed_requests']} 個請求"
+                        f"（{pipeline_stats.get('pack_fallbacks', 0)} 個文本段改為單獨請求）"
+                    )
+                if 'cache_hits' in pipeline_stats:
+                    st.info(
+                        f"🗄️ 緩存命中 {pipeline_stats['cache_hits']} 次，"
+                        f"未命中 {pipeline_stats['cache_misses']} 次"
+                    )
+                if 'incremental_reused' in pipeline_stats:
+                    st.info(
+                        f"♻️ 增量處理：復用 {pipeline_stats['incremental_reused']} 個未變更文本段的QA對，"
+                        f"重新生成 {pipeline_stats['incremental_generated']} 個新增或修改的文本段，"
+                        f"{st.session_state.get('removed_chunks', 0)} 個文本段已從修改後的文件中移除"
+                    )
+                if pipeline_stats.get('endpoints'):
+                    st.info("🌐 端點分配：" + "，".join(
+                        f"{name} {item['requests']} 次請求（失敗 {item['errors']} 次{'' if item['healthy'] else '，已暫停'}）"
+                        for name, item in pipeline_stats['endpoints'].items()
+                    ))
             else:
                 st.error("❌ 未能生成任何QA對，請檢查文件內容或API配置")
+            
+            metrics_summary = st.session_state.get('metrics_summary')
+            if metrics_summary:
+                with st.expander("📈 調用指標", expanded=False):
+                    tokens = metrics_summary['tokens']
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("提示詞Token", tokens.get('prompt', 0))
+                    col2.metric(
+                        "其中緩存命中", tokens.get('cached', 0),
+                        help=f"提示詞緩存命中率 {metrics_summary['prompt_cache_ratio']:.1%}"
+                    )
+                    col3.metric("輸出Token", tokens.get('completion', 0))
+                    col4.metric("估算成本(USD)", f"{metrics_summary['estimated_cost_usd']:.4f}")
+                    st.dataframe([
+                        {"階段": stage, "調用": item["calls"], "失敗": item["errors"],
+                         "平均延遲(秒)": item.get("latency_mean"), "p50": item.get("latency_p50"),
+                         "p95": item.get("latency_p95"), "p99": item.get("latency_p99")}
+                        for stage, item in metrics_summary['calls'].items()
+                    ])
+                    st.write(f"finish_reason：{metrics_summary['finish_reasons']} ｜ 重試：{metrics_summary['retries']} 次")
+                    st.write(f"各階段耗時(秒)：{metrics_summary['stage_seconds']}")
+                    st.download_button(
+                        label="下載運行摘要",
+                        data=json.dumps(
+                            {
+                                "generated_timestamp": st.session_state.get('generation_timestamp', ''),
+                                "stats": st.session_state.get('pipeline_stats', {}),
+                                "metrics": metrics_summary,
+                            },
+                            ensure_ascii=False,
+                            indent=2,
+                        ),
+                        file_name="run_summary.json",
+                        mime="application/json"
+                    )
+            
+            dead_letters = st.session_state.get('dead_letters', [])
+            if dead_letters:
+                st.warning(f"⚠️ {len(dead_letters)} 個請求在重試後仍失敗，相關文本段未產生QA對")
+                with st.expander("查看失敗的文本段", expanded=False):
+                    st.dataframe([
+                        {"文本段": ", ".join(map(str, failure_context_indices(item))), "階段": item["stage"], "錯誤": item["error"]}
+                        for item in dead_letters
+                    ])
+                    st.download_button(
+                        label="下載失敗記錄",
+                        data="\n".join(json.dumps(item, ensure_ascii=False) for item in dead_letters),
+                        file_name="dead_letters.jsonl",
+                        mime="application/json"
+                    )
 
     # 顯示生成的QA對
     if hasattr(st.session_state, 'qa_pairs') and st.session_state.qa_pairs:
@@ -407,9 +474,7 @@ def main():
             if 'generation_timestamp' in st.session_state:
                 st.metric("生成時間", st.session_state.generation_timestamp)
         with col3:
-            # 計算來源文件數量
-            unique_sources = len(set(qa.get('source_chunk', '')[:100] for qa in st.session_state.qa_pairs))
-            st.metric("文本段數量", unique_sources)
+            st.metric("文本段數量", get_qa_stats().unique_sources)
         with col4:
             st.metric("下載選項", "多種格式")
         
@@ -435,11 +500,16 @@ def main():
                 st.session_state.qa_pairs, 
                 system_prompt=st.session_state.get('sft_system_prompt', '你是一個有用的AI助手。')
             )
+            download_qa_pairs_as_sft_jsonl(
+                st.session_state.qa_pairs,
+                system_prompt=st.session_state.get('sft_system_prompt', '你是一個有用的AI助手。')
+            )
         
         with col3:
             st.markdown("**格式說明：**")
             st.markdown("• 標準JSON：原始QA對格式")
             st.markdown("• SFT格式：適用於模型微調")
+            st.markdown("• JSONL：每行一條記錄，適合大數據集")
         
         # QA對預覽
         st.markdown("#### 🔍 QA對預覽")
@@ -464,6 +534,9 @@ def main():
                 st.markdown(qa['question'])
                 st.markdown("**✅ 答案:**")
                 st.markdown(qa['answer'])
+                if qa.get('grounding_score') is not None:
+                    warning = "" if qa.get('grounded', True) else " ⚠️ 低於閾值"
+                    st.caption(f"🔎 依據分數：{qa['grounding_score']:.2f}{warning}")
                 if 'source_chunk' in qa:
                     st.markdown("**📄 來源文本:**")
                     st.text_area(
@@ -496,6 +569,21 @@ def main():
                 help="API的基礎URL，默認為OpenAI官方"
             )
             
+            # 多端點設定
+            endpoints_text = st.text_area(
+                "API端點列表（可選）",
+                value=st.session_state.get('endpoints_text', ''),
+                height=80,
+                placeholder="http://gpu1:8000/v1,EMPTY,2\nhttp://gpu2:8000/v1,EMPTY,1",
+                help="每行一個 URL[,API Key[,權重]]。設定後請求按權重和負載在這些端點間分配並自動故障切換，"
+                     "取代上面的Base URL；未填API Key的端點使用上面的API Key"
+            )
+            try:
+                endpoints = parse_endpoint_lines(endpoints_text)
+            except ValueError:
+                st.error("❌ 端點格式錯誤，權重必須是數字")
+                endpoints = st.session_state.get('endpoints', [])
+            
             # 模型設定
             model_name = st.text_input(
                 "QA生成模型名稱",
@@ -541,35 +629,98 @@ def main():
                 help="每次API調用的最大token數"
             )
             
+            col3, col4 = st.columns(2)
+            with col3:
+                concurrency = st.number_input(
+                    "QA生成並發數",
+                    min_value=1,
+                    max_value=256,
+                    value=st.session_state.get('concurrency', 8),
+                    step=1,
+                    help="第一階段同時進行的API請求數量上限"
+                )
+            
+            with col4:
+                json_concurrency = st.number_input(
+                    "JSON轉換並發數",
+                    min_value=1,
+                    max_value=256,
+                    value=st.session_state.get('json_concurrency', 8),
+                    step=1,
+                    help="第二階段同時進行的API請求數量上限"
+                )
+            
+            col5, col6, col7 = st.columns(3)
+            with col5:
+                rpm_limit = st.number_input(
+                    "RPM上限",
+                    min_value=0,
+                    max_value=1000000,
+                    value=st.session_state.get('rpm_limit', 0),
+                    step=10,
+                    help="每分鐘請求數上限，0表示不限制"
+                )
+            
+            with col6:
+                tpm_limit = st.number_input(
+                    "TPM上限",
+                    min_value=0,
+                    max_value=100000000,
+                    value=st.session_state.get('tpm_limit', 0),
+                    step=10000,
+                    help="每分鐘token數上限，0表示不限制"
+                )
+            
+            with col7:
+                max_retries = st.number_input(
+                    "最大重試次數",
+                    min_value=0,
+                    max_value=20,
+                    value=st.session_state.get('max_retries', 5),
+                    step=1,
+                    help="限流、超時和服務端錯誤的最大重試次數"
+                )
+            
+            use_local_parser = st.checkbox(
+                "本地解析Q/A格式",
+                value=st.session_state.get('use_local_parser', True),
+                help="格式良好的Q:/A:響應直接在本地解析，跳過JSON轉換調用；含前言、附言等問答以外的文字或無法解析時回退到LLM轉換"
+            )
+            
             # 保存設定按鈕
             if st.button("💾 保存API設定", key="save_api_settings"):
                 st.session_state.api_key = api_key
                 st.session_state.base_url = base_url
+                st.session_state.endpoints_text = endpoints_text
+                st.session_state.endpoints = endpoints
                 st.session_state.model_name = model_name
                 st.session_state.json_model_name = json_model_name if json_model_name else model_name
                 st.session_state.temperature = temperature
                 st.session_state.json_temperature = json_temperature
                 st.session_state.max_tokens = max_tokens
+                st.session_state.concurrency = concurrency
+                st.session_state.json_concurrency = json_concurrency
+                st.session_state.use_local_parser = use_local_parser
+                st.session_state.rpm_limit = rpm_limit
+                st.session_state.tpm_limit = tpm_limit
+                st.session_state.max_retries = max_retries
                 
-                # 重新初始化客戶端
-                global client
-                client = None
-                if init_openai_client():
-                    st.success("✅ API設定已保存並測試成功")
+                if api_key:
+                    st.success("✅ API設定已保存")
                 else:
-                    st.error("❌ API設定保存失敗，請檢查設定")
+                    st.error("❌ API設定保存失敗，請先輸入API Key")
             
             # 測試連接按鈕
             if st.button("🔌 測試API連接", key="test_api_connection"):
                 if api_key:
                     # 測試QA生成模型
-                    test_result_qa = test_api_connection(api_key, base_url, model_name)
+                    test_result_qa = test_api_connection(api_key, base_url, model_name, endpoints)
                     if test_result_qa:
                         st.success("✅ QA生成模型連接測試成功")
                         
                         # 如果設定了不同的JSON轉換模型，也進行測試
                         if json_model_name and json_model_name != model_name:
-                            test_result_json = test_api_connection(api_key, base_url, json_model_name)
+                            test_result_json = test_api_connection(api_key, base_url, json_model_name, endpoints)
                             if test_result_json:
                                 st.success("✅ JSON轉換模型連接測試成功")
                             else:
@@ -579,6 +730,198 @@ def main():
                 else:
                     st.warning("⚠️ 請先輸入API Key")
         
+        st.markdown("---")
+        st.markdown("### ⚡ 處理與緩存設定")
+        
+        with st.expander("🔧 緩存、檢查點與文件處理", expanded=False):
+            st.session_state.use_cache = st.checkbox(
+                "使用本地響應緩存",
+                value=st.session_state.get('use_cache', True),
+                help="相同模型、消息和參數的請求直接從本地緩存返回"
+            )
+            st.session_state.cache_bypass = st.checkbox(
+                "繞過緩存",
+                value=st.session_state.get('cache_bypass', False),
+                help="忽略已有緩存強制重新請求，並以新結果刷新緩存"
+            )
+            st.session_state.cache_max_entries = st.number_input(
+                "最大緩存條數",
+                min_value=100,
+                max_value=10000000,
+                value=st.session_state.get('cache_max_entries', 100000),
+                step=1000
+            )
+            st.session_state.cache_max_age_days = st.number_input(
+                "緩存保留天數",
+                min_value=1,
+                max_value=3650,
+                value=st.session_state.get('cache_max_age_days', 30),
+                step=1
+            )
+            
+            cache = get_engine().get_cache()
+            if cache is not None:
+                cache_stats = cache.stats()
+                st.write(f"📦 緩存條數: **{cache_stats['entries']}**")
+                if st.button("🗑️ 清空緩存", key="clear_cache"):
+                    cache.clear()
+                    st.success("✅ 緩存已清空")
+            
+            st.session_state.use_journal = st.checkbox(
+                "啟用任務檢查點",
+                value=st.session_state.get('use_journal', True),
+                help="逐段記錄生成結果到磁盤，相同文件和設定重新運行時跳過已完成的文本段"
+            )
+            st.session_state.incremental = st.checkbox(
+                "增量處理",
+                value=st.session_state.get('incremental', False),
+                help="按內容哈希保存每個文件和文本段的結果：重新上傳修改過的文件時，只為新增或修改的文本段調用API，"
+                     "其餘直接復用；已刪除內容的QA對不會出現在結果中"
+            )
+            st.session_state.streaming_ingest = st.checkbox(
+                "流式載入",
+                value=st.session_state.get('streaming_ingest', False),
+                help="逐頁/逐行載入文件並立即送入生成流程，無需等待全部文件分割完成，適合超大文件"
+                     "（不支持任務檢查點、增量處理、合併短文本段、批量模式和任務隊列）"
+            )
+            st.session_state.use_queue = st.checkbox(
+                "任務隊列模式",
+                value=st.session_state.get('use_queue', False),
+                help="將文本段寫入持久化任務隊列，由多個worker進程處理；其他機器可運行 queue_worker.py 共享同一隊列文件，"
+                     "worker崩潰後其任務會在租約過期後被重新處理"
+            )
+            st.session_state.queue_path = st.text_input(
+                "隊列文件路徑",
+                value=st.session_state.get('queue_path', DEFAULT_QUEUE_PATH),
+                disabled=not st.session_state.use_queue
+            )
+            st.session_state.queue_workers = st.number_input(
+                "本機worker進程數",
+                min_value=0,
+                max_value=64,
+                value=st.session_state.get('queue_workers', 2),
+                step=1,
+                disabled=not st.session_state.use_queue,
+                help=f"0表示只等待其他機器上的worker；{WORKER_ACTIVE_SECONDS:.0f} 秒內沒有活躍worker時停止等待"
+            )
+            st.session_state.chunk_tokens = st.number_input(
+                "文本段Token預算",
+                min_value=100,
+                max_value=100000,
+                value=st.session_state.get('chunk_tokens', 1500),
+                step=100,
+                help="每個文本段的最大token數，會自動限制在模型上下文窗口內"
+            )
+            st.session_state.chunk_overlap_tokens = st.number_input(
+                "文本段重疊Token數",
+                min_value=0,
+                max_value=10000,
+                value=st.session_state.get('chunk_overlap_tokens', 100),
+                step=50,
+                help="相鄰文本段之間重疊的token數，重疊部分會被重複發送"
+            )
+            st.session_state.stream_responses = st.checkbox(
+                "流式輸出",
+                value=st.session_state.get('stream_responses', False),
+                help="以流式方式接收第一階段響應，每個問答對生成後立即解析並顯示在預覽中（批量模式和合併請求除外）"
+            )
+            st.session_state.cache_friendly_prompts = st.checkbox(
+                "提示詞緩存友好佈局",
+                value=st.session_state.get('cache_friendly_prompts', False),
+                help="將QA生成提示詞作為固定的系統消息、文本段作為用戶消息發送，所有請求共享相同前綴，"
+                     "可被OpenAI自動提示詞緩存或vLLM前綴緩存複用，降低延遲和成本"
+            )
+            st.session_state.pack_chunks = st.checkbox(
+                "合併短文本段",
+                value=st.session_state.get('pack_chunks', False),
+                help="將多個短文本段（如CSV行、郵件、幻燈片）按Token預算合併為一個請求，結果按分節拆回各文本段"
+            )
+            st.session_state.pack_max_chunks = st.number_input(
+                "每個請求最多合併文本段數",
+                min_value=2,
+                max_value=32,
+                value=st.session_state.get('pack_max_chunks', 8),
+                step=1,
+                disabled=not st.session_state.pack_chunks
+            )
+            st.session_state.chunk_dedup = st.checkbox(
+                "文本段去重",
+                value=st.session_state.get('chunk_dedup', True),
+                help="調用API前剔除近似重複的文本段（如重複的頁眉、法律聲明）"
+            )
+            st.session_state.qa_dedup = st.checkbox(
+                "QA對去重",
+                value=st.session_state.get('qa_dedup', True),
+                help="合併問題和答案都近似重複的QA對，同一問題的不同答案會保留"
+            )
+            st.session_state.dedup_threshold = st.slider(
+                "去重相似度閾值",
+                min_value=0.5,
+                max_value=1.0,
+                value=st.session_state.get('dedup_threshold', 0.85),
+                step=0.05,
+                help="估計的Jaccard相似度達到此值即視為重複"
+            )
+            st.session_state.grounding_check = st.checkbox(
+                "依據檢查",
+                value=st.session_state.get('grounding_check', False),
+                help="按答案與來源文本段的字符n-gram重合度為每個QA對打分（grounding_score），不額外調用API"
+            )
+            st.session_state.grounding_threshold = st.slider(
+                "依據分數閾值",
+                min_value=0.0,
+                max_value=1.0,
+                value=st.session_state.get('grounding_threshold', 0.3),
+                step=0.05,
+                disabled=not st.session_state.grounding_check,
+                help="答案中出現在來源文本段裡的n-gram比例低於此值時視為無依據"
+            )
+            grounding_modes = {"drop": "丟棄", "flag": "保留並標記"}
+            st.session_state.grounding_mode = st.radio(
+                "無依據的QA對",
+                options=list(grounding_modes),
+                format_func=grounding_modes.get,
+                index=list(grounding_modes).index(st.session_state.get('grounding_mode', 'drop')),
+                horizontal=True,
+                disabled=not st.session_state.grounding_check
+            )
+            st.session_state.ingest_workers = st.number_input(
+                "文件載入進程數",
+                min_value=0,
+                max_value=64,
+                value=st.session_state.get('ingest_workers', 0),
+                step=1,
+                help="並行載入和分割文件的進程數，0表示使用全部CPU核心"
+            )
+            st.session_state.budget_usd = st.number_input(
+                "成本上限（美元）",
+                min_value=0.0,
+                value=float(st.session_state.get('budget_usd', 0.0)),
+                step=1.0,
+                help="本次運行的估算成本達到此值後不再發送新請求，0表示不限制"
+            )
+            st.session_state.budget_tokens = st.number_input(
+                "Token用量上限",
+                min_value=0,
+                value=int(st.session_state.get('budget_tokens', 0)),
+                step=100000,
+                help="本次運行的提示詞加輸出token達到此值後不再發送新請求，0表示不限制"
+            )
+            st.session_state.metrics_port = st.number_input(
+                "指標端點端口",
+                min_value=0,
+                max_value=65535,
+                value=st.session_state.get('metrics_port', 0),
+                step=1,
+                help="大於0時在此端口提供OpenMetrics格式的 /metrics 端點，供Prometheus抓取"
+            )
+            if st.session_state.metrics_port:
+                try:
+                    start_metrics_endpoint(int(st.session_state.metrics_port))
+                    st.caption(f"指標端點：http://localhost:{int(st.session_state.metrics_port)}/metrics")
+                except OSError as e:
+                    st.warning(f"無法啟動指標端點: {e}")
+        
         st.markdown("---")
         st.markdown("### ⚙️ 提示詞設定")
         
@@ -671,19 +1014,7 @@ def main():
                 st.write(f"⏰ 生成時間: **{st.session_state.generation_timestamp}**")
             
             # 統計問題類型
-            question_types = {}
-            for qa in st.session_state.qa_pairs:
-                question = qa.get('question', '').strip()
-                if question.startswith('什麼'):
-                    question_types['什麼'] = question_types.get('什麼', 0) + 1
-                elif question.startswith('如何') or question.startswith('怎樣'):
-                    question_types['如何/怎樣'] = question_types.get('如何/怎樣', 0) + 1
-                elif question.startswith('為什麼'):
-                    question_types['為什麼'] = question_types.get('為什麼', 0) + 1
-                elif '？' in question:
-                    question_types['其他問句'] = question_types.get('其他問句', 0) + 1
-                else:
-                    question_types['陳述式'] = question_types.get('陳述式', 0) + 1
+            question_types = get_qa_stats().question_types
             
             if question_types:
                 st.markdown("**❓ 問題類型分布:**")
@@ -692,7 +1023,8 @@ def main():
                 
                 st.markdown("**🔄 處理說明:**")
                 st.write("- 直接使用OpenAI API處理")
-                st.write("- LLM自動分離合併問題")
+                st.write("- 格式良好的Q/A響應在本地解析，其餘由LLM轉換")
+                st.write("- 自動分離合併問題")
                 st.write("- 純JSON格式輸出")
                 
                 st.markdown("**⚙️ 當前設定:**")
@@ -702,6 +1034,8 @@ def main():
                 st.write(f"- QA溫度: {st.session_state.get('temperature', 0.1)}")
                 st.write(f"- JSON溫度: {st.session_state.get('json_temperature', 0.1)}")
                 st.write(f"- 最大Token: {st.session_state.get('max_tokens', 4096)}")
+                st.write(f"- QA生成並發數: {st.session_state.get('concurrency', 8)}")
+                st.write(f"- JSON轉換並發數: {st.session_state.get('json_concurrency', 8)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
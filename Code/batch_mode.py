@@ -0,0 +1,136 @@
+"""OpenAI Batch API 模式
+
+把一個階段的全部請求寫成JSONL文件上傳，創建批量任務並輪詢，完成後按 custom_id
+取回每個文本段的結果。適合不要求實時返回的大批量任務，成本和限流壓力都低於逐條調用。
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Batch API 單個輸入文件最多50000個請求
+MAX_BATCH_REQUESTS = 50000
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def make_custom_id(stage, index):
+    return f"stage{stage}-chunk-{index}"
+
+
+def parse_custom_id(custom_id):
+    """從 custom_id 取回文本段序號"""
+    return int(custom_id.rsplit("-", 1)[1])
+
+
+def build_batch_line(custom_id, messages, params):
+    return json.dumps(
+        {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": {"messages": messages, **params}},
+        ensure_ascii=False,
+    )
+
+
+def parse_batch_output_line(line):
+    """解析輸出文件中的一行，返回 (custom_id, 響應內容, 錯誤信息, 響應體)"""
+    item = json.loads(line)
+    custom_id = item.get("custom_id")
+    if item.get("error"):
+        return custom_id, None, item["error"].get("message", str(item["error"])), None
+    response = item.get("response") or {}
+    body = response.get("body") or {}
+    if response.get("status_code") != 200:
+        error = body.get("error") or {}
+        return custom_id, None, error.get("message", f"HTTP {response.get('status_code')}"), body
+    try:
+        return custom_id, body["choices"][0]["message"]["content"], None, body
+    except (KeyError, IndexError, TypeError):
+        return custom_id, None, "響應中沒有內容", body
+
+
+def processed_count(batch):
+    """批量任務中已處理（成功或失敗）的請求數"""
+    counts = batch.request_counts
+    return counts.completed + counts.failed if counts is not None else 0
+
+
+class BatchJobRunner:
+    """提交並等待一個階段的批量請求，結果以 custom_id 為鍵返回"""
+
+    def __init__(self, client, poll_interval=30.0, completion_window="24h", on_poll=None, on_response=None):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.on_poll = on_poll
+        # 每個返回的響應體都會傳給 on_response(custom_id, 響應體, 錯誤信息)，用於記錄用量
+        self.on_response = on_response
+        self.batch_ids = []
+
+    def submit(self, requests, metadata=None):
+        """逐行寫出臨時JSONL文件並上傳，返回批量任務ID"""
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", encoding="utf-8", delete=False) as f:
+            for custom_id, messages, params in requests:
+                f.write(build_batch_line(custom_id, messages, params) + "\n")
+            path = f.name
+        try:
+            with open(path, "rb") as f:
+                input_file = self.client.files.create(file=f, purpose="batch")
+        finally:
+            os.unlink(path)
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+            metadata=metadata,
+        )
+        self.batch_ids.append(batch.id)
+        logger.info("已提交批量任務 %s（%d 個請求）", batch.id, len(requests))
+        return batch.id
+
+    def wait(self, batch_ids):
+        """輪詢直到所有批量任務結束，返回各任務的最終狀態"""
+        latest = {}
+        pending = list(batch_ids)
+        while True:
+            for batch_id in pending:
+                latest[batch_id] = self.client.batches.retrieve(batch_id)
+            pending = [batch_id for batch_id in pending if latest[batch_id].status not in TERMINAL_STATUSES]
+            if self.on_poll:
+                self.on_poll(sum(processed_count(batch) for batch in latest.values()))
+            if not pending:
+                return [latest[batch_id] for batch_id in batch_ids]
+            time.sleep(self.poll_interval)
+
+    def read_results(self, batch):
+        """讀取批量任務的輸出和錯誤文件"""
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    custom_id, content, error, body = parse_batch_output_line(line)
+                    results[custom_id] = (content, error)
+                    if self.on_response is not None:
+                        self.on_response(custom_id, body, error)
+        return results
+
+    def run(self, requests, metadata=None):
+        """按上限分批提交全部請求並等待完成，未返回結果的請求以錯誤信息標記"""
+        requests = list(requests)
+        if not requests:
+            return {}
+        batch_ids = [
+            self.submit(requests[start:start + MAX_BATCH_REQUESTS], metadata)
+            for start in range(0, len(requests), MAX_BATCH_REQUESTS)
+        ]
+        results = {}
+        for batch in self.wait(batch_ids):
+            if batch.status != "completed":
+                logger.warning("批量任務 %s 結束狀態為 %s", batch.id, batch.status)
+            results.update(self.read_results(batch))
+        for custom_id, _, _ in requests:
+            results.setdefault(custom_id, (None, "批量任務未返回該請求的結果"))
+        return results
@@ -0,0 +1,337 @@
+"""離線性能基準
+
+啟動本地模擬的OpenAI服務，在不同規模的合成語料上執行完整的 文件載入 → 分割 → 兩階段生成
+流程，報告吞吐、請求延遲和內存峰值。結果可追加寫入JSONL，並與上一次相同設定的結果對比。
+--startup 則在全新的子進程中測量各模塊的導入耗時及每種文件載入器首次使用的耗時。示例：
+    python Code/benchmark.py --sizes 10,100,500 --latency 0.5 --latency-jitter 0.2 --output bench.jsonl
+    python Code/benchmark.py --startup --output bench.jsonl
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ingestion import LOADER_MAPPING, process_files
+from mock_openai_server import MockOpenAIState, start_server
+from qa_engine import EngineConfig, QAEngine
+
+logger = logging.getLogger("benchmark")
+
+SYNTHETIC_CJK_WORDS = [
+    "系統", "數據", "模型", "訓練", "文檔", "處理", "問題", "答案", "分析", "結構",
+    "方法", "結果", "流程", "設計", "性能", "用戶", "服務", "配置", "網絡", "存儲",
+]
+SYNTHETIC_LATIN_WORDS = [
+    "pipeline", "latency", "throughput", "cache", "request", "token", "chunk", "model",
+    "service", "batch", "queue", "worker", "dataset", "config", "metric", "schema",
+]
+
+# 與結果一起記錄的設定，只有設定相同的結果才互相對比
+COMPARED_SETTINGS = (
+    "paragraphs", "latency", "latency_jitter", "error_rate", "max_rps", "unstructured_rate", "prefill_latency", "trace_memory",
+    "engine",
+)
+
+
+class SyntheticUpload:
+    """與Streamlit上傳文件接口一致的內存文件"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+def generate_paragraph(rng):
+    sentences = []
+    for _ in range(rng.randint(4, 10)):
+        if rng.random() < 0.6:
+            sentences.append("".join(rng.choice(SYNTHETIC_CJK_WORDS) for _ in range(rng.randint(6, 14))) + "。")
+        else:
+            sentences.append(" ".join(rng.choice(SYNTHETIC_LATIN_WORDS) for _ in range(rng.randint(6, 14))).capitalize() + ".")
+    return "".join(sentences)
+
+
+def generate_corpus(file_count, paragraphs_per_file=20, seed=0):
+    """生成固定種子的中英混合純文本語料"""
+    rng = random.Random(seed)
+    return [
+        SyntheticUpload(
+            f"synthetic_{i:05d}.txt",
+            "\n\n".join(generate_paragraph(rng) for _ in range(paragraphs_per_file)).encode("utf8"),
+        )
+        for i in range(file_count)
+    ]
+
+
+class TimedQAEngine(QAEngine):
+    """記錄每次API調用（含重試和限流等待）耗時的引擎"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.call_latencies = []
+
+    async def _create_completion_async(self, async_client, messages, params, stage=1, stream_parser=None):
+        start = time.perf_counter()
+        try:
+            return await super()._create_completion_async(async_client, messages, params, stage, stream_parser)
+        finally:
+            self.call_latencies.append(time.perf_counter() - start)
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def get_peak_rss_mb():
+    # Linux上ru_maxrss單位為KB，macOS上為字節
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_once(file_count, args, engine_overrides, server):
+    """執行一次完整流程並返回測量結果"""
+    corpus = generate_corpus(file_count, args.paragraphs, seed=file_count)
+    config = EngineConfig.from_dict({
+        "use_cache": False,
+        "use_journal": False,
+        # 模擬服務的響應固定，QA對去重會把結果合併成幾條
+        "qa_dedup": False,
+        **engine_overrides,
+        "api_key": "benchmark",
+        "base_url": server.base_url,
+    })
+    server.state.request_count = server.state.error_count = server.state.throttled_count = 0
+    gc.collect()
+    if args.trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    text_chunks = process_files(corpus, error_handler=logger.error, max_workers=config.ingest_workers, options=config.chunking_options())
+    ingest_seconds = time.perf_counter() - start
+    engine = TimedQAEngine(config, error_handler=logger.debug)
+    qa_pairs = engine.generate_qa_pairs(text_chunks)
+    total_seconds = time.perf_counter() - start
+    generate_seconds = total_seconds - ingest_seconds
+
+    python_peak_mb = None
+    if args.trace_memory:
+        python_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    latencies = engine.call_latencies or [0.0]
+    metrics_summary = engine.metrics.summary()
+    # 包括返回錯誤和429的請求
+    requests = server.state.request_count + server.state.error_count + server.state.throttled_count
+    return {
+        "files": file_count,
+        "chunks": len(text_chunks),
+        "qa_pairs": len(qa_pairs),
+        "requests": requests,
+        "server_errors": server.state.error_count,
+        "throttled": server.state.throttled_count,
+        "retries": engine.last_stats.get("retries", 0),
+        "dead_letters": engine.last_stats.get("dead_letters", 0),
+        "ingest_seconds": round(ingest_seconds, 3),
+        "generate_seconds": round(generate_seconds, 3),
+        # 從開始生成到第一個問答對可用的時間
+        "first_qa_seconds": engine.last_stats.get("first_qa_seconds"),
+        "total_seconds": round(total_seconds, 3),
+        "chunks_per_sec": round(len(text_chunks) / total_seconds, 2),
+        "requests_per_sec": round(requests / generate_seconds, 2) if generate_seconds else 0.0,
+        "latency_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_p99": round(float(np.percentile(latencies, 99)), 4),
+        "prompt_tokens": metrics_summary["tokens"].get("prompt", 0),
+        "cached_tokens": metrics_summary["tokens"].get("cached", 0),
+        "prompt_cache_ratio": metrics_summary["prompt_cache_ratio"],
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+        "python_peak_mb": round(python_peak_mb, 1) if python_peak_mb is not None else None,
+    }
+
+
+def measure_in_subprocess(setup, statement):
+    """在全新的Python進程中執行setup後測量statement的耗時（秒）"""
+    code = f"{setup}\nimport time\n_start = time.perf_counter()\n{statement}\nprint(time.perf_counter() - _start)"
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        return None
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def get_startup_targets():
+    """(名稱, 準備代碼, 被測語句)；載入器只測量導入，不依賴實際文件"""
+    targets = [
+        ("import ingestion", "", "import ingestion"),
+        ("import qa_engine", "", "import qa_engine"),
+        ("import SQA", "", "import SQA"),
+        ("首次分割", "import ingestion\nfrom langchain_core.documents import Document", "ingestion.split_documents([Document(page_content='x')])"),
+    ]
+    for ext in sorted(LOADER_MAPPING):
+        targets.append((f"載入器 {ext}", "import ingestion", f"ingestion.resolve_loader({ext!r})"))
+    return targets
+
+
+def run_startup_benchmark(args, previous_results):
+    """測量冷啟動導入耗時，每項取多次測量的中位數"""
+    baseline = next((item for item in reversed(previous_results) if item.get("kind") == "startup"), None)
+    timings = {}
+    print(f"{'項目':<20} {'耗時(秒)':>10} {'對比':>8}")
+    for name, setup, statement in get_startup_targets():
+        samples = [measure_in_subprocess(setup, statement) for _ in range(args.startup_repeats)]
+        samples = [sample for sample in samples if sample is not None]
+        if not samples:
+            print(f"{name:<20} {'失敗':>10}")
+            continue
+        timings[name] = round(statistics.median(samples), 4)
+        previous = baseline["timings"].get(name) if baseline else None
+        print(f"{name:<20} {timings[name]:>10.3f} {format_change(timings[name], previous):>8}")
+    return {
+        "kind": "startup",
+        "timings": timings,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": get_git_commit(),
+    }
+
+
+def load_previous_results(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(previous_results, result):
+    """找到設定和規模相同的最近一次結果"""
+    for item in reversed(previous_results):
+        if item.get("files") == result["files"] and all(item.get(key) == result.get(key) for key in COMPARED_SETTINGS):
+            return item
+    return None
+
+
+def format_change(current, baseline):
+    if not baseline:
+        return ""
+    return f"{(current - baseline) / baseline * 100:+.1f}%"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="使用本地模擬服務測量QA生成流程的性能")
+    parser.add_argument("--sizes", default="10,50,200", help="以逗號分隔的語料文件數")
+    parser.add_argument("--paragraphs", type=int, default=20, help="每個合成文件的段落數")
+    parser.add_argument("--latency", type=float, default=0.2, help="模擬服務的平均響應延遲秒數")
+    parser.add_argument("--latency-jitter", type=float, default=0.05, help="響應延遲的隨機波動範圍（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模擬服務返回500錯誤的比例")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="模擬服務的每秒請求數上限，0表示不限制")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="每千個未命中前綴緩存的提示詞token增加的延遲秒數")
+    parser.add_argument("--unstructured-rate", type=float, default=0.0, help="需要第二階段JSON轉換的響應比例")
+    parser.add_argument("--response-file", help="自定義的Q:/A:格式響應文本文件")
+    parser.add_argument("--config", help="JSON配置文件，覆蓋EngineConfig的默認值（如並發數）")
+    parser.add_argument("--trace-memory", action="store_true", help="使用tracemalloc測量Python內存峰值（會降低速度）")
+    parser.add_argument("--output", help="追加寫入結果的JSONL文件，並與其中相同設定的上一次結果對比")
+    parser.add_argument("--seed", type=int, default=0, help="模擬服務的隨機種子")
+    parser.add_argument("--startup", action="store_true", help="測量模塊導入和載入器首次使用的冷啟動耗時")
+    parser.add_argument("--startup-repeats", type=int, default=3, help="冷啟動測量的重複次數")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("scheduler").setLevel(logging.ERROR)
+
+    if args.startup:
+        result = run_startup_benchmark(args, load_previous_results(args.output))
+        if args.output:
+            with open(args.output, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        return 0
+
+    engine_overrides = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            engine_overrides.update(json.load(f))
+    # 基準測試中退避時間按比例縮短，避免錯誤注入時結果被等待時間主導
+    engine_overrides.setdefault("retry_base_delay", 0.05)
+    engine_overrides.setdefault("retry_max_delay", 1.0)
+
+    qa_response = None
+    if args.response_file:
+        with open(args.response_file, "r", encoding="utf-8") as f:
+            qa_response = f.read()
+    state_options = {
+        "latency": args.latency,
+        "latency_jitter": args.latency_jitter,
+        "error_rate": args.error_rate,
+        "max_rps": args.max_rps,
+        "unstructured_rate": args.unstructured_rate,
+        "prefill_latency": args.prefill_latency,
+        "seed": args.seed,
+    }
+    if qa_response is not None:
+        state_options["qa_response"] = qa_response
+    server, base_url = start_server(state=MockOpenAIState(**state_options))
+    server.base_url = base_url
+
+    previous_results = load_previous_results(args.output)
+    settings = {
+        "paragraphs": args.paragraphs,
+        "latency": args.latency,
+        "latency_jitter": args.latency_jitter,
+        "error_rate": args.error_rate,
+        "max_rps": args.max_rps,
+        "unstructured_rate": args.unstructured_rate,
+        "prefill_latency": args.prefill_latency,
+        "trace_memory": args.trace_memory,
+        "engine": engine_overrides,
+    }
+    commit = get_git_commit()
+
+    print(f"{'文件':>6} {'文本段':>7} {'請求':>7} {'文本段/秒':>10} {'請求/秒':>9} {'p50':>8} {'p99':>8} {'首個QA':>8} {'緩存命中':>8} {'RSS峰值MB':>10} {'對比':>8}")
+    try:
+        for size in [int(value) for value in args.sizes.split(",") if value.strip()]:
+            result = run_once(size, args, engine_overrides, server)
+            result.update(settings)
+            result["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            result["commit"] = commit
+            baseline = find_baseline(previous_results, result)
+            print(
+                f"{result['files']:>6} {result['chunks']:>7} {result['requests']:>7} "
+                f"{result['chunks_per_sec']:>10.2f} {result['requests_per_sec']:>9.2f} "
+                f"{result['latency_p50']:>8.3f} {result['latency_p99']:>8.3f} "
+                f"{result['first_qa_seconds'] or 0.0:>8.3f} {result['prompt_cache_ratio']:>8.1%} {result['peak_rss_mb']:>10.1f} "
+                f"{format_change(result['chunks_per_sec'], baseline['chunks_per_sec'] if baseline else None):>8}"
+            )
+            if args.output:
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import re
+
+# 合併請求中每個文本段的分節標記，模型需在輸出中原樣保留
+SECTION_HEADER = "[[SECTION {number}]]"
+SECTION_MARKER = re.compile(r"^\s*(?:\*\*)?\[\[\s*SECTION\s+(\d+)\s*\]\](?:\*\*)?\s*$", re.MULTILINE)
+
+PACKED_INSTRUCTION = """注意：給定文本由多個以 [[SECTION 編號]] 標記的獨立段落組成。
+請對每個段落分別生成問答對，並在每個段落的問答對之前單獨一行輸出對應的標記（如 [[SECTION 1]]）。
+每組問答對只能基於所屬段落的內容，不要混合不同段落的信息。"""
+
+
+def pack_chunk_indices(token_counts, budget_tokens, max_chunks=8):
+    """按順序貪心合併文本段，每組的token總數不超過預算；超出預算的文本段單獨成組"""
+    packs = []
+    current = []
+    current_tokens = 0
+    for index, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > budget_tokens or len(current) >= max_chunks):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_packed_text(texts):
+    """將多個文本段組合為帶編號分節的文本，編號從1開始"""
+    return "\n\n".join(
+        f"{SECTION_HEADER.format(number=number)}\n{text}" for number, text in enumerate(texts, start=1)
+    )
+
+
+def split_packed_response(raw_response, section_count, complete=True):
+    """按分節標記拆分合併請求的響應，返回 {分節序號(從0開始): 響應文本}，缺失的分節不包含在結果中
+
+    complete為False（響應因輸出長度上限被截斷）時，最後一個分節可能不完整，不包含在結果中。
+    """
+    markers = list(SECTION_MARKER.finditer(raw_response))
+    sections = {}
+    for i, marker in enumerate(markers):
+        position = int(marker.group(1)) - 1
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(raw_response)
+        text = raw_response[marker.end():end].strip()
+        if 0 <= position < section_count and text:
+            sections[position] = sections[position] + "\n\n\n" + text if position in sections else text
+    if not complete and markers:
+        sections.pop(int(markers[-1].group(1)) - 1, None)
+    return sections
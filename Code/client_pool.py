@@ -0,0 +1,293 @@
+"""多端點客戶端池
+
+在多個OpenAI兼容端點（不同的API Key、多台vLLM服務等）之間分配請求：按權重隨機抽取兩個端點，
+選擇相對負載較低的一個。失敗的端點短暫讓出流量，連續失敗的端點暫停使用，並由後台健康檢查
+在恢復後重新啟用。每個端點在一次運行內復用同一個客戶端，HTTP連接保持長連接。
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from scheduler import get_retry_after
+
+logger = logging.getLogger(__name__)
+
+# 請求本身有問題（而不是端點故障）的錯誤，不影響端點狀態
+REQUEST_ERRORS = (openai.BadRequestError, openai.UnprocessableEntityError)
+HEALTH_CHECK_TIMEOUT = 10.0
+
+
+def parse_endpoint_spec(spec, default_api_key=""):
+    """解析 "URL[,API Key[,權重]]" 格式的端點設定；未指定API Key且沒有默認值時不含api_key，使用主API Key"""
+    parts = [part.strip() for part in spec.split(",")]
+    endpoint = {"base_url": parts[0]}
+    api_key = parts[1] if len(parts) > 1 and parts[1] else default_api_key
+    if api_key:
+        endpoint["api_key"] = api_key
+    if len(parts) > 2 and parts[2]:
+        endpoint["weight"] = float(parts[2])
+    return endpoint
+
+
+def parse_endpoint_lines(text, default_api_key=""):
+    """解析每行一個端點的文本，忽略空行和 # 開頭的註釋"""
+    return [
+        parse_endpoint_spec(line, default_api_key)
+        for line in text.splitlines()
+        if line.strip() and not line.strip().startswith("#")
+    ]
+
+
+class EndpointState:
+    """單個端點的設定與運行狀態"""
+
+    def __init__(self, name, base_url, api_key, weight=1.0, max_retries=2):
+        if not api_key:
+            raise ValueError(f"請先設定API Key（端點 {name}）")
+        if weight <= 0:
+            raise ValueError(f"端點權重必須大於0（端點 {name}）")
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.weight = weight
+        self.max_retries = max_retries
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        # 連續失敗達到閾值或健康檢查失敗後為False，直到健康檢查或請求成功
+        self.healthy = True
+        self.unavailable_until = 0.0
+        self.last_error = None
+        self._client = None
+
+    @property
+    def client(self):
+        """同步客戶端，首次使用時初始化"""
+        if self._client is None:
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=self.max_retries)
+        return self._client
+
+    def create_async_client(self):
+        # 重試由RequestScheduler統一處理，以便切換端點
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+
+    def is_available(self, now):
+        return now >= self.unavailable_until
+
+    def snapshot(self):
+        return {
+            "base_url": self.base_url,
+            "weight": self.weight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "healthy": self.healthy,
+            "available": self.is_available(time.monotonic()),
+            "last_error": self.last_error,
+        }
+
+
+class ClientPool:
+    """按權重和負載選擇端點，記錄每次請求的結果以實現故障切換"""
+
+    def __init__(
+        self,
+        endpoints,
+        max_retries=2,
+        failure_threshold=3,
+        cooldown=30.0,
+        failover_delay=1.0,
+        health_check_interval=15.0,
+        metrics=None,
+        seed=None,
+    ):
+        if not endpoints:
+            raise ValueError("至少需要一個API端點")
+        self.endpoints = []
+        for endpoint in endpoints:
+            name = endpoint.get("name") or urlparse(endpoint["base_url"]).netloc or endpoint["base_url"]
+            # 同一地址配置多個API Key時以序號區分
+            if any(existing.name == name for existing in self.endpoints):
+                name = f"{name}#{len(self.endpoints) + 1}"
+            self.endpoints.append(EndpointState(
+                name, endpoint["base_url"], endpoint.get("api_key", ""), float(endpoint.get("weight", 1.0)), max_retries
+            ))
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failover_delay = failover_delay
+        self.health_check_interval = health_check_interval
+        self.metrics = metrics
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        """第一個端點，用於只能在單一端點上進行的操作（如Batch API）"""
+        return self.endpoints[0]
+
+    def has_available_endpoint(self):
+        now = time.monotonic()
+        return any(endpoint.is_available(now) for endpoint in self.endpoints)
+
+    def acquire(self):
+        """選擇端點並計入負載：可用端點中按權重抽取兩個，取 進行中請求數/權重 較低者；全部不可用時選最早恢復的"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.is_available(now)]
+            if not candidates:
+                endpoint = min(self.endpoints, key=lambda item: item.unavailable_until)
+            elif len(candidates) == 1:
+                endpoint = candidates[0]
+            else:
+                first, second = self.random.choices(candidates, weights=[item.weight for item in candidates], k=2)
+                endpoint = first if first.in_flight / first.weight <= second.in_flight / second.weight else second
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint, error=None):
+        """請求結束後更新端點狀態：失敗的端點短暫讓出流量，連續失敗達到閾值後暫停使用"""
+        with self._lock:
+            endpoint.in_flight -= 1
+            now = time.monotonic()
+            if error is None:
+                endpoint.consecutive_failures = 0
+                endpoint.healthy = True
+            elif not isinstance(error, REQUEST_ERRORS):
+                endpoint.errors += 1
+                endpoint.last_error = f"{type(error).__name__}: {error}"
+                if isinstance(error, openai.RateLimitError):
+                    pause = get_retry_after(error) or self.failover_delay
+                else:
+                    endpoint.consecutive_failures += 1
+                    pause = self.failover_delay
+                    if endpoint.consecutive_failures >= self.failure_threshold:
+                        pause = self.cooldown
+                        if endpoint.healthy:
+                            logger.warning(
+                                "端點 %s 連續失敗 %d 次，暫停使用 %.0f 秒", endpoint.name, endpoint.consecutive_failures, pause
+                            )
+                        endpoint.healthy = False
+                endpoint.unavailable_until = max(endpoint.unavailable_until, now + pause)
+        if self.metrics is not None:
+            self.metrics.inc("qa_endpoint_requests", endpoint=endpoint.name, status="ok" if error is None else "error")
+
+    def mark_healthy(self, endpoint):
+        with self._lock:
+            if not endpoint.healthy:
+                logger.info("端點 %s 已恢復", endpoint.name)
+            endpoint.healthy = True
+            endpoint.consecutive_failures = 0
+            endpoint.unavailable_until = 0.0
+
+    def mark_unhealthy(self, endpoint, error):
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.last_error = f"{type(error).__name__}: {error}"
+            endpoint.unavailable_until = max(endpoint.unavailable_until, time.monotonic() + self.cooldown)
+        logger.warning("端點 %s 健康檢查失敗: %s", endpoint.name, error)
+
+    def test_endpoints(self, model):
+        """向每個端點發送一個極短的請求，返回 {端點名稱: 錯誤信息或None}"""
+        results = {}
+        for endpoint in self.endpoints:
+            try:
+                endpoint.client.chat.completions.create(
+                    model=model, messages=[{"role": "user", "content": "Hello"}], max_tokens=10, temperature=0.1
+                )
+                self.mark_healthy(endpoint)
+                results[endpoint.name] = None
+            except Exception as e:
+                results[endpoint.name] = f"{type(e).__name__}: {e}"
+        return results
+
+    @asynccontextmanager
+    async def async_session(self):
+        """在事件循環內為每個端點建立異步客戶端；多端點時先做一次健康檢查，並在後台定期檢查暫停中的端點"""
+        session = PooledAsyncClient(self)
+        checker = None
+        try:
+            if len(self.endpoints) > 1:
+                await session.check_health(self.endpoints)
+                checker = asyncio.create_task(session.run_health_checks())
+            yield session
+        finally:
+            if checker is not None:
+                checker.cancel()
+                try:
+                    await checker
+                except asyncio.CancelledError:
+                    pass
+            await session.close()
+
+    def snapshot(self):
+        return {endpoint.name: endpoint.snapshot() for endpoint in self.endpoints}
+
+
+class PooledAsyncClient:
+    """接口與 AsyncOpenAI 的 chat.completions.create 一致，每次請求由客戶端池選擇端點"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.clients = {endpoint.name: endpoint.create_async_client() for endpoint in pool.endpoints}
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        endpoint = self.pool.acquire()
+        try:
+            response = await self.clients[endpoint.name].chat.completions.create(**kwargs)
+        except Exception as e:
+            self.pool.release(endpoint, e)
+            raise
+        if kwargs.get("stream"):
+            # 流式響應讀取完畢才算請求結束
+            return self._track_stream(endpoint, response)
+        self.pool.release(endpoint)
+        return response
+
+    async def _track_stream(self, endpoint, stream):
+        error = None
+        try:
+            async for event in stream:
+                yield event
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.pool.release(endpoint, error)
+
+    async def check_endpoint(self, endpoint):
+        """請求 /models 檢查端點是否可達；返回錯誤狀態碼（如未實現該接口）也視為可用"""
+        try:
+            await self.clients[endpoint.name].models.list(timeout=HEALTH_CHECK_TIMEOUT)
+        except openai.APIStatusError as e:
+            if e.status_code in (401, 403) or e.status_code >= 500:
+                self.pool.mark_unhealthy(endpoint, e)
+                return
+        except Exception as e:
+            self.pool.mark_unhealthy(endpoint, e)
+            return
+        self.pool.mark_healthy(endpoint)
+
+    async def check_health(self, endpoints):
+        await asyncio.gather(*(self.check_endpoint(endpoint) for endpoint in endpoints))
+
+    async def run_health_checks(self):
+        """定期檢查被判定為故障的端點，恢復後立即重新分配流量"""
+        while True:
+            await asyncio.sleep(self.pool.health_check_interval)
+            unhealthy = [endpoint for endpoint in self.pool.endpoints if not endpoint.healthy]
+            if unhealthy:
+                await self.check_health(unhealthy)
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.close()
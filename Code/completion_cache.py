@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 默認緩存位置，可通過環境變量 SQA_CACHE_PATH 覆蓋以便多用戶共享
+DEFAULT_CACHE_PATH = os.environ.get(
+    "SQA_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".qa_cache", "completions.sqlite3"),
+)
+
+# 每寫入多少條記錄執行一次淘汰
+EVICTION_INTERVAL = 100
+
+
+class CompletionCache:
+    """基於SQLite的持久化模型響應緩存，支持按條數和存活時間淘汰
+
+    打開緩存時不做淘汰；生成開始時和每寫入 EVICTION_INTERVAL 條記錄後調用 evict()。
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=100000, max_age_seconds=30 * 24 * 3600, bypass=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_eviction = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON completions (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON completions (created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, messages, temperature, max_tokens, **extra_params):
+        """根據模型、完整消息列表及生成參數計算緩存鍵"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "extra": extra_params,
+        }
+        serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """讀取緩存，未命中或處於繞過模式時返回None"""
+        if self.bypass:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        """寫入緩存，繞過模式下仍會刷新記錄"""
+        if response is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._conn.commit()
+            self._writes_since_eviction += 1
+            should_evict = self._writes_since_eviction >= EVICTION_INTERVAL
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """刪除過期記錄，並在超出條數上限時淘汰最久未使用的記錄"""
+        with self._lock:
+            if self.max_age_seconds:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                )
+            if self.max_entries:
+                self._conn.execute(
+                    """DELETE FROM completions WHERE key IN (
+                        SELECT key FROM completions ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+            self._writes_since_eviction = 0
+
+    def clear(self):
+        """清空緩存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    def size(self):
+        """返回緩存中的記錄數"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def stats(self):
+        """返回命中統計"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.size(),
+        }
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,115 @@
+import re
+
+import numpy as np
+
+# 字符n-gram滾動哈希的基數（uint32運算自然溢出即取模2^32）
+SHINGLE_BASE = np.uint32(16777619)
+MINHASH_SEED = 42
+
+# 去重前忽略空白和標點差異
+NORMALIZE_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_text(text):
+    return NORMALIZE_PATTERN.sub("", text.lower())
+
+
+def shingle_hashes(text, ngram=3):
+    """以向量化滾動哈希計算字符n-gram哈希，字符級n-gram對中英文都適用"""
+    codepoints = np.frombuffer(normalize_text(text).encode("utf-32-le"), dtype=np.uint32)
+    if len(codepoints) <= ngram:
+        ngram = max(1, len(codepoints))
+        if not len(codepoints):
+            return np.zeros(1, dtype=np.uint32)
+    length = len(codepoints) - ngram + 1
+    hashes = np.zeros(length, dtype=np.uint32)
+    for offset in range(ngram):
+        np.multiply(hashes, SHINGLE_BASE, out=hashes)
+        np.add(hashes, codepoints[offset:offset + length], out=hashes)
+    return hashes
+
+
+def choose_bands(num_perm, threshold):
+    """選擇LSH分帶數，使候選閾值 (1/b)^(1/r) 最接近目標相似度"""
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateIndex:
+    """基於MinHash和LSH分帶的近似重複檢測，逐條插入，平均複雜度O(n)"""
+
+    def __init__(self, threshold=0.85, num_perm=64, ngram=3):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        # 哈希族 h(x) = a*x + b (mod 2^32)，a為奇數時是32位空間上的置換
+        rng = np.random.RandomState(MINHASH_SEED)
+        self._a = (rng.randint(0, 2 ** 32, size=(num_perm, 1), dtype=np.uint64) | 1).astype(np.uint32)
+        self._b = rng.randint(0, 2 ** 32, size=(num_perm, 1), dtype=np.uint64).astype(np.uint32)
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._signatures = []
+
+    def signature(self, text):
+        """計算文本的MinHash簽名"""
+        hashes = shingle_hashes(text, self.ngram)
+        permuted = np.empty((self.num_perm, len(hashes)), dtype=np.uint32)
+        np.multiply(self._a, hashes, out=permuted)
+        np.add(permuted, self._b, out=permuted)
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find_duplicate(self, signature):
+        """返回與簽名估計相似度達到閾值的已有條目序號，沒有則返回None"""
+        checked = set()
+        for band, key in self._band_keys(signature):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold:
+                    return candidate
+        return None
+
+    def add(self, text):
+        """插入文本；若與已有條目近似重複則不插入並返回該條目的序號，否則返回None"""
+        signature = self.signature(text)
+        duplicate = self.find_duplicate(signature)
+        if duplicate is not None:
+            return duplicate
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(index)
+        return None
+
+
+def dedup_chunks(text_chunks, threshold=0.85):
+    """在調用API之前剔除近似重複的文本段，返回保留的文本段和剔除數量"""
+    index = NearDuplicateIndex(threshold=threshold, ngram=5)
+    kept = [chunk for chunk in text_chunks if index.add(chunk.page_content) is None]
+    return kept, len(text_chunks) - len(kept)
+
+
+def qa_dedup_text(qa):
+    """QA對去重時比較的文本：問題和答案一起比較，同一問題的不同答案不會被合併"""
+    return f"{qa.get('question', '')}\n{qa.get('answer', '')}"
+
+
+def dedup_qa_pairs(qa_pairs, threshold=0.85):
+    """合併問題和答案都近似重複的QA對（保留首次出現的一條），返回保留的QA對和合併數量"""
+    index = NearDuplicateIndex(threshold=threshold, ngram=2)
+    kept = [qa for qa in qa_pairs if index.add(qa_dedup_text(qa)) is None]
+    return kept, len(qa_pairs) - len(kept)
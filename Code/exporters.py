@@ -0,0 +1,136 @@
+"""流式導出QA對
+
+文本段內容只寫入一次（chunks文件），QA記錄通過 chunk_id 引用。輸出可直接用
+HuggingFace datasets 載入，例如：
+
+    load_dataset("json", data_files="sft_qa_pairs.jsonl")
+    load_dataset("parquet", data_files="qa_parquet/sft-*.parquet")
+"""
+import hashlib
+import json
+import os
+
+DEFAULT_ROWS_PER_SHARD = 100000
+
+
+def chunk_id_for(text):
+    """根據文本段內容生成穩定的ID"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_normalized_records(qa_pairs):
+    """逐條產生 (原QA對, QA記錄, 新文本段記錄或None)，QA記錄以chunk_id代替完整的source_chunk"""
+    seen_chunk_ids = set()
+    for qa in qa_pairs:
+        record = {key: value for key, value in qa.items() if key != "source_chunk"}
+        chunk_record = None
+        source_chunk = qa.get("source_chunk")
+        if source_chunk is not None:
+            chunk_id = chunk_id_for(source_chunk)
+            record["chunk_id"] = chunk_id
+            if chunk_id not in seen_chunk_ids:
+                seen_chunk_ids.add(chunk_id)
+                chunk_record = {"chunk_id": chunk_id, "text": source_chunk}
+        yield qa, record, chunk_record
+
+
+def to_sft_record(qa, system_prompt):
+    return {
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": qa.get('question', '')},
+            {"role": "assistant", "content": qa.get('answer', '')}
+        ]
+    }
+
+
+def _ensure_parent(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+
+def chunks_path_for(qa_path):
+    """QA文件對應的文本段文件路徑，如 qa.jsonl -> qa.chunks.jsonl"""
+    stem, ext = os.path.splitext(qa_path)
+    return f"{stem}.chunks{ext or '.jsonl'}"
+
+
+def export_jsonl(qa_pairs, qa_path, chunks_path=None):
+    """逐行寫出QA記錄和去重後的文本段，返回 (QA數, 文本段數)"""
+    chunks_path = chunks_path or chunks_path_for(qa_path)
+    _ensure_parent(qa_path)
+    _ensure_parent(chunks_path)
+    qa_count = chunk_count = 0
+    with open(qa_path, "w", encoding="utf-8") as qa_file, open(chunks_path, "w", encoding="utf-8") as chunks_file:
+        for _, record, chunk_record in iter_normalized_records(qa_pairs):
+            qa_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            qa_count += 1
+            if chunk_record is not None:
+                chunks_file.write(json.dumps(chunk_record, ensure_ascii=False) + "\n")
+                chunk_count += 1
+    return qa_count, chunk_count
+
+
+def export_sft_jsonl(qa_pairs, path, system_prompt):
+    """逐行寫出SFTTrainer格式的記錄，返回記錄數"""
+    _ensure_parent(path)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for qa in qa_pairs:
+            f.write(json.dumps(to_sft_record(qa, system_prompt), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+class ParquetShardWriter:
+    """累積到指定行數後寫出一個Parquet分片，內存佔用以分片大小為上限"""
+
+    def __init__(self, directory, prefix, rows_per_shard=DEFAULT_ROWS_PER_SHARD):
+        self.directory = directory
+        self.prefix = prefix
+        self.rows_per_shard = rows_per_shard
+        self.shard_paths = []
+        self.row_count = 0
+        self._buffer = []
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, record):
+        self._buffer.append(record)
+        self.row_count += 1
+        if len(self._buffer) >= self.rows_per_shard:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        import pandas as pd
+
+        path = os.path.join(self.directory, f"{self.prefix}-{len(self.shard_paths):05d}.parquet")
+        # 使用 requirements 中的 pyarrow 作為pandas的Parquet引擎
+        pd.DataFrame.from_records(self._buffer).to_parquet(path, index=False)
+        self.shard_paths.append(path)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+
+def export_parquet(qa_pairs, directory, rows_per_shard=DEFAULT_ROWS_PER_SHARD, sft_system_prompt=None):
+    """寫出分片的Parquet文件：qa-*.parquet、chunks-*.parquet，指定系統提示詞時另寫sft-*.parquet"""
+    writers = {
+        "qa": ParquetShardWriter(directory, "qa", rows_per_shard),
+        "chunks": ParquetShardWriter(directory, "chunks", rows_per_shard),
+    }
+    if sft_system_prompt is not None:
+        writers["sft"] = ParquetShardWriter(directory, "sft", rows_per_shard)
+
+    for qa, record, chunk_record in iter_normalized_records(qa_pairs):
+        writers["qa"].write(record)
+        if chunk_record is not None:
+            writers["chunks"].write(chunk_record)
+        if "sft" in writers:
+            writers["sft"].write(to_sft_record(qa, sft_system_prompt))
+
+    for writer in writers.values():
+        writer.close()
+    return {name: writer.shard_paths for name, writer in writers.items()}
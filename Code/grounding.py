@@ -0,0 +1,86 @@
+"""本地答案依據檢查
+
+不調用LLM，按字符n-gram計算答案與其來源文本段的重合度（答案的n-gram中出現在文本段裡的比例），
+字符級n-gram對中英文都適用。所有QA對的n-gram一次性向量化計算，十萬級QA對可在數秒內完成。
+重合度低於閾值的QA對可能包含文本段中沒有的信息，可直接丟棄或標記後保留。
+"""
+import numpy as np
+
+from dedup import SHINGLE_BASE, normalize_text
+
+DEFAULT_GROUNDING_NGRAM = 3
+GROUNDING_MODES = ("drop", "flag")
+
+
+def batch_shingle_hashes(texts, ngram=DEFAULT_GROUNDING_NGRAM):
+    """一次性計算多段文本的字符n-gram哈希，返回 (哈希, 所屬文本序號)；不跨越文本邊界"""
+    normalized = [normalize_text(text) for text in texts]
+    lengths = np.fromiter(map(len, normalized), dtype=np.int64, count=len(normalized))
+    codepoints = np.frombuffer("".join(normalized).encode("utf-32-le"), dtype=np.uint32)
+    length = len(codepoints) - ngram + 1
+    if length <= 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    owners = np.repeat(np.arange(len(normalized), dtype=np.int64), lengths)
+    hashes = np.zeros(length, dtype=np.uint32)
+    for offset in range(ngram):
+        np.multiply(hashes, SHINGLE_BASE, out=hashes)
+        np.add(hashes, codepoints[offset:offset + length], out=hashes)
+    # 窗口首尾屬於同一文本的才是有效的n-gram
+    valid = owners[:length] == owners[ngram - 1:]
+    return hashes[valid], owners[:length][valid]
+
+
+def grounding_scores(qa_pairs, ngram=DEFAULT_GROUNDING_NGRAM):
+    """計算每個QA對的答案在其source_chunk中的n-gram覆蓋率（0到1），無法計算時為None"""
+    chunk_ids = {}
+    owners = []
+    for qa in qa_pairs:
+        source_chunk = qa.get("source_chunk")
+        owners.append(None if source_chunk is None else chunk_ids.setdefault(source_chunk, len(chunk_ids)))
+    if not chunk_ids:
+        return [None] * len(qa_pairs)
+
+    # 以 (文本段序號, n-gram哈希) 組成64位鍵，文本段的鍵排序後用二分查找判斷答案的n-gram是否出現
+    chunk_hashes, chunk_owner = batch_shingle_hashes(list(chunk_ids), ngram)
+    chunk_keys = (chunk_owner.astype(np.uint64) << np.uint64(32)) | chunk_hashes.astype(np.uint64)
+    chunk_keys.sort()
+    answered = [i for i, owner in enumerate(owners) if owner is not None]
+    answer_hashes, answer_owner = batch_shingle_hashes([str(qa_pairs[i].get("answer", "")) for i in answered], ngram)
+    answer_chunks = np.array([owners[i] for i in answered], dtype=np.uint64)[answer_owner]
+    answer_keys = (answer_chunks << np.uint64(32)) | answer_hashes.astype(np.uint64)
+    if len(chunk_keys):
+        positions = np.minimum(np.searchsorted(chunk_keys, answer_keys), len(chunk_keys) - 1)
+        hits = chunk_keys[positions] == answer_keys
+    else:
+        hits = np.zeros(len(answer_keys), dtype=bool)
+    totals = np.bincount(answer_owner, minlength=len(answered))
+    matched = np.bincount(answer_owner, weights=hits, minlength=len(answered))
+    ratios = np.divide(matched, totals, out=np.zeros(len(answered)), where=totals > 0)
+
+    # 短於n個字符的答案（如「是」）無法判斷，與沒有來源文本段的QA對一樣為None
+    scores = [None] * len(qa_pairs)
+    for i, ratio, total in zip(answered, ratios.tolist(), totals.tolist()):
+        if total:
+            scores[i] = round(ratio, 4)
+    return scores
+
+
+def filter_ungrounded(qa_pairs, threshold, mode="drop", ngram=DEFAULT_GROUNDING_NGRAM):
+    """為QA對寫入 grounding_score；mode為drop時丟棄低於閾值的QA對，為flag時保留並寫入 grounded 字段
+
+    返回 (QA對列表, 低於閾值的數量)。
+    """
+    if mode not in GROUNDING_MODES:
+        raise ValueError(f"未知的依據檢查模式: {mode}")
+    kept = []
+    below = 0
+    for qa, score in zip(qa_pairs, grounding_scores(qa_pairs, ngram)):
+        qa = {**qa, "grounding_score": score}
+        grounded = score is None or score >= threshold
+        below += not grounded
+        if mode == "flag":
+            qa["grounded"] = grounded
+        elif not grounded:
+            continue
+        kept.append(qa)
+    return kept, below
@@ -0,0 +1,192 @@
+"""按內容哈希增量重新處理
+
+記錄每個文件的內容哈希及其分割結果，以及每個文本段（按內容哈希和生成設定）的QA對。重新處理時，
+內容未變的文件直接復用分割結果，未變的文本段直接復用QA對，只有新增或修改的文本段需要調用API；
+文件新版本中已不存在的文本段，其QA對會從存儲中刪除。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+
+from langchain_core.documents import Document
+
+from ingestion import ChunkingOptions, IngestionReport, ingest_sources
+
+# 默認存儲位置，可通過環境變量 SQA_INCREMENTAL_PATH 覆蓋
+DEFAULT_INCREMENTAL_PATH = os.environ.get(
+    "SQA_INCREMENTAL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".qa_cache", "incremental.sqlite3"),
+)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def fingerprint_source(source):
+    """計算文件內容的哈希，磁盤文件分塊讀取"""
+    digest = hashlib.sha256()
+    if source.data is not None:
+        digest.update(source.data)
+    else:
+        with open(source.path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def make_key(values):
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class IncrementalStore:
+    """基於SQLite保存文件分割結果和文本段QA對的存儲"""
+
+    def __init__(self, path=DEFAULT_INCREMENTAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                options_key TEXT NOT NULL,
+                chunks TEXT NOT NULL,
+                source_tokens INTEGER NOT NULL,
+                chunk_tokens INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        # 每個文件最新版本包含的文本段，用於判斷文本段是否仍被引用
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS file_chunks (
+                name TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                PRIMARY KEY (name, chunk_hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_file_chunks_hash ON file_chunks (chunk_hash)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunk_results (
+                settings_key TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                qa_pairs TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (settings_key, chunk_hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_results_hash ON chunk_results (chunk_hash)")
+        self._conn.commit()
+
+    def get_file(self, name, file_hash, options_key):
+        """讀取內容和分割設定均未變的文件的分割結果，不存在時返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunks, source_tokens, chunk_tokens FROM files WHERE name = ? AND file_hash = ? AND options_key = ?",
+                (name, file_hash, options_key),
+            ).fetchone()
+        if row is None:
+            return None
+        chunks = [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in json.loads(row[0])]
+        return IngestionReport(name=name, chunks=chunks, source_tokens=row[1], chunk_tokens=row[2], reused=True)
+
+    def put_file(self, name, file_hash, options_key, report):
+        """保存文件的分割結果，返回該文件舊版本中已不存在的文本段數；不再被任何文件引用的文本段的QA對一併刪除"""
+        chunks = [{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in report.chunks]
+        new_hashes = {content_hash(chunk.page_content) for chunk in report.chunks}
+        with self._lock:
+            old_hashes = {row[0] for row in self._conn.execute("SELECT chunk_hash FROM file_chunks WHERE name = ?", (name,))}
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (name, file_hash, options_key, chunks, source_tokens, chunk_tokens, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name, file_hash, options_key, json.dumps(chunks, ensure_ascii=False, default=str),
+                    report.source_tokens, report.chunk_tokens, time.time(),
+                ),
+            )
+            self._conn.execute("DELETE FROM file_chunks WHERE name = ?", (name,))
+            self._conn.executemany(
+                "INSERT INTO file_chunks (name, chunk_hash) VALUES (?, ?)", [(name, chunk_hash) for chunk_hash in new_hashes]
+            )
+            removed = old_hashes - new_hashes
+            self._conn.executemany(
+                "DELETE FROM chunk_results WHERE chunk_hash = ? AND NOT EXISTS "
+                "(SELECT 1 FROM file_chunks WHERE file_chunks.chunk_hash = chunk_results.chunk_hash)",
+                [(chunk_hash,) for chunk_hash in removed],
+            )
+            self._conn.commit()
+        return len(removed)
+
+    def get_results(self, settings_key, chunk_hashes):
+        """讀取已保存的QA對，返回 {文本段哈希: QA對列表}"""
+        results = {}
+        chunk_hashes = list(dict.fromkeys(chunk_hashes))
+        with self._lock:
+            # 分批查詢，避免超出SQLite的參數數量上限
+            for start in range(0, len(chunk_hashes), 500):
+                batch = chunk_hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, qa_pairs FROM chunk_results WHERE settings_key = ? "
+                    f"AND chunk_hash IN ({','.join('?' * len(batch))})",
+                    [settings_key, *batch],
+                )
+                results.update((chunk_hash, json.loads(qa_pairs)) for chunk_hash, qa_pairs in rows)
+        return results
+
+    def put_results(self, settings_key, results):
+        """保存 {文本段哈希: QA對列表}"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_results (settings_key, chunk_hash, qa_pairs, updated_at) VALUES (?, ?, ?, ?)",
+                [
+                    (settings_key, chunk_hash, json.dumps(qa_pairs, ensure_ascii=False), now)
+                    for chunk_hash, qa_pairs in results.items()
+                ],
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0],
+                "chunk_results": self._conn.execute("SELECT COUNT(*) FROM chunk_results").fetchone()[0],
+            }
+
+    def clear(self):
+        with self._lock:
+            for table in ("files", "file_chunks", "chunk_results"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def ingest_sources_incremental(sources, store, max_workers=0, options=None):
+    """與 ingest_sources 相同，但內容和分割設定均未變的文件直接復用上次的分割結果"""
+    sources = list(sources)
+    options_key = make_key(asdict(options or ChunkingOptions()))
+    reports = [None] * len(sources)
+    file_hashes = [fingerprint_source(source) for source in sources]
+    pending = []
+    for i, source in enumerate(sources):
+        reports[i] = store.get_file(source.name, file_hashes[i], options_key)
+        if reports[i] is None:
+            pending.append(i)
+    for i, report in zip(pending, ingest_sources([sources[i] for i in pending], max_workers, options)):
+        if not report.error:
+            report.removed_chunks = store.put_file(sources[i].name, file_hashes[i], options_key, report)
+        reports[i] = report
+    return reports
@@ -0,0 +1,396 @@
+import csv
+import functools
+import importlib
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+from tokenization import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Document loaders mapping
+# 載入器可以是類，也可以是 "模塊:類名" 字符串；字符串形式在該擴展名首次使用時才導入
+LOADER_MAPPING = {
+    ".csv": ("langchain_community.document_loaders:CSVLoader", {}),
+    ".doc": ("langchain_community.document_loaders:UnstructuredWordDocumentLoader", {}),
+    ".docx": ("langchain_community.document_loaders:UnstructuredWordDocumentLoader", {}),
+    ".enex": ("langchain_community.document_loaders:EverNoteLoader", {}),
+    ".eml": ("langchain_community.document_loaders:UnstructuredEmailLoader", {}),
+    ".epub": ("langchain_community.document_loaders:UnstructuredEPubLoader", {}),
+    ".html": ("langchain_community.document_loaders:UnstructuredHTMLLoader", {}),
+    ".md": ("langchain_community.document_loaders:UnstructuredMarkdownLoader", {}),
+    ".odt": ("langchain_community.document_loaders:UnstructuredODTLoader", {}),
+    ".pdf": ("langchain_community.document_loaders:PyMuPDFLoader", {}),
+    ".ppt": ("langchain_community.document_loaders:UnstructuredPowerPointLoader", {}),
+    ".pptx": ("langchain_community.document_loaders:UnstructuredPowerPointLoader", {}),
+    ".txt": ("langchain_community.document_loaders:TextLoader", {"encoding": "utf8"}),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def import_object(path):
+    """按 "模塊:屬性" 導入對象，結果會被緩存"""
+    module_name, attribute = path.split(":", 1)
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def resolve_loader(ext):
+    """獲取擴展名對應的載入器類和參數，必要時導入載入器模塊"""
+    loader_class, loader_args = LOADER_MAPPING[ext]
+    if isinstance(loader_class, str):
+        loader_class = import_object(loader_class)
+    return loader_class, loader_args
+
+
+def register_loader(ext, loader_class, loader_args=None):
+    """註冊或替換文件載入器：loader_class(file_path, **loader_args) 需返回具有 load() 方法的對象
+
+    進程池以spawn方式啟動，子進程重新導入模塊而不繼承運行時的註冊，因此需在模塊導入時完成註冊，
+    即放在主腳本頂層或其頂層導入的模塊中（子進程會重新執行主腳本的頂層代碼），不要放在 if __name__ == "__main__" 之下。
+    替換內置格式時，該格式的內置內存載入器和流式載入器一併停用，上傳的文件也經臨時文件使用此載入器。
+    """
+    LOADER_MAPPING[ext.lower()] = (loader_class, loader_args or {})
+    IN_MEMORY_LOADERS.pop(ext.lower(), None)
+    LAZY_LOADERS.pop(ext.lower(), None)
+
+
+def register_bytes_loader(ext, loader):
+    """註冊直接從內存內容載入的函數 loader(data, name) -> List[Document]，優先於文件載入器"""
+    IN_MEMORY_LOADERS[ext.lower()] = loader
+    LAZY_LOADERS.pop(ext.lower(), None)
+
+
+def register_lazy_loader(ext, loader):
+    """註冊流式載入函數 loader(file, name) -> Iterator[Document]，file為二進制文件對象，用於流式載入
+
+    上傳文件的非流式載入也改用此函數，替換該格式的內置內存載入器。
+    """
+    LAZY_LOADERS[ext.lower()] = loader
+    IN_MEMORY_LOADERS[ext.lower()] = lambda data, name: list(loader(io.BytesIO(data), name))
+
+
+def supported_extensions():
+    return set(LOADER_MAPPING) | set(IN_MEMORY_LOADERS) | set(LAZY_LOADERS)
+
+
+@dataclass
+class IngestionSource:
+    """待載入的文件：磁盤路徑或內存中的文件內容二選一"""
+
+    name: str
+    path: Optional[str] = None
+    data: Optional[bytes] = None
+
+
+# 優先在段落、句子（含中文標點）處分割
+CHUNK_SEPARATORS = ["\n\n", "\n", "。", "！", "？", "；", ". ", "! ", "? ", "; ", "，", ", ", " ", ""]
+
+
+@dataclass
+class ChunkingOptions:
+    """按token預算分割文本的設定"""
+
+    chunk_tokens: int = 1500
+    chunk_overlap_tokens: int = 100
+    model_name: str = "gpt-4.1-nano"
+
+
+@dataclass
+class IngestionReport:
+    """單個文件的載入結果與耗時"""
+
+    name: str
+    chunks: List[Document] = field(default_factory=list)
+    load_seconds: float = 0.0
+    split_seconds: float = 0.0
+    source_tokens: int = 0
+    chunk_tokens: int = 0
+    error: Optional[str] = None
+    # 增量處理時：文件未變而復用上次的分割結果；文件舊版本中已不存在的文本段數
+    reused: bool = False
+    removed_chunks: int = 0
+    # 流式載入時文本段直接交給生成流程，不保留在報告中，只記錄數量
+    chunk_count: int = 0
+
+    @property
+    def overlap_tokens(self):
+        """重疊部分額外消耗的token數"""
+        return max(0, self.chunk_tokens - self.source_tokens)
+
+
+# 流式讀取純文本時，累積超過此字符數後在下一個空行處切分為新文檔
+TEXT_BLOCK_CHARS = 1000000
+
+
+def load_text_bytes(data, name):
+    """直接從內存載入純文本，與TextLoader輸出一致"""
+    return [Document(page_content=data.decode("utf8"), metadata={"source": name})]
+
+
+def iter_text_stream(file, name):
+    """逐行讀取純文本，較大的文件在空行處切分為多個文檔；小於TEXT_BLOCK_CHARS的文件與TextLoader輸出一致"""
+    block, size, emitted = [], 0, False
+    for line in io.TextIOWrapper(file, encoding="utf8"):
+        block.append(line)
+        size += len(line)
+        # 沒有空行的超大文件在兩倍閾值處強制切分
+        if size >= TEXT_BLOCK_CHARS and (not line.strip() or size >= TEXT_BLOCK_CHARS * 2):
+            yield Document(page_content="".join(block), metadata={"source": name})
+            block, size, emitted = [], 0, True
+    if block or not emitted:
+        yield Document(page_content="".join(block), metadata={"source": name})
+
+
+def format_csv_row(row):
+    """將CSV行格式化為 "列名: 值" 的多行文本，與CSVLoader一致"""
+    return "\n".join(
+        f"{k.strip() if k is not None else k}: "
+        f"{v.strip() if isinstance(v, str) else ','.join(map(str.strip, v)) if isinstance(v, list) else v}"
+        for k, v in row.items()
+    )
+
+
+def iter_csv_stream(file, name):
+    """逐行讀取CSV，每行一個文檔"""
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig", newline=""))
+    for i, row in enumerate(reader):
+        yield Document(page_content=format_csv_row(row), metadata={"source": name, "row": i})
+
+
+def load_csv_bytes(data, name):
+    """直接從內存載入CSV，每行一個文檔，與CSVLoader輸出一致"""
+    return list(iter_csv_stream(io.BytesIO(data), name))
+
+
+def iter_pdf_stream(file, name):
+    """使用PyMuPDF逐頁讀取PDF，每頁一個文檔；磁盤文件直接按路徑打開，不讀入整個文件"""
+    import fitz
+
+    path = getattr(file, "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        pdf = fitz.open(path)
+    else:
+        pdf = fitz.open(stream=file.read(), filetype="pdf")
+    with pdf:
+        for page in pdf:
+            yield Document(
+                page_content=page.get_text(),
+                metadata={"source": name, "page": page.number, "total_pages": len(pdf)},
+            )
+
+
+def load_pdf_bytes(data, name):
+    """使用PyMuPDF直接從內存載入PDF，每頁一個文檔"""
+    return list(iter_pdf_stream(io.BytesIO(data), name))
+
+
+# 可以直接從內存讀取的格式，無需寫入臨時文件
+IN_MEMORY_LOADERS = {
+    ".csv": load_csv_bytes,
+    ".pdf": load_pdf_bytes,
+    ".txt": load_text_bytes,
+}
+
+# 流式載入時逐個產出文檔的格式，其他格式使用文件載入器的 lazy_load()
+LAZY_LOADERS = {
+    ".csv": iter_csv_stream,
+    ".pdf": iter_pdf_stream,
+    ".txt": iter_text_stream,
+}
+
+
+def load_single_document(file_path: str) -> List[Document]:
+    """載入單個文檔"""
+    ext = "." + file_path.rsplit(".", 1)[-1]
+    if ext in LOADER_MAPPING:
+        loader_class, loader_args = resolve_loader(ext)
+        loader = loader_class(file_path, **loader_args)
+        return loader.load()
+    if ext.lower() in IN_MEMORY_LOADERS:
+        with open(file_path, "rb") as f:
+            return IN_MEMORY_LOADERS[ext.lower()](f.read(), file_path)
+    raise ValueError(f"Unsupported file extension '{ext}'")
+
+
+def load_source(source: IngestionSource) -> List[Document]:
+    """載入文件，優先使用內存載入器，否則通過磁盤路徑或臨時文件載入"""
+    ext = os.path.splitext(source.name)[1].lower()
+    if source.path is not None:
+        return load_single_document(source.path)
+    if ext in IN_MEMORY_LOADERS:
+        return IN_MEMORY_LOADERS[ext](source.data, source.name)
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
+        tmp_file.write(source.data)
+        tmp_file_path = tmp_file.name
+    try:
+        return load_single_document(tmp_file_path)
+    finally:
+        os.unlink(tmp_file_path)
+
+
+def iter_source_documents(source: IngestionSource) -> Iterator[Document]:
+    """逐個產出文件中的文檔：優先使用流式載入器，否則使用文件載入器的 lazy_load()"""
+    ext = os.path.splitext(source.name)[1].lower()
+    if ext in LAZY_LOADERS:
+        with open(source.path, "rb") if source.path is not None else io.BytesIO(source.data) as file:
+            yield from LAZY_LOADERS[ext](file, source.name)
+        return
+    if ext not in LOADER_MAPPING or (source.path is None and ext in IN_MEMORY_LOADERS):
+        yield from load_source(source)
+        return
+
+    file_path = source.path
+    if file_path is None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
+            tmp_file.write(source.data)
+            file_path = tmp_file.name
+    try:
+        loader_class, loader_args = resolve_loader(ext)
+        loader = loader_class(file_path, **loader_args)
+        yield from loader.lazy_load() if hasattr(loader, "lazy_load") else loader.load()
+    finally:
+        if source.path is None:
+            os.unlink(file_path)
+
+
+def make_text_splitter(options: Optional[ChunkingOptions] = None):
+    """構建按token預算分割的文本分割器"""
+    # 分割器導入較慢，延遲到第一次分割時
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    options = options or ChunkingOptions()
+    return RecursiveCharacterTextSplitter(
+        chunk_size=options.chunk_tokens,
+        chunk_overlap=options.chunk_overlap_tokens,
+        length_function=functools.partial(count_tokens, model_name=options.model_name),
+        separators=CHUNK_SEPARATORS,
+        keep_separator="end",
+    )
+
+
+def split_documents(documents, options: Optional[ChunkingOptions] = None):
+    """按token預算將文檔分割為文本段"""
+    return make_text_splitter(options).split_documents(documents)
+
+
+def ingest_source(source: IngestionSource, options: Optional[ChunkingOptions] = None) -> IngestionReport:
+    """載入並分割單個文件，在子進程中執行，異常被捕獲到報告中"""
+    options = options or ChunkingOptions()
+    report = IngestionReport(name=source.name)
+    try:
+        start = time.perf_counter()
+        documents = load_source(source)
+        report.load_seconds = time.perf_counter() - start
+        if not documents:
+            report.error = f"文件 {source.name} 處理失敗，請檢查文件格式是否正確。"
+            return report
+
+        start = time.perf_counter()
+        report.chunks = split_documents(documents, options)
+        report.split_seconds = time.perf_counter() - start
+        report.source_tokens = sum(count_tokens(doc.page_content, options.model_name) for doc in documents)
+        report.chunk_tokens = sum(count_tokens(chunk.page_content, options.model_name) for chunk in report.chunks)
+    except Exception as e:
+        report.error = f"處理文件 {source.name} 時發生錯誤: {e}"
+    return report
+
+
+def ingest_sources(sources, max_workers=0, options: Optional[ChunkingOptions] = None):
+    """使用進程池並行載入和分割文件，報告順序與輸入一致
+
+    進程池使用spawn啟動方式，與 work_queue.start_local_workers 一致，避免複製父進程（如Streamlit）的線程狀態。
+    """
+    sources = list(sources)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_workers = min(max_workers, len(sources))
+    if max_workers <= 1:
+        return [ingest_source(source, options) for source in sources]
+
+    reports = []
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(ingest_source, source, options) for source in sources]
+        for source, future in zip(sources, futures):
+            try:
+                reports.append(future.result())
+            except BrokenProcessPool as e:
+                # 子進程崩潰（如載入器段錯誤）時不影響已完成的文件
+                reports.append(IngestionReport(name=source.name, error=f"處理文件 {source.name} 時子進程異常退出: {e}"))
+    return reports
+
+
+def iter_source_chunks(source: IngestionSource, options: Optional[ChunkingOptions] = None, report=None):
+    """逐個文檔載入並分割單個文件，產出文本段；同一時間只有一個文檔在內存中，耗時和token數累計到report"""
+    options = options or ChunkingOptions()
+    report = report if report is not None else IngestionReport(name=source.name)
+    text_splitter = make_text_splitter(options)
+    documents = iter_source_documents(source)
+    loaded = 0
+    while True:
+        start = time.perf_counter()
+        document = next(documents, None)
+        report.load_seconds += time.perf_counter() - start
+        if document is None:
+            break
+        loaded += 1
+        start = time.perf_counter()
+        chunks = text_splitter.split_documents([document])
+        report.split_seconds += time.perf_counter() - start
+        report.source_tokens += count_tokens(document.page_content, options.model_name)
+        for chunk in chunks:
+            report.chunk_tokens += count_tokens(chunk.page_content, options.model_name)
+            report.chunk_count += 1
+            yield chunk
+    if not loaded:
+        report.error = f"文件 {source.name} 處理失敗，請檢查文件格式是否正確。"
+
+
+def stream_chunks(sources, options: Optional[ChunkingOptions] = None, error_handler=None, reports=None):
+    """依次流式載入多個文件並逐個產出文本段，內存佔用與文件大小無關
+
+    每個文件的報告在開始處理時追加到reports；失敗的文件通過error_handler回報後繼續處理下一個。
+    """
+    error_handler = error_handler or logger.error
+    for source in sources:
+        report = IngestionReport(name=source.name)
+        if reports is not None:
+            reports.append(report)
+        try:
+            yield from iter_source_chunks(source, options, report)
+        except Exception as e:
+            report.error = f"處理文件 {source.name} 時發生錯誤: {e}"
+        if report.error:
+            error_handler(report.error)
+
+
+def collect_chunks(reports, error_handler=None):
+    """合併所有文件的文本段，並通過error_handler回報失敗的文件"""
+    error_handler = error_handler or logger.error
+    all_text_chunks = []
+    for report in reports:
+        if report.error:
+            error_handler(report.error)
+        all_text_chunks.extend(report.chunks)
+    return all_text_chunks
+
+
+def process_paths(file_paths, error_handler=None, max_workers=0, options=None):
+    """處理磁盤上的多個文件並生成文本塊"""
+    sources = [IngestionSource(name=file_path, path=file_path) for file_path in file_paths]
+    return collect_chunks(ingest_sources(sources, max_workers, options), error_handler)
+
+
+def process_files(uploaded_files, error_handler=None, max_workers=0, options=None):
+    """處理上傳的多個文件（具有 name 和 getvalue() 的對象）並生成文本塊"""
+    sources = [IngestionSource(name=uploaded_file.name, data=uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    return collect_chunks(ingest_sources(sources, max_workers, options), error_handler)
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import threading
+
+# 默認檢查點目錄，可通過環境變量 SQA_JOURNAL_DIR 覆蓋
+DEFAULT_JOURNAL_DIR = os.environ.get(
+    "SQA_JOURNAL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".qa_jobs"),
+)
+
+
+class JobJournal:
+    """按文本段追加記錄兩階段結果的任務日誌，用於中斷後恢復任務"""
+
+    def __init__(self, job_id, directory=DEFAULT_JOURNAL_DIR):
+        self.job_id = job_id
+        self.path = os.path.join(directory, f"{job_id}.jsonl")
+        self.raw_responses = {}
+        self.qa_results = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @staticmethod
+    def compute_job_id(chunk_texts, settings):
+        """根據所有文本段內容和生成設定計算任務ID，相同文件和設定得到相同ID"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps(settings, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        for text in chunk_texts:
+            digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+        return digest.hexdigest()[:32]
+
+    def load(self):
+        """讀取已有日誌；崩潰時未寫完的最後一行會被截掉，避免之後追加的記錄接在殘行後面"""
+        if not os.path.exists(self.path):
+            return
+        complete_size = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                complete_size += len(line)
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if record.get("stage") == 1:
+                    self.raw_responses[record["chunk_index"]] = record["raw_response"]
+                elif record.get("stage") == 2:
+                    self.qa_results[record["chunk_index"]] = record["qa_pairs"]
+        if complete_size < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(complete_size)
+
+    def _append(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def record_raw_response(self, chunk_index, raw_response):
+        """記錄第一階段的原始響應"""
+        self.raw_responses[chunk_index] = raw_response
+        self._append({"chunk_index": chunk_index, "stage": 1, "raw_response": raw_response})
+
+    def record_qa_pairs(self, chunk_index, qa_pairs):
+        """記錄第二階段的結構化QA對"""
+        self.qa_results[chunk_index] = qa_pairs
+        self._append({"chunk_index": chunk_index, "stage": 2, "qa_pairs": qa_pairs})
+
+    def completed_count(self):
+        """返回已完成兩階段的文本段數量"""
+        return len(self.qa_results)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,335 @@
+"""API調用與流程各階段的指標
+
+記錄每次調用的延遲、token用量（含緩存命中的提示詞token）、finish_reason、重試次數和估算成本，
+可匯總為運行摘要，或以OpenMetrics文本格式通過HTTP端點提供給Prometheus抓取。
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 每百萬token的美元價格：(輸入, 緩存輸入, 輸出)，按模型名稱前綴匹配
+MODEL_PRICES = {
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "o3": (2.00, 0.50, 8.00),
+}
+# Batch API 按半價計費
+BATCH_PRICE_FACTOR = 0.5
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+STAGE_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+METRIC_HELP = {
+    "qa_api_calls": ("counter", "API調用次數"),
+    "qa_api_call_latency_seconds": ("histogram", "API調用延遲（含重試）"),
+    "qa_api_first_token_seconds": ("histogram", "流式調用收到首個token的延遲（含重試）"),
+    "qa_api_tokens": ("counter", "API調用的token用量"),
+    "qa_api_finish_reasons": ("counter", "響應的finish_reason"),
+    "qa_api_retries": ("counter", "可重試錯誤導致的重試次數"),
+    "qa_endpoint_requests": ("counter", "各API端點的請求次數"),
+    "qa_api_cost_usd": ("counter", "按價格表估算的API成本（美元）"),
+    "qa_stage_duration_seconds": ("histogram", "載入、分割和生成各階段的耗時"),
+}
+
+
+def get_model_price(model_name, prices=None):
+    """按模型名稱前綴匹配價格，未知模型返回None"""
+    prices = prices or MODEL_PRICES
+    for prefix in sorted(prices, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return prices[prefix]
+    return None
+
+
+def estimate_cost(model_name, prompt_tokens, completion_tokens, cached_tokens=0, batch=False, prices=None):
+    """估算一次調用的美元成本，未知模型返回0"""
+    price = get_model_price(model_name, prices)
+    if price is None:
+        return 0.0
+    input_price, cached_price, output_price = price
+    cost = (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1_000_000
+    return cost * BATCH_PRICE_FACTOR if batch else cost
+
+
+def extract_usage(usage):
+    """從響應的usage（對象或字典）中提取 (提示詞token, 輸出token, 緩存token)"""
+    if usage is None:
+        return 0, 0, 0
+    if isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), details.get("cached_tokens") or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) if details is not None else None
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached_tokens or 0
+
+
+class Histogram:
+    """固定分桶的直方圖，分位數按桶內線性插值估算"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """線程安全的指標集合；指定parent時每次記錄同時累加到parent（如進程級的全局集合）"""
+
+    def __init__(self, parent=None, prices=None):
+        self.parent = parent
+        self.prices = prices
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1.0, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+        if self.parent is not None:
+            self.parent.inc(name, value, **labels)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+        if self.parent is not None:
+            self.parent.observe(name, value, buckets, **labels)
+
+    def observe_call(self, stage, model, latency=None, usage=None, finish_reason=None, error=None, batch=False):
+        """記錄一次API調用；失敗的調用只記錄次數和延遲"""
+        stage = str(stage)
+        self.inc("qa_api_calls", stage=stage, model=model, status="error" if error is not None else "ok")
+        if latency is not None:
+            self.observe("qa_api_call_latency_seconds", latency, stage=stage)
+        if error is not None:
+            return
+        prompt_tokens, completion_tokens, cached_tokens = extract_usage(usage)
+        self.inc("qa_api_tokens", prompt_tokens, stage=stage, model=model, type="prompt")
+        self.inc("qa_api_tokens", completion_tokens, stage=stage, model=model, type="completion")
+        self.inc("qa_api_tokens", cached_tokens, stage=stage, model=model, type="cached")
+        self.inc("qa_api_finish_reasons", stage=stage, reason=finish_reason or "unknown")
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens, batch, self.prices)
+        self.inc("qa_api_cost_usd", cost, stage=stage, model=model)
+
+    def observe_response(self, stage, model, response, started, batch=False):
+        """從chat completion響應（對象或字典）記錄一次成功的調用"""
+        if isinstance(response, dict):
+            choice = (response.get("choices") or [{}])[0]
+            usage, finish_reason = response.get("usage"), choice.get("finish_reason")
+        else:
+            usage = response.usage
+            finish_reason = response.choices[0].finish_reason if response.choices else None
+        latency = time.perf_counter() - started if started is not None else None
+        self.observe_call(stage, model, latency, usage, finish_reason, batch=batch)
+
+    def observe_retry(self, error):
+        self.inc("qa_api_retries", reason=type(error).__name__)
+
+    def observe_stage(self, stage, seconds):
+        self.observe("qa_stage_duration_seconds", seconds, STAGE_BUCKETS, stage=stage)
+
+    @contextmanager
+    def time_stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start)
+
+    def observe_ingestion(self, reports):
+        """記錄每個文件的載入和分割耗時"""
+        for report in reports:
+            self.observe_stage("load", report.load_seconds)
+            self.observe_stage("split", report.split_seconds)
+
+    def counter_snapshot(self):
+        """全部計數器的副本 {(名稱, 標籤): 值}，用於計算一段時間內的增量"""
+        with self._lock:
+            return dict(self.counters)
+
+    def merge_counters(self, counters):
+        """累加其他進程記錄的計數器（如隊列worker的用量），只有計數器、沒有延遲分佈"""
+        for (name, labels), value in counters.items():
+            self.inc(name, value, **dict(labels))
+
+    def _sum_counter(self, name, **filters):
+        with self._lock:
+            items = list(self.counters.items())
+        return sum(
+            value for (metric, labels), value in items
+            if metric == name and all(dict(labels).get(k) == v for k, v in filters.items())
+        )
+
+    def _group_counter(self, name, label, **filters):
+        groups = {}
+        with self._lock:
+            items = list(self.counters.items())
+        for (metric, labels), value in items:
+            labels = dict(labels)
+            if metric == name and all(labels.get(k) == v for k, v in filters.items()):
+                groups[labels[label]] = groups.get(labels[label], 0.0) + value
+        return groups
+
+    def spent(self):
+        """累計消耗的token數（提示詞加輸出）和估算成本"""
+        tokens = self._sum_counter("qa_api_tokens", type="prompt") + self._sum_counter("qa_api_tokens", type="completion")
+        return int(tokens), self._sum_counter("qa_api_cost_usd")
+
+    def summary(self):
+        """匯總為可寫入JSON的運行摘要"""
+        calls = {}
+        with self._lock:
+            histograms = dict(self.histograms)
+        for stage in sorted(self._group_counter("qa_api_calls", "stage")):
+            item = {
+                "calls": int(self._sum_counter("qa_api_calls", stage=stage)),
+                "errors": int(self._sum_counter("qa_api_calls", stage=stage, status="error")),
+            }
+            # 批量模式的調用沒有單次延遲
+            histogram = histograms.get(self._key("qa_api_call_latency_seconds", {"stage": stage}))
+            if histogram is not None and histogram.count:
+                item.update(
+                    latency_mean=round(histogram.sum / histogram.count, 4),
+                    latency_p50=round(histogram.quantile(0.5), 4),
+                    latency_p95=round(histogram.quantile(0.95), 4),
+                    latency_p99=round(histogram.quantile(0.99), 4),
+                )
+            first_token = histograms.get(self._key("qa_api_first_token_seconds", {"stage": stage}))
+            if first_token is not None and first_token.count:
+                item["first_token_p50"] = round(first_token.quantile(0.5), 4)
+            item["prompt_tokens"] = int(self._sum_counter("qa_api_tokens", stage=stage, type="prompt"))
+            item["cached_tokens"] = int(self._sum_counter("qa_api_tokens", stage=stage, type="cached"))
+            item["completion_tokens"] = int(self._sum_counter("qa_api_tokens", stage=stage, type="completion"))
+            calls[f"stage{stage}"] = item
+        stage_seconds = {
+            dict(labels)["stage"]: round(histogram.sum, 3)
+            for (name, labels), histogram in histograms.items()
+            if name == "qa_stage_duration_seconds"
+        }
+        tokens = {key: int(value) for key, value in self._group_counter("qa_api_tokens", "type").items()}
+        cost_by_model = {key: round(value, 6) for key, value in self._group_counter("qa_api_cost_usd", "model").items()}
+        return {
+            "calls": calls,
+            "tokens": tokens,
+            # 提示詞token中命中服務端前綴緩存的比例
+            "prompt_cache_ratio": round(tokens.get("cached", 0) / tokens["prompt"], 4) if tokens.get("prompt") else 0.0,
+            "finish_reasons": {key: int(value) for key, value in self._group_counter("qa_api_finish_reasons", "reason").items()},
+            "retries": int(self._sum_counter("qa_api_retries")),
+            "estimated_cost_usd": round(sum(cost_by_model.values()), 6),
+            "cost_by_model": cost_by_model,
+            "stage_seconds": stage_seconds,
+        }
+
+    def render_openmetrics(self):
+        """輸出OpenMetrics文本格式"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self.histograms.items()
+            )
+        lines = []
+        written = set()
+
+        def header(name):
+            if name not in written:
+                written.add(name)
+                metric_type, help_text = METRIC_HELP.get(name, ("unknown", ""))
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"# HELP {name} {help_text}")
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}_total{format_labels(labels)} {format_value(value)}")
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            header(name)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + [math.inf], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else format_value(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+def format_value(value):
+    return repr(float(value))
+
+
+# 進程內所有運行共用的全局指標，供HTTP端點輸出
+DEFAULT_REGISTRY = MetricsRegistry()
+
+
+def start_metrics_server(port, host="0.0.0.0", registry=None):
+    """在後台線程提供 /metrics 端點，返回server"""
+    registry = registry or DEFAULT_REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render_openmetrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
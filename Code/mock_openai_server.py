@@ -0,0 +1,387 @@
+"""本地模擬的OpenAI服務，用於離線測試批量模式、並發流水線和性能基準
+
+支持 /v1/chat/completions（含 stream=True 的SSE流式響應）、/v1/models、/v1/files 和 /v1/batches，
+可模擬響應延遲、吞吐上限（超出時返回429）、隨機服務端錯誤以及服務端前綴緩存（usage中的cached_tokens）。示例：
+    python Code/mock_openai_server.py --port 8000 --latency 0.8 --latency-jitter 0.3 --error-rate 0.02
+    python Code/mock_openai_server.py --port 8000 --latency 0.3 --prefill-latency 0.5
+    python Code/qa_cli.py --input ./docs --output qa.json --base-url http://127.0.0.1:8000/v1 --api-key test --batch
+"""
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_QA_RESPONSE = "Q: 這段文本的主題是什麼？\n主題如何理解？\nA: 這段文本介紹了相關概念。\n\n\nQ: 文中提到了哪些細節？\nA: 文中提到了若干具體細節。"
+# 不含Q:/A:標記，本地解析失敗後需要第二階段的JSON轉換
+UNSTRUCTURED_QA_RESPONSE = "問題一：這段文本的主題是什麼？ 回答：這段文本介紹了相關概念。"
+# 合併請求中的分節標記，響應需按分節分別給出問答對
+PACKED_SECTION = re.compile(r"^\[\[SECTION (\d+)\]\]$", re.MULTILINE)
+# 流式響應每個事件包含的字符數
+STREAM_PIECE_CHARS = 8
+# 模擬的token數按每2個字符1個token估算；前綴緩存以16個token為一塊（與vLLM的默認塊大小一致）
+CHARS_PER_TOKEN = 2
+PROMPT_CACHE_BLOCK_TOKENS = 16
+PROMPT_CACHE_MAX_BLOCKS = 1000000
+CANNED_JSON_RESPONSE = json.dumps(
+    [
+        {"question": "這段文本的主題是什麼？", "answer": "這段文本介紹了相關概念。"},
+        {"question": "主題如何理解？", "answer": "這段文本介紹了相關概念。"},
+    ],
+    ensure_ascii=False,
+)
+
+
+class MockOpenAIState:
+    """模擬服務的設定與內存中的文件和批量任務"""
+
+    def __init__(
+        self,
+        unstructured_rate=0.0,
+        batch_delay=0.5,
+        latency=0.0,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        max_rps=0.0,
+        qa_response=CANNED_QA_RESPONSE,
+        prompt_cache=True,
+        prefill_latency=0.0,
+        seed=None,
+    ):
+        self.unstructured_rate = unstructured_rate
+        self.batch_delay = batch_delay
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.qa_response = qa_response
+        self.prompt_cache = prompt_cache
+        # 每千個未命中緩存的提示詞token額外增加的延遲秒數
+        self.prefill_latency = prefill_latency
+        self.random = random.Random(seed)
+        self.files = {}
+        self.batches = {}
+        self.request_count = 0
+        self.error_count = 0
+        self.throttled_count = 0
+        self._recent_requests = deque()
+        self._prefix_blocks = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def service_delay(self):
+        """本次請求的模擬延遲秒數"""
+        with self._lock:
+            jitter = self.random.uniform(-self.latency_jitter, self.latency_jitter) if self.latency_jitter else 0.0
+        return max(0.0, self.latency + jitter)
+
+    def check_failure(self):
+        """按吞吐上限和錯誤率決定是否模擬失敗，返回 (狀態碼, 錯誤信息, 響應頭) 或None"""
+        with self._lock:
+            if self.max_rps:
+                now = time.monotonic()
+                while self._recent_requests and now - self._recent_requests[0] >= 1.0:
+                    self._recent_requests.popleft()
+                if len(self._recent_requests) >= self.max_rps:
+                    self.throttled_count += 1
+                    retry_after_ms = int((1.0 - (now - self._recent_requests[0])) * 1000) + 1
+                    return 429, "Rate limit reached", {"retry-after-ms": str(retry_after_ms)}
+                self._recent_requests.append(now)
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.error_count += 1
+                return 500, "The server had an error while processing your request.", {}
+        return None
+
+    def cached_prompt_tokens(self, messages):
+        """模擬服務端前綴緩存：返回與之前的請求相同的最長前綴（按塊計）的token數，並緩存本次請求的前綴"""
+        if not self.prompt_cache:
+            return 0
+        text = "".join(f"{m.get('role', '')}\n{m.get('content', '')}\n" for m in messages)
+        block_chars = PROMPT_CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha256()
+        keys = []
+        for start in range(0, len(text) - block_chars + 1, block_chars):
+            digest.update(text[start:start + block_chars].encode("utf-8"))
+            keys.append(digest.digest())
+        with self._lock:
+            cached_blocks = 0
+            while cached_blocks < len(keys) and keys[cached_blocks] in self._prefix_blocks:
+                cached_blocks += 1
+            if len(self._prefix_blocks) > PROMPT_CACHE_MAX_BLOCKS:
+                self._prefix_blocks.clear()
+            self._prefix_blocks.update(keys[cached_blocks:])
+        return cached_blocks * PROMPT_CACHE_BLOCK_TOKENS
+
+    def prefill_delay(self, usage):
+        """按未命中緩存的提示詞token數計算的額外延遲"""
+        cached_tokens = usage.get("prompt_tokens_details", {}).get("cached_tokens", 0)
+        return self.prefill_latency * (usage["prompt_tokens"] - cached_tokens) / 1000
+
+    def next_id(self, prefix):
+        with self._lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def chat_completion(self, body):
+        """根據系統提示詞判斷是QA生成還是JSON轉換，返回固定的響應"""
+        with self._lock:
+            self.request_count += 1
+            unstructured = self.random.random() < self.unstructured_rate
+        messages = body.get("messages", [])
+        is_json_conversion = any(m.get("role") == "system" and "JSON" in m.get("content", "") for m in messages)
+        if is_json_conversion:
+            content = CANNED_JSON_RESPONSE
+        else:
+            content = UNSTRUCTURED_QA_RESPONSE if unstructured else self.qa_response
+            sections = PACKED_SECTION.findall(messages[-1].get("content", "")) if messages else []
+            if sections:
+                content = "\n\n\n".join(f"[[SECTION {number}]]\n{content}" for number in sections)
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // CHARS_PER_TOKEN
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        cached_tokens = min(self.cached_prompt_tokens(messages), prompt_tokens)
+        return {
+            "id": self.next_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+
+    def create_file(self, filename, purpose, content):
+        file_id = self.next_id("file")
+        self.files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "content": content,
+        }
+        return self.file_object(file_id)
+
+    def file_object(self, file_id):
+        return {key: value for key, value in self.files[file_id].items() if key != "content"}
+
+    def create_batch(self, body):
+        batch_id = self.next_id("batch")
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "metadata": body.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        threading.Timer(self.batch_delay, self.run_batch, args=(batch_id,)).start()
+        return self.batches[batch_id]
+
+    def run_batch(self, batch_id):
+        """逐行執行批量任務中的請求並生成輸出文件"""
+        batch = self.batches[batch_id]
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        output_lines = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output_lines.append(json.dumps({
+                "id": self.next_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": self.next_id("req"), "body": self.chat_completion(request["body"])},
+                "error": None,
+            }, ensure_ascii=False))
+        output = ("\n".join(output_lines) + "\n").encode("utf-8")
+        batch["output_file_id"] = self.create_file(f"{batch_id}_output.jsonl", "batch_output", output)["id"]
+        batch["request_counts"] = {"total": len(output_lines), "completed": len(output_lines), "failed": 0}
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+
+def parse_multipart(content_type, body):
+    """解析multipart/form-data，返回 {字段名: (文件名, 內容)}"""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        fields[part.get_param("name", header="content-disposition")] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+def make_handler(state):
+    class MockOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, payload, status=200, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_event(self, payload):
+            self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        def send_stream(self, completion, delay, include_usage):
+            """以SSE逐段發送響應：首段前等待兩成延遲，其餘延遲分攤到各段之間"""
+            content = completion["choices"][0]["message"]["content"]
+            pieces = [content[i:i + STREAM_PIECE_CHARS] for i in range(0, len(content), STREAM_PIECE_CHARS)] or [""]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            base = {key: completion[key] for key in ("id", "created", "model")}
+            base["object"] = "chat.completion.chunk"
+            time.sleep(delay * 0.2)
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(delay * 0.8 / len(pieces))
+                delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+                self.send_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            self.send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if include_usage:
+                self.send_event({**base, "choices": [], "usage": completion["usage"]})
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def send_not_found(self):
+            self.send_json({"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}}, 404)
+
+        def read_body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            path = self.path.split("?", 1)[0]
+            body = self.read_body()
+            if path == "/v1/chat/completions":
+                failure = state.check_failure()
+                delay = state.service_delay()
+                request = json.loads(body)
+                if failure is not None:
+                    time.sleep(delay)
+                    status, message, headers = failure
+                    error_type = "rate_limit_error" if status == 429 else "server_error"
+                    self.send_json({"error": {"message": message, "type": error_type}}, status, headers)
+                else:
+                    completion = state.chat_completion(request)
+                    delay += state.prefill_delay(completion["usage"])
+                    if request.get("stream"):
+                        include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+                        self.send_stream(completion, delay, include_usage)
+                    else:
+                        time.sleep(delay)
+                        self.send_json(completion)
+            elif path == "/v1/files":
+                fields = parse_multipart(self.headers["Content-Type"], body)
+                filename, content = fields["file"]
+                purpose = fields["purpose"][1].decode("utf-8")
+                self.send_json(state.create_file(filename, purpose, content))
+            elif path == "/v1/batches":
+                self.send_json(state.create_batch(json.loads(body)))
+            else:
+                self.send_not_found()
+
+        def do_GET(self):
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in state.files:
+                data = state.files[parts[2]]["content"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            elif parts[:2] == ["v1", "files"] and len(parts) == 3 and parts[2] in state.files:
+                self.send_json(state.file_object(parts[2]))
+            elif parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in state.batches:
+                self.send_json(state.batches[parts[2]])
+            elif parts == ["v1", "models"]:
+                self.send_json({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+            else:
+                self.send_not_found()
+
+    return MockOpenAIHandler
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    # 高並發壓測時避免連接在監聽隊列中被拒絕
+    request_queue_size = 1024
+
+
+def start_server(host="127.0.0.1", port=0, state=None):
+    """在後台線程啟動模擬服務，返回 (server, base_url)"""
+    state = state or MockOpenAIState()
+    server = MockOpenAIServer((host, port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模擬的OpenAI服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unstructured-rate", type=float, default=0.0, help="返回無Q:/A:標記響應的比例")
+    parser.add_argument("--batch-delay", type=float, default=0.5, help="批量任務完成前的等待秒數")
+    parser.add_argument("--latency", type=float, default=0.0, help="每個請求的平均延遲秒數")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="延遲的隨機波動範圍（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="隨機返回500錯誤的比例")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="每秒請求數上限，超出時返回429，0表示不限制")
+    parser.add_argument("--response-file", help="自定義的Q:/A:格式響應文本文件")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="每千個未命中前綴緩存的提示詞token增加的延遲秒數")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="停用模擬的服務端前綴緩存")
+    args = parser.parse_args(argv)
+
+    qa_response = CANNED_QA_RESPONSE
+    if args.response_file:
+        with open(args.response_file, "r", encoding="utf-8") as f:
+            qa_response = f.read()
+    state = MockOpenAIState(
+        unstructured_rate=args.unstructured_rate,
+        batch_delay=args.batch_delay,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        max_rps=args.max_rps,
+        qa_response=qa_response,
+        prompt_cache=not args.no_prompt_cache,
+        prefill_latency=args.prefill_latency,
+    )
+    server = MockOpenAIServer((args.host, args.port), make_handler(state))
+    print(f"模擬服務已啟動：http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""任務預估
+
+在調用API之前，按文本段的token數預估兩階段的請求數、token用量、成本和耗時，便於在啟動大任務前確認預算。
+輸出token按經驗比例估算，提供已有運行記錄的指標集合時改用實際觀測到的比例和延遲。
+未計入響應緩存、檢查點和增量處理的復用，結果偏保守。
+"""
+import math
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from dedup import dedup_chunks
+from metrics import estimate_cost
+from tokenization import count_tokens
+
+# 第一階段輸出token與提示詞token之比（每段生成數個QA對）
+STAGE1_OUTPUT_RATIO = 0.5
+# JSON格式比Q:/A:文本多出鍵名和引號
+STAGE2_OUTPUT_RATIO = 1.3
+# 本地解析失敗、需要調用LLM轉換為JSON的響應比例
+LOCAL_PARSE_FALLBACK_RATE = 0.1
+# 每條消息的格式開銷token
+MESSAGE_OVERHEAD_TOKENS = 4
+# 服務端提示詞緩存：相同前綴達到1024 token後按128 token的整數倍命中
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+# 沒有運行記錄時的單次請求延遲：固定開銷加輸出token的生成時間
+REQUEST_OVERHEAD_SECONDS = 0.5
+OUTPUT_TOKENS_PER_SECOND = 80.0
+
+
+@dataclass
+class JobPlan:
+    """任務預估結果；seconds為None表示使用Batch API，耗時取決於服務端排隊"""
+
+    chunks: int
+    skipped_chunks: int
+    stage1_calls: int
+    stage2_calls: int
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+    cost_usd: float
+    # 每次請求都用滿max_tokens、且全部響應都需要LLM轉換時的上限
+    max_total_tokens: int
+    max_cost_usd: float
+    seconds: Optional[float]
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self):
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+    def describe(self):
+        """一行文字摘要"""
+        return (
+            f"{self.chunks} 個文本段（去重跳過 {self.skipped_chunks} 個），"
+            f"{self.stage1_calls} 次QA生成請求，約 {self.stage2_calls} 次JSON轉換請求；"
+            f"約 {self.total_tokens:,} tokens（上限 {self.max_total_tokens:,}），"
+            f"估算成本 ${self.cost_usd:.4f}（上限 ${self.max_cost_usd:.4f}），預計耗時 {format_duration(self.seconds)}"
+        )
+
+    def budget_warning(self, config):
+        """預估用量超過設定的預算時返回提示，否則返回None"""
+        if config.budget_usd and self.cost_usd > config.budget_usd:
+            return f"預估成本 ${self.cost_usd:.4f} 超過預算 ${config.budget_usd:.4f}，達到上限後將停止發送新請求"
+        if config.budget_tokens and self.total_tokens > config.budget_tokens:
+            return f"預估用量 {self.total_tokens:,} tokens 超過預算 {config.budget_tokens:,} tokens，達到上限後將停止發送新請求"
+        return None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "取決於Batch API排隊（最長24小時）"
+    if seconds < 60:
+        return f"{seconds:.0f} 秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} 分鐘"
+    return f"{seconds / 3600:.1f} 小時"
+
+
+def count_message_tokens(messages, model_name):
+    return sum(count_tokens(message["content"], model_name) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def cacheable_prefix_tokens(messages, model_name):
+    """首條系統消息中可被服務端提示詞緩存命中的token數"""
+    if len(messages) < 2 or messages[0]["role"] != "system":
+        return 0
+    tokens = count_message_tokens(messages[:1], model_name)
+    if tokens < PROMPT_CACHE_MIN_TOKENS:
+        return 0
+    return tokens // PROMPT_CACHE_INCREMENT * PROMPT_CACHE_INCREMENT
+
+
+def estimate_request_usage(messages, params, stage, batch=False, prices=None):
+    """預估單個請求的 (token數, 成本)：提示詞按實際消息計算，輸出按該階段的經驗比例，上限為max_tokens"""
+    prompt_tokens = count_message_tokens(messages, params["model"])
+    ratio = STAGE1_OUTPUT_RATIO if stage == 1 else STAGE2_OUTPUT_RATIO
+    completion_tokens = min(params["max_tokens"], math.ceil(prompt_tokens * ratio))
+    return prompt_tokens + completion_tokens, estimate_cost(params["model"], prompt_tokens, completion_tokens, 0, batch, prices)
+
+
+def observed_stage(calls, stage):
+    """從運行摘要的各階段調用統計中讀取 (輸出/提示詞token比例, 平均延遲)，沒有記錄時為None"""
+    item = calls.get(f"stage{stage}")
+    if not item or not item.get("prompt_tokens"):
+        return None, None
+    return item["completion_tokens"] / item["prompt_tokens"], item.get("latency_mean")
+
+
+def plan_job(engine, text_chunks, history=None):
+    """按引擎的設定預估處理這些文本段的請求數、token用量、成本和耗時，不調用API
+
+    history 為已有運行記錄的指標集合（如進程級的 DEFAULT_REGISTRY），有記錄時按實際比例和延遲預估。
+    """
+    config = engine.config
+    skipped = 0
+    if config.chunk_dedup:
+        text_chunks, skipped = dedup_chunks(text_chunks, config.dedup_threshold)
+    model, json_model = config.model_name, config.effective_json_model
+    calls = history.summary()["calls"] if history is not None else {}
+    stage1_ratio, stage1_latency = observed_stage(calls, 1)
+    stage2_ratio, stage2_latency = observed_stage(calls, 2)
+    stage1_ratio = stage1_ratio or STAGE1_OUTPUT_RATIO
+    fallback_rate = LOCAL_PARSE_FALLBACK_RATE if config.use_local_parser else 1.0
+    if config.use_local_parser and calls.get("stage1", {}).get("calls"):
+        fallback_rate = min(1.0, calls.get("stage2", {}).get("calls", 0) / calls["stage1"]["calls"])
+
+    # 第一階段：按實際的請求劃分計算提示詞token；不合併時模板開銷只計算一次
+    units = engine.plan_stage1_units(text_chunks)
+    if config.pack_chunks:
+        stage1_prompts = [
+            count_message_tokens(
+                engine.build_packed_qa_messages([text_chunks[index].page_content for index in unit])
+                if len(unit) > 1 else engine.build_qa_messages(text_chunks[unit[0]].page_content),
+                model,
+            )
+            for unit in units
+        ]
+    else:
+        template_tokens = count_message_tokens(engine.build_qa_messages(""), model)
+        stage1_prompts = [template_tokens + count_tokens(chunk.page_content, model) for chunk in text_chunks]
+    stage1_outputs = [min(config.max_tokens, math.ceil(tokens * stage1_ratio)) for tokens in stage1_prompts]
+    stage1_calls = len(units)
+    stage1_prefix = cacheable_prefix_tokens(engine.build_qa_messages(""), model) if config.cache_friendly_prompts else 0
+    stage1_cached = stage1_prefix * max(stage1_calls - 1, 0)
+
+    # 第二階段：本地解析失敗的響應連同JSON系統提示詞一起發送
+    json_messages = engine.get_json_conversion_messages("")
+    json_template_tokens = count_message_tokens(json_messages, json_model)
+    stage2_outputs = [min(config.max_tokens, math.ceil(tokens * (stage2_ratio or STAGE2_OUTPUT_RATIO))) for tokens in stage1_outputs]
+    stage2_calls = round(stage1_calls * fallback_rate)
+    stage2_prompt = round((json_template_tokens * stage1_calls + sum(stage1_outputs)) * fallback_rate)
+    stage2_completion = round(sum(stage2_outputs) * fallback_rate)
+    stage2_prefix = cacheable_prefix_tokens(json_messages, json_model)
+    stage2_cached = stage2_prefix * max(stage2_calls - 1, 0)
+
+    batch = config.use_batch_api
+    prices = engine.metrics.prices
+    stage1_prompt = sum(stage1_prompts)
+    cost = (
+        estimate_cost(model, stage1_prompt, sum(stage1_outputs), stage1_cached, batch, prices)
+        + estimate_cost(json_model, stage2_prompt, stage2_completion, stage2_cached, batch, prices)
+    )
+    # 上限：每次請求都用滿max_tokens，且每個響應都需要LLM轉換
+    worst_output = config.max_tokens * stage1_calls
+    worst_stage2_prompt = (json_template_tokens + config.max_tokens) * stage1_calls
+    max_cost = (
+        estimate_cost(model, stage1_prompt, worst_output, stage1_cached, batch, prices)
+        + estimate_cost(json_model, worst_stage2_prompt, worst_output, stage2_prefix * max(stage1_calls - 1, 0), batch, prices)
+    )
+
+    seconds = None
+    if not batch and stage1_calls:
+        stage1_latency = stage1_latency or REQUEST_OVERHEAD_SECONDS + sum(stage1_outputs) / stage1_calls / OUTPUT_TOKENS_PER_SECOND
+        seconds = stage1_calls * stage1_latency / max(1, int(config.concurrency))
+        if stage2_calls:
+            # 第二階段與第一階段流水線並行，最後一批轉換在第一階段結束後完成
+            stage2_latency = stage2_latency or REQUEST_OVERHEAD_SECONDS + sum(stage2_outputs) / stage1_calls / OUTPUT_TOKENS_PER_SECOND
+            seconds = max(seconds, stage2_calls * stage2_latency / max(1, int(config.json_concurrency))) + stage2_latency
+        total_calls = stage1_calls + stage2_calls
+        if config.rpm_limit:
+            seconds = max(seconds, total_calls / config.rpm_limit * 60)
+        if config.tpm_limit:
+            # 調度器按提示詞token加max_tokens預留TPM額度
+            reserved = stage1_prompt + stage2_prompt + total_calls * config.max_tokens
+            seconds = max(seconds, reserved / config.tpm_limit * 60)
+
+    return JobPlan(
+        chunks=len(text_chunks),
+        skipped_chunks=skipped,
+        stage1_calls=stage1_calls,
+        stage2_calls=stage2_calls,
+        prompt_tokens=stage1_prompt + stage2_prompt,
+        cached_tokens=stage1_cached + stage2_cached,
+        completion_tokens=sum(stage1_outputs) + stage2_completion,
+        cost_usd=round(cost, 6),
+        max_total_tokens=stage1_prompt + worst_output + worst_stage2_prompt + worst_output,
+        max_cost_usd=round(max_cost, 6),
+        seconds=seconds,
+    )
@@ -0,0 +1,399 @@
+"""無界面批量生成QA對
+
+示例：
+    python Code/qa_cli.py --input ./docs --output qa_pairs.json
+    python Code/qa_cli.py --input "./docs/**/*.pdf" --output sft.json --format sft --config settings.json
+    python Code/qa_cli.py --input ./docs --output ./qa_parquet --format parquet
+    python Code/qa_cli.py --input ./docs --output qa_pairs.json --batch --batch-poll-interval 60
+    python Code/qa_cli.py --input ./docs --output qa_pairs.json --endpoint http://gpu1:8000/v1,EMPTY,2 --endpoint http://gpu2:8000/v1,EMPTY
+    python Code/qa_cli.py --input ./docs --output qa_pairs.json --queue /shared/jobs.sqlite3 --queue-workers 4
+    python Code/qa_cli.py --input ./huge_corpus --output qa.jsonl --format jsonl --streaming-ingest
+    python Code/qa_cli.py --input ./docs --output qa_pairs.json --plan
+    python Code/qa_cli.py --input ./docs --output qa_pairs.json --budget-usd 5
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+from client_pool import parse_endpoint_spec
+from exporters import DEFAULT_ROWS_PER_SHARD, export_jsonl, export_parquet, export_sft_jsonl
+from grounding import GROUNDING_MODES
+from incremental import ingest_sources_incremental
+from ingestion import IngestionSource, collect_chunks, ingest_sources, stream_chunks, supported_extensions
+from metrics import DEFAULT_REGISTRY, MetricsRegistry, start_metrics_server
+from planner import plan_job
+from qa_engine import (
+    DEFAULT_SFT_SYSTEM_PROMPT,
+    EngineConfig,
+    QAEngine,
+    build_json_export,
+    build_sft_export,
+)
+from work_queue import (
+    WORKER_ACTIVE_SECONDS, WorkQueue, collect_job_results, start_local_workers, submit_job, wait_for_job
+)
+
+logger = logging.getLogger("qa_cli")
+
+
+def collect_input_files(patterns):
+    """展開輸入目錄或glob模式，返回受支持的文件列表"""
+    file_paths = []
+    extensions = supported_extensions()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "**", "*"), recursive=True)
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        for path in sorted(matches):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in extensions:
+                file_paths.append(path)
+    # 去重並保持順序
+    return list(dict.fromkeys(file_paths))
+
+
+def build_config(args):
+    """合併配置文件、環境變量和命令行參數，後者優先"""
+    values = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            values.update(json.load(f))
+    if os.environ.get("OPENAI_API_KEY"):
+        values.setdefault("api_key", os.environ["OPENAI_API_KEY"])
+    if os.environ.get("OPENAI_BASE_URL"):
+        values.setdefault("base_url", os.environ["OPENAI_BASE_URL"])
+
+    overrides = {
+        "api_key": args.api_key,
+        "base_url": args.base_url,
+        "model_name": args.model,
+        "json_model_name": args.json_model,
+        "max_tokens": args.max_tokens,
+        "concurrency": args.concurrency,
+        "json_concurrency": args.json_concurrency,
+        "ingest_workers": args.ingest_workers,
+        "rpm_limit": args.rpm_limit,
+        "tpm_limit": args.tpm_limit,
+        "max_retries": args.max_retries,
+        "chunk_tokens": args.chunk_tokens,
+        "chunk_overlap_tokens": args.chunk_overlap_tokens,
+        "dedup_threshold": args.dedup_threshold,
+        "grounding_threshold": args.grounding_threshold,
+        "grounding_mode": args.grounding_mode,
+        "batch_poll_interval": args.batch_poll_interval,
+        "pack_max_chunks": args.pack_max_chunks,
+        "metrics_port": args.metrics_port,
+        "budget_tokens": args.budget_tokens,
+        "budget_usd": args.budget_usd,
+    }
+    values.update({key: value for key, value in overrides.items() if value is not None})
+    if args.no_cache:
+        values["use_cache"] = False
+    if args.no_dedup:
+        values["chunk_dedup"] = False
+        values["qa_dedup"] = False
+    if args.no_journal:
+        values["use_journal"] = False
+    if args.grounding_check:
+        values["grounding_check"] = True
+    if args.incremental:
+        values["incremental"] = True
+    if args.streaming_ingest:
+        values["streaming_ingest"] = True
+    if args.batch:
+        values["use_batch_api"] = True
+    if args.pack:
+        values["pack_chunks"] = True
+    if args.stream:
+        values["stream_responses"] = True
+    if args.cache_friendly_prompts:
+        values["cache_friendly_prompts"] = True
+    if args.endpoint:
+        values["endpoints"] = [parse_endpoint_spec(spec) for spec in args.endpoint]
+    return EngineConfig.from_dict(values)
+
+
+def write_output(path, content):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def sidecar_path(args, suffix):
+    """與輸出放在一起的附屬文件路徑，如 qa.json -> qa.metrics.json；parquet格式放在輸出目錄內"""
+    if args.format == "parquet":
+        return os.path.join(args.output, suffix)
+    return f"{os.path.splitext(args.output)[0]}.{suffix}"
+
+
+def run_queue_job(args, config, text_chunks, run_metrics):
+    """將文本段提交到任務隊列，啟動本機worker並等待全部任務完成，返回 (QA對列表, 統計, 失敗記錄)
+
+    各worker在本次運行期間記錄的調用次數、token和成本匯總到run_metrics。
+    """
+    if config.use_batch_api or config.incremental:
+        logger.warning("隊列模式不使用Batch API，也不復用增量處理的結果")
+    queue = WorkQueue(args.queue)
+    try:
+        job_id, skipped = submit_job(queue, config, text_chunks)
+        logger.info("任務 %s 已提交到隊列 %s", job_id[:8], args.queue)
+        counters_before = queue.job_metrics(job_id)
+        processes = start_local_workers(args.queue, config, args.queue_workers, job_id, args.lease_seconds)
+        if not processes:
+            logger.info("未啟動本機worker，等待其他機器上的 queue_worker.py 處理")
+
+        def log_progress(progress):
+            logger.info(
+                "隊列進度：完成 %d/%d ｜ 處理中 %d ｜ 失敗 %d ｜ 活躍worker %d",
+                progress["done"], progress["total"], progress["leased"], progress["failed"], progress["active_workers"],
+            )
+
+        finished = wait_for_job(queue, job_id, processes, log_progress, poll_interval=5)
+        for process in processes:
+            process.join()
+        qa_pairs, failures = collect_job_results(queue, config, job_id)
+        stats = {"job_id": job_id, "skipped_chunks": skipped, **queue.progress(job_id)}
+        run_metrics.merge_counters({
+            key: value - counters_before.get(key, 0.0) for key, value in queue.job_metrics(job_id).items()
+        })
+        if not finished:
+            logger.error(
+                "%.0f 秒內沒有活躍的worker（本機worker已退出），停止等待；%d 個未完成的文本段保留在隊列中，"
+                "啟動worker後重新運行即可繼續",
+                WORKER_ACTIVE_SECONDS, stats["pending"] + stats["leased"],
+            )
+        if stats["skipped"]:
+            logger.warning("%d 個文本段因任務預算用盡未生成，提高預算後重新運行即可繼續", stats["skipped"])
+    finally:
+        queue.close()
+    return qa_pairs, stats, failures
+
+
+def make_progress_logger():
+    """每5秒最多輸出一次進度"""
+    last_logged = {"time": 0.0}
+
+    def log_progress(stage1_done, stage2_done, total):
+        now = time.monotonic()
+        if now - last_logged["time"] >= 5 or stage2_done == total:
+            last_logged["time"] = now
+            logger.info("第一階段：%d/%d ｜ 第二階段：%d/%d", stage1_done, total, stage2_done, total)
+
+    return log_progress
+
+
+def export_qa_pairs(args, qa_pairs, generated_timestamp):
+    """按輸出格式寫出QA對；qa_pairs可以是迭代器，jsonl/sft-jsonl/parquet格式邊生成邊寫出"""
+    if args.format == "jsonl":
+        qa_count, chunk_count = export_jsonl(qa_pairs, args.output)
+        logger.info("已寫入 %d 條QA記錄和 %d 個文本段", qa_count, chunk_count)
+    elif args.format == "sft-jsonl":
+        export_sft_jsonl(qa_pairs, args.output, args.sft_system_prompt)
+    elif args.format == "parquet":
+        shards = export_parquet(qa_pairs, args.output, args.rows_per_shard, args.sft_system_prompt)
+        logger.info("已寫入分片：%s", {name: len(paths) for name, paths in shards.items()})
+    elif args.format == "sft":
+        write_output(args.output, build_sft_export(list(qa_pairs), args.sft_system_prompt))
+    else:
+        write_output(args.output, build_json_export(list(qa_pairs), generated_timestamp))
+    logger.info("結果已寫入 %s", args.output)
+
+
+def run_streaming(args, config, engine, sources, run_metrics, generated_timestamp):
+    """流式載入模式：文本段邊載入邊生成，QA對邊生成邊寫出"""
+    if args.queue or config.use_batch_api or config.incremental or config.pack_chunks:
+        logger.warning("流式載入模式不支持任務隊列、Batch API、增量處理和合併短文本段，這些設定將被忽略")
+    if args.format in ("json", "sft"):
+        logger.warning("%s 格式需要在內存中保存全部QA對，大數據集請使用 jsonl、sft-jsonl 或 parquet 格式", args.format)
+    reports = []
+    chunk_stream = stream_chunks(sources, config.chunking_options(), logger.error, reports)
+    export_qa_pairs(args, engine.iter_qa_pairs(chunk_stream, make_progress_logger()), generated_timestamp)
+    stats = engine.last_stats
+    run_metrics.observe_ingestion(reports)
+    logger.info(
+        "文件已分割成 %d 個文本段，共 %d tokens，其中重疊部分 %d tokens",
+        sum(report.chunk_count for report in reports),
+        sum(report.chunk_tokens for report in reports),
+        sum(report.overlap_tokens for report in reports),
+    )
+    logger.info("共生成 %d 個QA對，統計：%s", stats["qa_pairs"], json.dumps(stats, ensure_ascii=False))
+    write_run_summary(args, run_metrics, stats, engine.dead_letters, generated_timestamp)
+    return 0 if stats["qa_pairs"] else 1
+
+
+def write_run_summary(args, run_metrics, stats, dead_letters, generated_timestamp):
+    """輸出token用量，寫出指標文件和死信記錄"""
+    metrics_summary = run_metrics.summary()
+    logger.info(
+        "token用量：%s，提示詞緩存命中率 %.1f%%，估算成本 $%.4f",
+        json.dumps(metrics_summary["tokens"]),
+        metrics_summary["prompt_cache_ratio"] * 100,
+        metrics_summary["estimated_cost_usd"],
+    )
+    write_output(
+        sidecar_path(args, "metrics.json"),
+        json.dumps(
+            {"generated_timestamp": generated_timestamp, "stats": stats, "metrics": metrics_summary},
+            ensure_ascii=False,
+            indent=2,
+        ),
+    )
+
+    if dead_letters:
+        dead_letter_path = sidecar_path(args, "dead_letters.jsonl")
+        write_output(dead_letter_path, "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in dead_letters))
+        logger.warning("%d 個請求在重試後仍失敗，記錄已寫入 %s", len(dead_letters), dead_letter_path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="從文檔批量生成QA對")
+    parser.add_argument("--input", "-i", action="append", required=True, help="輸入目錄或glob模式，可重複指定")
+    parser.add_argument("--output", "-o", required=True, help="輸出文件路徑（parquet格式為輸出目錄）")
+    parser.add_argument(
+        "--format",
+        choices=["json", "sft", "jsonl", "sft-jsonl", "parquet"],
+        default="json",
+        help="輸出格式：jsonl/sft-jsonl/parquet 為流式寫出，適合大數據集",
+    )
+    parser.add_argument("--rows-per-shard", type=int, default=DEFAULT_ROWS_PER_SHARD, help="parquet格式每個分片的行數")
+    parser.add_argument("--config", help="JSON配置文件，鍵名與EngineConfig字段一致")
+    parser.add_argument("--api-key", help="API Key，默認讀取 OPENAI_API_KEY")
+    parser.add_argument("--base-url", help="API的基礎URL，默認讀取 OPENAI_BASE_URL")
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        help="API端點 URL[,API Key[,權重]]，可重複指定以在多個端點間分配請求；未指定API Key時使用 --api-key",
+    )
+    parser.add_argument("--model", help="QA生成模型名稱")
+    parser.add_argument("--json-model", help="JSON轉換模型名稱")
+    parser.add_argument("--max-tokens", type=int, help="每次API調用的最大token數")
+    parser.add_argument("--concurrency", type=int, help="第一階段並發請求數")
+    parser.add_argument("--json-concurrency", type=int, help="第二階段並發請求數")
+    parser.add_argument("--rpm-limit", type=int, help="每分鐘請求數上限")
+    parser.add_argument("--tpm-limit", type=int, help="每分鐘token數上限")
+    parser.add_argument("--max-retries", type=int, help="可重試錯誤的最大重試次數")
+    parser.add_argument("--chunk-tokens", type=int, help="每個文本段的token預算")
+    parser.add_argument("--chunk-overlap-tokens", type=int, help="相鄰文本段重疊的token數")
+    parser.add_argument("--ingest-workers", type=int, help="文件載入進程數，0表示使用全部CPU核心")
+    parser.add_argument("--sft-system-prompt", default=DEFAULT_SFT_SYSTEM_PROMPT, help="SFT格式使用的系統提示詞")
+    parser.add_argument("--dedup-threshold", type=float, help="近似重複判定的相似度閾值")
+    parser.add_argument("--no-dedup", action="store_true", help="停用文本段和QA對去重")
+    parser.add_argument(
+        "--grounding-check", action="store_true", help="按答案與來源文本段的字符n-gram重合度剔除或標記無依據的QA對"
+    )
+    parser.add_argument("--grounding-threshold", type=float, help="依據分數閾值（0到1），低於此值視為無依據")
+    parser.add_argument("--grounding-mode", choices=GROUNDING_MODES, help="drop 丟棄無依據的QA對，flag 保留並標記")
+    parser.add_argument("--no-cache", action="store_true", help="停用本地響應緩存")
+    parser.add_argument("--no-journal", action="store_true", help="停用任務檢查點")
+    parser.add_argument(
+        "--incremental", action="store_true", help="按內容哈希增量處理：只為新增或修改的文本段生成QA對，其餘復用上次的結果"
+    )
+    parser.add_argument(
+        "--streaming-ingest",
+        action="store_true",
+        help="流式載入：逐頁/逐行讀取文件並立即生成，內存佔用與語料大小無關；建議搭配 jsonl/sft-jsonl/parquet 格式",
+    )
+    parser.add_argument("--stream", action="store_true", help="以流式方式接收第一階段響應，問答對邊生成邊解析")
+    parser.add_argument(
+        "--cache-friendly-prompts",
+        action="store_true",
+        help="提示詞作為固定的系統消息、文本段作為用戶消息發送，便於服務端提示詞緩存複用相同前綴",
+    )
+    parser.add_argument("--pack", action="store_true", help="將短文本段按token預算合併為一個請求")
+    parser.add_argument("--pack-max-chunks", type=int, help="每個合併請求最多包含的文本段數")
+    parser.add_argument("--batch", action="store_true", help="使用Batch API離線處理（24小時內完成，成本更低）")
+    parser.add_argument("--batch-poll-interval", type=float, help="批量任務的輪詢間隔秒數")
+    parser.add_argument("--queue", help="將文本段提交到此任務隊列文件，由worker進程（可在多台機器上）處理")
+    parser.add_argument("--queue-workers", type=int, default=1, help="隊列模式下在本機啟動的worker進程數，0表示只等待其他worker")
+    parser.add_argument("--lease-seconds", type=float, default=300.0, help="隊列任務的租約時長秒數")
+    parser.add_argument("--metrics-port", type=int, help="運行期間在此端口提供OpenMetrics格式的 /metrics 端點")
+    parser.add_argument("--plan", action="store_true", help="只載入文件並輸出請求數、token用量、成本和耗時的預估，不調用API")
+    parser.add_argument("--budget-tokens", type=int, help="token用量上限（提示詞加輸出），達到後不再發送新請求")
+    parser.add_argument("--budget-usd", type=float, help="估算成本上限（美元），達到後不再發送新請求")
+    parser.add_argument("--verbose", "-v", action="store_true", help="輸出調試日誌")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    if not args.verbose:
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    config = build_config(args)
+    if not args.plan and not all(endpoint["api_key"] for endpoint in config.endpoint_list()):
+        logger.error("請通過 --api-key、--endpoint、配置文件或 OPENAI_API_KEY 設定API Key")
+        return 2
+
+    if config.metrics_port:
+        start_metrics_server(config.metrics_port)
+        logger.info("指標端點：http://0.0.0.0:%d/metrics", config.metrics_port)
+    run_metrics = MetricsRegistry(parent=DEFAULT_REGISTRY)
+
+    file_paths = collect_input_files(args.input)
+    if not file_paths:
+        logger.error("未找到受支持的輸入文件")
+        return 1
+    logger.info("找到 %d 個文件", len(file_paths))
+
+    engine = QAEngine(config, error_handler=logger.error, metrics=run_metrics)
+    sources = [IngestionSource(name=file_path, path=file_path) for file_path in file_paths]
+    generated_timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    if config.streaming_ingest and not args.plan:
+        return run_streaming(args, config, engine, sources, run_metrics, generated_timestamp)
+
+    store = engine.get_incremental_store()
+    if store is not None:
+        reports = ingest_sources_incremental(sources, store, config.ingest_workers, config.chunking_options())
+        logger.info(
+            "增量處理：%d 個文件未變更，%d 個文本段已從修改後的文件中移除",
+            sum(report.reused for report in reports),
+            sum(report.removed_chunks for report in reports),
+        )
+    else:
+        reports = ingest_sources(sources, max_workers=config.ingest_workers, options=config.chunking_options())
+    run_metrics.observe_ingestion(reports)
+    text_chunks = collect_chunks(reports, error_handler=logger.error)
+    if not text_chunks:
+        logger.error("文件處理失敗，未生成任何文本段")
+        return 1
+    logger.info(
+        "文件已分割成 %d 個文本段，共 %d tokens，其中重疊部分 %d tokens",
+        len(text_chunks),
+        sum(report.chunk_tokens for report in reports),
+        sum(report.overlap_tokens for report in reports),
+    )
+
+    plan = plan_job(engine, text_chunks)
+    logger.info("預估：%s", plan.describe())
+    budget_warning = plan.budget_warning(config)
+    if budget_warning:
+        logger.warning(budget_warning)
+    if args.plan:
+        print(json.dumps(plan.to_dict(), ensure_ascii=False, indent=2))
+        return 0
+
+    if args.queue:
+        qa_pairs, stats, dead_letters = run_queue_job(args, config, text_chunks, run_metrics)
+    else:
+        qa_pairs = engine.generate_qa_pairs(text_chunks, make_progress_logger())
+        stats, dead_letters = engine.last_stats, engine.dead_letters
+    logger.info("共生成 %d 個QA對，統計：%s", len(qa_pairs), json.dumps(stats, ensure_ascii=False))
+    export_qa_pairs(args, qa_pairs, generated_timestamp)
+    write_run_summary(args, run_metrics, stats, dead_letters, generated_timestamp)
+    # 隊列模式下等待中止、仍有未完成的文本段時以非零狀態退出
+    if args.queue and stats["pending"] + stats["leased"]:
+        return 1
+    return 0 if qa_pairs else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
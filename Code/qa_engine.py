@@ -0,0 +1,1250 @@
+import asyncio
+import collections
+import json
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Callable, Optional
+
+from batch_mode import BatchJobRunner, make_custom_id, parse_custom_id
+from client_pool import ClientPool
+from chunk_packing import PACKED_INSTRUCTION, build_packed_text, pack_chunk_indices, split_packed_response
+from completion_cache import CompletionCache
+from dedup import NearDuplicateIndex, dedup_chunks, dedup_qa_pairs, qa_dedup_text
+from grounding import filter_ungrounded
+from incremental import IncrementalStore, content_hash, make_key
+from ingestion import ChunkingOptions
+from job_journal import JobJournal
+from metrics import DEFAULT_REGISTRY, MetricsRegistry
+from planner import estimate_request_usage
+from scheduler import RequestScheduler
+from tokenization import count_tokens, fit_chunk_tokens
+
+logger = logging.getLogger(__name__)
+
+# 本地Q/A解析使用的標記（兼容全形冒號、編號及Markdown粗體）
+QA_QUESTION_MARKER = re.compile(r"^\s*(?:\*\*)?Q\s*\d*\s*[:：]\s*(?:\*\*)?\s*", re.MULTILINE)
+QA_ANSWER_MARKER = re.compile(r"^\s*(?:\*\*)?A\s*\d*\s*[:：]\s*(?:\*\*)?\s*", re.MULTILINE)
+QUESTION_SENTENCE = re.compile(r"[^?？]+[?？]")
+# 答案中的段落分隔（空行）和問答對之間的分隔（兩個空行）
+QA_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+QA_PAIR_SEPARATOR = re.compile(r"\n[ \t]*\n[ \t]*\n")
+
+DEFAULT_SFT_SYSTEM_PROMPT = "你是一個有用的AI助手。"
+# 前綴緩存友好的請求佈局中，系統消息裡代替文本段的說明
+QA_TEXT_PLACEHOLDER = "（見下一條用戶消息）"
+
+
+def get_default_qa_prompt():
+    """獲取默認的QA生成提示詞"""
+    return """基於以下給定的文本，生成多組高質量的問答對。請遵循以下指南：
+
+1. 問題部分：
+- 為不同的主題和概念創建多個問答對
+- 每個問題應考慮用戶可能的多種問法，例如：
+- 直接詢問（如"什麼是...？"）
+- 請求確認（如"是否可以說...？"）
+- 尋求解釋（如"請解釋一下...的含義。"）
+- 假設性問題（如"如果...會怎樣？"）
+- 例子請求（如"能否舉個例子說明...？"）
+- 問題應涵蓋文本中的關鍵信息、主要概念和細節，確保不遺漏重要內容。
+
+2. 答案部分：
+- 提供一個全面、信息豐富的答案，涵蓋問題的所有可能角度，確保邏輯連貫。
+- 答案應直接基於給定文本，確保準確性和一致性。
+- 包含相關的細節，如日期、名稱、職位等具體信息，必要時提供背景信息以增強理解。
+
+3. 格式：
+- 使用 "Q:" 標記每個問題的開始
+- 使用 "A:" 標記對應答案的開始
+- 問答對之間用兩個空行分隔
+
+4. 內容要求：
+- 確保問答對緊密圍繞文本主題，避免偏離主題。
+- 避免添加文本中未提及的信息，確保信息的真實性。
+
+給定文本：
+{text_content}
+
+請基於這個文本生成多個問答對。"""
+
+
+def get_default_json_system_prompt():
+    """獲取默認的JSON轉換系統提示詞"""
+    return """你是一個JSON格式轉換專家。將原始問答對文本轉換為標準JSON數組，每個問題必須成為獨立的QA對。
+
+CRITICAL RULES:
+- ONLY output valid JSON array format: [...]
+- SEPARATE each question into individual QA pairs
+- If one "Q:" contains multiple questions, split them into separate objects
+- Each question gets its own JSON object with the same answer
+- NO explanations, comments, or additional text
+- NO markdown code blocks
+
+TASK:
+1. Find all Q: and A: pairs
+2. If Q: contains multiple questions (separated by newlines), create separate QA pairs for each
+3. Each question should be paired with the corresponding answer
+
+EXAMPLE:
+If input has: Q: Question1? Question2? Question3? A: Answer content
+Output: [
+  {"question": "Question1?", "answer": "Answer content"},
+  {"question": "Question2?", "answer": "Answer content"},
+  {"question": "Question3?", "answer": "Answer content"}
+]"""
+
+
+@dataclass
+class EngineConfig:
+    """QA生成引擎的全部設定，字段名與Streamlit session_state中的鍵一致"""
+
+    api_key: str = ""
+    base_url: str = "https://api.openai.com/v1"
+    # 額外的API端點：[{"base_url": ..., "api_key": ..., "weight": ...}]，未設定api_key時使用上面的api_key
+    endpoints: list = field(default_factory=list)
+    endpoint_failure_threshold: int = 3
+    endpoint_cooldown: float = 30.0
+    model_name: str = "gpt-4.1-nano"
+    json_model_name: str = ""
+    temperature: float = 0.1
+    json_temperature: float = 0.1
+    max_tokens: int = 4096
+    concurrency: int = 8
+    json_concurrency: int = 8
+    qa_generation_prompt: str = ""
+    json_system_prompt: str = ""
+    use_local_parser: bool = True
+    use_cache: bool = True
+    cache_bypass: bool = False
+    cache_max_entries: int = 100000
+    cache_max_age_days: int = 30
+    use_journal: bool = True
+    incremental: bool = False
+    # 流式載入：文件邊載入邊生成，內存佔用與語料大小無關
+    streaming_ingest: bool = False
+    ingest_workers: int = 0
+    chunk_tokens: int = 1500
+    chunk_overlap_tokens: int = 100
+    chunk_dedup: bool = True
+    qa_dedup: bool = True
+    dedup_threshold: float = 0.85
+    # 依據檢查：答案與來源文本段的字符n-gram重合度低於閾值時丟棄（drop）或標記（flag）
+    grounding_check: bool = False
+    grounding_threshold: float = 0.3
+    grounding_mode: str = "drop"
+    rpm_limit: int = 0
+    tpm_limit: int = 0
+    max_retries: int = 5
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 60.0
+    stream_responses: bool = False
+    # 提示詞以系統消息發送、文本段作為唯一變化的用戶消息，便於服務端前綴緩存複用
+    cache_friendly_prompts: bool = False
+    pack_chunks: bool = False
+    pack_max_chunks: int = 8
+    use_batch_api: bool = False
+    batch_poll_interval: float = 30.0
+    batch_completion_window: str = "24h"
+    metrics_port: int = 0
+    # 預算上限：本次運行消耗的token數（提示詞加輸出）或估算成本達到上限後不再發送新請求，0表示不限制
+    budget_tokens: int = 0
+    budget_usd: float = 0.0
+    # 覆蓋默認價格表：{模型前綴: [輸入, 緩存輸入, 輸出]}，單位為每百萬token美元
+    model_prices: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.qa_generation_prompt = self.qa_generation_prompt or get_default_qa_prompt()
+        self.json_system_prompt = self.json_system_prompt or get_default_json_system_prompt()
+
+    @classmethod
+    def from_dict(cls, values):
+        """從字典（如session_state或配置文件）構建設定，忽略未知的鍵"""
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in dict(values).items() if key in names and value is not None})
+
+    def to_dict(self):
+        return asdict(self)
+
+    @property
+    def effective_json_model(self):
+        """JSON轉換模型，留空則使用QA生成模型"""
+        return self.json_model_name or self.model_name
+
+    def endpoint_list(self):
+        """全部API端點；設定了 endpoints 時使用其中的端點，否則只有 base_url 一個端點
+
+        端點未設定api_key（或為空字符串）時使用主API Key。
+        """
+        if not self.endpoints:
+            return [{"base_url": self.base_url, "api_key": self.api_key}]
+        return [
+            {**endpoint, "base_url": endpoint.get("base_url") or self.base_url, "api_key": endpoint.get("api_key") or self.api_key}
+            for endpoint in self.endpoints
+        ]
+
+    def chunking_options(self):
+        """根據模型上下文窗口、提示詞長度和輸出預留計算分割設定"""
+        prompt_tokens = count_tokens(self.qa_generation_prompt, self.model_name)
+        chunk_tokens = fit_chunk_tokens(self.chunk_tokens, self.model_name, prompt_tokens, self.max_tokens)
+        return ChunkingOptions(
+            chunk_tokens=chunk_tokens,
+            chunk_overlap_tokens=min(self.chunk_overlap_tokens, chunk_tokens // 2),
+            model_name=self.model_name,
+        )
+
+    def job_settings(self):
+        """獲取影響生成結果的設定，用於區分不同任務"""
+        settings = {
+            "qa_generation_prompt": self.qa_generation_prompt,
+            "json_system_prompt": self.json_system_prompt,
+            "model_name": self.model_name,
+            "json_model_name": self.effective_json_model,
+            "temperature": self.temperature,
+            "json_temperature": self.json_temperature,
+            "max_tokens": self.max_tokens,
+            "use_local_parser": self.use_local_parser,
+        }
+        # 僅在啟用時加入，不影響已有任務的ID
+        if self.cache_friendly_prompts:
+            settings["cache_friendly_prompts"] = True
+        return settings
+
+    def pool_settings(self):
+        """決定客戶端池的設定，未變時引擎可以沿用同一個池"""
+        return self.endpoint_list(), self.max_retries, self.endpoint_failure_threshold, self.endpoint_cooldown
+
+    def cache_settings(self):
+        """決定響應緩存的設定，未變時引擎可以沿用同一個緩存連接"""
+        return self.use_cache, self.cache_max_entries, self.cache_max_age_days
+
+
+def split_questions(question_text):
+    """將一個Q:中的多個問題拆分為獨立問題"""
+    questions = []
+    for line in question_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        # 同一行內以問號分隔的多個問題，僅在整行都由問句組成時拆分
+        sentences = [sentence.strip() for sentence in QUESTION_SENTENCE.findall(line)]
+        if len(sentences) > 1 and "".join(sentences).replace(" ", "") == line.replace(" ", ""):
+            questions.extend(sentences)
+        else:
+            questions.append(line)
+    return questions
+
+
+def parse_raw_qa_locally(raw_response, source_chunk, complete=True):
+    """在本地解析格式良好的Q:/A:文本，無法解析時返回None以回退到LLM轉換
+
+    含有問答以外的文字時同樣返回None，避免說明文字混入答案或被靜默丟棄：第一個Q:之前的前言、
+    答案中兩個空行之後的內容，以及最後一個答案中空行之後的內容（無法區分是答案的下一段還是結尾的附言）。
+    complete為False表示響應尚未結束（流式解析中已完整的問答塊），最後一個答案中的空行按段落處理。
+    """
+    question_markers = list(QA_QUESTION_MARKER.finditer(raw_response))
+    if not question_markers or raw_response[:question_markers[0].start()].strip():
+        return None
+
+    qa_list = []
+    for i, marker in enumerate(question_markers):
+        block_end = question_markers[i + 1].start() if i + 1 < len(question_markers) else len(raw_response)
+        block = raw_response[marker.end():block_end]
+
+        answer_markers = list(QA_ANSWER_MARKER.finditer(block))
+        if len(answer_markers) != 1:
+            return None
+
+        questions = split_questions(block[:answer_markers[0].start()])
+        answer = block[answer_markers[0].end():].strip()
+        if not questions or not answer:
+            return None
+        is_last = complete and i + 1 == len(question_markers)
+        if (QA_PARAGRAPH_BREAK if is_last else QA_PAIR_SEPARATOR).search(answer):
+            return None
+
+        for question in questions:
+            qa_list.append({"question": question, "answer": answer, "source_chunk": source_chunk})
+
+    return qa_list
+
+
+class IncrementalQAParser:
+    """邊接收流式響應邊解析Q:/A:：下一個Q:出現時，前一個問答塊即已完整，解析後通過on_qa_pairs推送
+
+    on_qa_pairs 接收該響應目前為止的全部問答對。某個問答塊無法解析時停止推送，
+    完整響應仍按 parse_raw_qa_locally 的結果（或第二階段的轉換結果）為準。
+    """
+
+    def __init__(self, source_chunk, on_qa_pairs=None):
+        self.source_chunk = source_chunk
+        self.on_qa_pairs = on_qa_pairs
+        self.reset()
+
+    def reset(self):
+        """重試時從頭開始接收"""
+        self.text = ""
+        self.first_token_at = None
+        self.qa_pairs = []
+        self.failed = False
+        self._block_start = None
+        self._scan_from = 0
+
+    def feed(self, delta):
+        self.text += delta
+        for marker in QA_QUESTION_MARKER.finditer(self.text, self._scan_from):
+            if self._block_start is not None and not self.failed:
+                self._parse_block(self.text[self._block_start:marker.start()])
+            self._block_start = marker.start()
+            self._scan_from = marker.end()
+
+    def _parse_block(self, block):
+        qa_pairs = parse_raw_qa_locally(block, self.source_chunk, complete=False)
+        if qa_pairs is None:
+            self.failed = True
+            return
+        self.qa_pairs.extend(qa_pairs)
+        if self.on_qa_pairs is not None:
+            self.on_qa_pairs(list(self.qa_pairs))
+
+
+def parse_json_qa_response(json_response, source_chunk):
+    """從LLM的輸出中解析QA對JSON數組，格式無效時拋出ValueError"""
+    json_response = json_response.strip()
+
+    # 直接解析JSON，不做額外處理
+    start_bracket = json_response.find('[')
+    end_bracket = json_response.rfind(']')
+
+    if start_bracket == -1 or end_bracket == -1:
+        raise ValueError("LLM未返回有效的JSON格式")
+
+    qa_list = json.loads(json_response[start_bracket:end_bracket + 1])
+
+    # 添加source_chunk到每個QA對
+    for qa in qa_list:
+        if isinstance(qa, dict) and 'question' in qa and 'answer' in qa:
+            qa["source_chunk"] = source_chunk
+
+    return qa_list
+
+
+def failure_context_indices(failure_context):
+    """返回失敗上下文涉及的文本段序號列表；合併請求的上下文記錄 chunk_indices，單獨請求記錄 chunk_index"""
+    if failure_context is None:
+        return []
+    if "chunk_indices" in failure_context:
+        return list(failure_context["chunk_indices"])
+    return [failure_context["chunk_index"]]
+
+
+class QAEngine:
+    """不依賴界面的兩階段QA生成引擎，錯誤通過error_handler回報"""
+
+    def __init__(
+        self,
+        config: EngineConfig,
+        error_handler: Optional[Callable[[str], None]] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.config = config
+        self.error_handler = error_handler or logger.error
+        self.metrics = metrics or MetricsRegistry(parent=DEFAULT_REGISTRY)
+        self.apply_model_prices()
+        self.last_stats = {}
+        self.dead_letters = []
+        self.budget_skipped = 0
+        # 因預算上限跳過的文本段序號，這些文本段沒有結果，重新運行時會再次生成
+        self.budget_skipped_chunks = set()
+        # 其他進程（如同一隊列任務的其他worker）已消耗、計入本次預算的 (token數, 成本)
+        self.budget_offset = (0, 0.0)
+        self._budget_base = (0, 0.0)
+        # 進行中請求按預估用量預留的 (token數, 成本) 和請求數；預留釋放時通過 _budget_released 喚醒等待的請求
+        self.budget_reserved = (0, 0.0)
+        self._budget_in_flight = 0
+        self._budget_released = asyncio.Event()
+        # 每次預留前調用的回調，用於與其他進程同步用量並更新 budget_offset（如隊列worker）
+        self.budget_sync = None
+        self.scheduler = None
+        self._pool = None
+        self._cache = None
+        self._incremental_store = None
+
+    def report_error(self, message):
+        self.error_handler(message)
+
+    def apply_model_prices(self):
+        if self.config.model_prices:
+            self.metrics.prices = {prefix: tuple(price) for prefix, price in self.config.model_prices.items()}
+
+    def update_config(self, config, metrics=None):
+        """換用新的設定（和指標集合）；端點設定未變時保留客戶端池及端點狀態，緩存設定未變時保留緩存連接"""
+        old = self.config
+        self.config = config
+        if metrics is not None:
+            self.metrics = metrics
+        self.apply_model_prices()
+        if self._pool is not None:
+            if old.pool_settings() != config.pool_settings():
+                self._pool = None
+            else:
+                self._pool.metrics = self.metrics
+        if self._cache is not None and old.cache_settings() != config.cache_settings():
+            self._cache.close()
+            self._cache = None
+        if not config.incremental:
+            self._incremental_store = None
+
+    @property
+    def has_budget(self):
+        return bool(self.config.budget_tokens or self.config.budget_usd)
+
+    def start_budget(self):
+        """以當前的累計用量為起點計算本次運行的預算"""
+        self._budget_base = self.metrics.spent()
+        self.budget_offset = (0, 0.0)
+        self.budget_skipped = 0
+        self.budget_skipped_chunks = set()
+        self.budget_reserved = (0, 0.0)
+        self._budget_in_flight = 0
+        self._budget_released = asyncio.Event()
+
+    def budget_spent(self):
+        """本次運行已消耗的 (token數, 成本)，含 budget_offset"""
+        tokens, cost = self.metrics.spent()
+        offset_tokens, offset_cost = self.budget_offset
+        return tokens - self._budget_base[0] + offset_tokens, cost - self._budget_base[1] + offset_cost
+
+    def budget_reached(self):
+        """本次運行的用量是否已達預算上限"""
+        if not self.has_budget:
+            return False
+        tokens, cost = self.budget_spent()
+        return bool(
+            (self.config.budget_tokens and tokens >= self.config.budget_tokens)
+            or (self.config.budget_usd and cost >= self.config.budget_usd)
+        )
+
+    def budget_exceeded(self, tokens, cost):
+        """給定的用量是否超過預算上限"""
+        return bool(
+            (self.config.budget_tokens and tokens > self.config.budget_tokens)
+            or (self.config.budget_usd and cost > self.config.budget_usd)
+        )
+
+    def skip_for_budget(self, count=1, chunk_indices=()):
+        """記錄因預算上限跳過的請求，首次跳過時回報一次"""
+        if not self.budget_skipped:
+            tokens, cost = self.budget_spent()
+            self.report_error(f"已達預算上限（已用 {tokens} tokens，估算成本 ${cost:.4f}），停止發送新請求")
+        self.budget_skipped += count
+        self.budget_skipped_chunks.update(chunk_indices)
+
+    async def reserve_budget(self, messages, params, stage, failure_context=None):
+        """發送請求前按預估用量預留預算，返回預留的 (token數, 成本)；超出預算時記錄為跳過並返回None
+
+        已用量、進行中請求的預留與本請求的預估合計超過上限時，先等待進行中的請求完成並按實際用量結算，
+        沒有進行中的請求仍超過上限時才跳過。預估按該階段的經驗輸出比例計算，
+        實際輸出多於預估時用量仍可能超過上限，超出量為進行中請求的實際用量與預估之差。
+        """
+        if not self.has_budget:
+            return (0, 0.0)
+        request_tokens, request_cost = estimate_request_usage(messages, params, stage, prices=self.metrics.prices)
+        while True:
+            if self.budget_sync is not None:
+                self.budget_sync()
+            tokens, cost = self.budget_spent()
+            reserved_tokens, reserved_cost = self.budget_reserved
+            if not self.budget_exceeded(tokens + reserved_tokens + request_tokens, cost + reserved_cost + request_cost):
+                break
+            if not self._budget_in_flight:
+                chunk_indices = failure_context_indices(failure_context)
+                self.skip_for_budget(count=max(1, len(chunk_indices)), chunk_indices=chunk_indices)
+                return None
+            await self._budget_released.wait()
+        self.budget_reserved = (reserved_tokens + request_tokens, reserved_cost + request_cost)
+        self._budget_in_flight += 1
+        return request_tokens, request_cost
+
+    def release_budget(self, reservation):
+        """請求結束後釋放預留（實際用量已計入指標），並喚醒等待預算的請求"""
+        if not self.has_budget:
+            return
+        self._budget_in_flight -= 1
+        if self._budget_in_flight:
+            self.budget_reserved = (self.budget_reserved[0] - reservation[0], self.budget_reserved[1] - reservation[1])
+        else:
+            # 沒有進行中的請求時直接歸零，避免成本的浮點誤差累積
+            self.budget_reserved = (0, 0.0)
+        self._budget_released.set()
+        self._budget_released = asyncio.Event()
+
+    def fit_batch_budget(self, requests, stage):
+        """提交Batch API任務前按預估用量檢查預算，只保留剩餘預算內的請求，其餘記錄為跳過
+
+        requests 為 {custom_id: (消息列表, 參數, 緩存鍵)}，按順序保留。
+        """
+        if not self.has_budget or not requests:
+            return requests
+        tokens, cost = self.budget_spent()
+        kept = {}
+        for custom_id, (messages, params, cache_key) in requests.items():
+            request_tokens, request_cost = estimate_request_usage(messages, params, stage, True, self.metrics.prices)
+            if self.budget_exceeded(tokens + request_tokens, cost + request_cost):
+                break
+            tokens += request_tokens
+            cost += request_cost
+            kept[custom_id] = (messages, params, cache_key)
+        if len(kept) < len(requests):
+            self.skip_for_budget(
+                len(requests) - len(kept), [parse_custom_id(custom_id) for custom_id in requests if custom_id not in kept]
+            )
+        return kept
+
+    @property
+    def pool(self):
+        """全部API端點的客戶端池，首次使用時初始化；端點狀態在同一引擎的多次運行之間保留"""
+        if self._pool is None:
+            self._pool = ClientPool(
+                self.config.endpoint_list(),
+                max_retries=self.config.max_retries,
+                failure_threshold=self.config.endpoint_failure_threshold,
+                cooldown=self.config.endpoint_cooldown,
+                metrics=self.metrics,
+            )
+        return self._pool
+
+    @property
+    def client(self):
+        """第一個端點的同步OpenAI客戶端，用於Batch API等只能在單一端點上進行的操作"""
+        return self.pool.primary.client
+
+    def create_async_client(self):
+        """建立按端點分配請求的異步客戶端，需在事件循環內以 async with 使用；重試由RequestScheduler統一處理"""
+        return self.pool.async_session()
+
+    def create_scheduler(self):
+        return RequestScheduler(
+            rpm_limit=self.config.rpm_limit,
+            tpm_limit=self.config.tpm_limit,
+            max_retries=self.config.max_retries,
+            base_delay=self.config.retry_base_delay,
+            max_delay=self.config.retry_max_delay,
+            on_retry=self.metrics.observe_retry,
+            can_failover=self.pool.has_available_endpoint if len(self.pool.endpoints) > 1 else None,
+        )
+
+    async def _create_completion_async(self, async_client, messages, params, stage=1, stream_parser=None):
+        """通過調度器發送異步請求，按RPM/TPM限速並重試可恢復的錯誤，並記錄指標
+
+        指定 stream_parser 時以流式方式請求，收到的文本逐段交給 stream_parser.feed。
+        """
+        started = time.perf_counter()
+        try:
+            response = await self._schedule_completion_async(async_client, messages, params, stream_parser)
+        except Exception as e:
+            self.metrics.observe_call(stage, params["model"], time.perf_counter() - started, error=e)
+            raise
+        if stream_parser is not None and stream_parser.first_token_at is not None:
+            self.metrics.observe("qa_api_first_token_seconds", stream_parser.first_token_at - started, stage=str(stage))
+        self.metrics.observe_response(stage, params["model"], response, started)
+        return response
+
+    async def _schedule_completion_async(self, async_client, messages, params, stream_parser=None):
+        async def make_request():
+            if stream_parser is None:
+                return await async_client.chat.completions.create(messages=messages, **params)
+            return await self._read_stream_async(async_client, messages, params, stream_parser)
+
+        if self.scheduler is None:
+            self.scheduler = self.create_scheduler()
+        estimated_tokens = 0
+        if self.scheduler.token_bucket is not None:
+            # 服務端按提示詞token加max_tokens計算TPM
+            estimated_tokens = sum(count_tokens(m["content"], params["model"]) for m in messages) + params["max_tokens"]
+        return await self.scheduler.run(make_request, estimated_tokens)
+
+    async def _read_stream_async(self, async_client, messages, params, stream_parser):
+        """讀取流式響應，組裝為與非流式響應相同結構的字典"""
+        stream_parser.reset()
+        stream = await async_client.chat.completions.create(
+            messages=messages, stream=True, stream_options={"include_usage": True}, **params
+        )
+        parts = []
+        usage = None
+        finish_reason = None
+        async for event in stream:
+            if event.usage is not None:
+                usage = event.usage
+            if not event.choices:
+                continue
+            choice = event.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            if choice.delta.content:
+                if not parts:
+                    stream_parser.first_token_at = time.perf_counter()
+                parts.append(choice.delta.content)
+                stream_parser.feed(choice.delta.content)
+        return {
+            "model": params["model"],
+            "choices": [{"message": {"role": "assistant", "content": "".join(parts)}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def record_dead_letter(self, failure_context, error):
+        """記錄重試後仍失敗的文本段，便於之後重新處理"""
+        if failure_context is not None:
+            self.dead_letters.append({**failure_context, "error": f"{type(error).__name__}: {error}"})
+
+    def get_cache(self):
+        """獲取本地響應緩存，未啟用時返回None"""
+        if not self.config.use_cache:
+            return None
+        if self._cache is None:
+            self._cache = CompletionCache(
+                max_entries=self.config.cache_max_entries,
+                max_age_seconds=self.config.cache_max_age_days * 24 * 3600,
+            )
+        self._cache.bypass = self.config.cache_bypass
+        return self._cache
+
+    def get_run_cache(self):
+        """獲取生成時使用的響應緩存，並先淘汰過期和超出條數上限的記錄"""
+        cache = self.get_cache()
+        if cache is not None:
+            cache.evict()
+        return cache
+
+    def get_incremental_store(self):
+        """獲取增量處理存儲，未啟用時返回None"""
+        if not self.config.incremental:
+            return None
+        if self._incremental_store is None:
+            self._incremental_store = IncrementalStore()
+        return self._incremental_store
+
+    def test_connection(self, model_name=None):
+        """測試全部API端點的連接，任一端點失敗時返回False"""
+        try:
+            results = self.pool.test_endpoints(model_name or self.config.model_name)
+        except Exception as e:
+            self.report_error(f"API測試失敗: {e}")
+            return False
+        for name, error in results.items():
+            if error is not None:
+                self.report_error(f"API測試失敗（{name}）: {error}" if len(results) > 1 else f"API測試失敗: {error}")
+        return all(error is None for error in results.values())
+
+    def _completion_params(self, model=None, temperature=None, max_tokens=None):
+        return {
+            "model": model or self.config.model_name,
+            "temperature": temperature if temperature is not None else self.config.temperature,
+            "max_tokens": max_tokens or self.config.max_tokens,
+        }
+
+    def get_json_conversion_messages(self, raw_response):
+        """構建JSON轉換請求的消息列表"""
+        return [
+            {
+                "role": "system",
+                "content": self.config.json_system_prompt
+            },
+            {
+                "role": "user",
+                "content": f"INPUT TEXT:\n{raw_response}\n\nJSON OUTPUT:"
+            }
+        ]
+
+    def get_json_conversion_params(self):
+        """獲取JSON轉換的模型參數，JSON轉換可以使用獨立的模型"""
+        return {
+            "model": self.config.effective_json_model,
+            "temperature": self.config.json_temperature,
+            "max_tokens": self.config.max_tokens,
+            "top_p": 1,
+        }
+
+    def build_qa_prompt(self, text_content):
+        return self.config.qa_generation_prompt.format(text_content=text_content)
+
+    def build_packed_qa_prompt(self, texts):
+        """構建合併多個短文本段的QA生成提示詞，各文本段以編號分節"""
+        return f"{self.build_qa_prompt(build_packed_text(texts))}\n\n{PACKED_INSTRUCTION}"
+
+    def build_qa_messages(self, text_content):
+        """構建QA生成請求的消息列表
+
+        啟用 cache_friendly_prompts 時，提示詞作為固定的系統消息，文本段作為其後唯一變化的用戶消息，
+        所有請求共享相同的前綴，可被服務端的提示詞緩存（OpenAI自動緩存、vLLM前綴緩存）複用。
+        """
+        if not self.config.cache_friendly_prompts:
+            return [{"role": "user", "content": self.build_qa_prompt(text_content)}]
+        return [
+            {"role": "system", "content": self.build_qa_prompt(QA_TEXT_PLACEHOLDER)},
+            {"role": "user", "content": text_content},
+        ]
+
+    def build_packed_qa_messages(self, texts):
+        """構建合併請求的消息列表；前綴緩存佈局下分節說明放在用戶消息中，系統消息與單獨請求相同"""
+        if not self.config.cache_friendly_prompts:
+            return [{"role": "user", "content": self.build_packed_qa_prompt(texts)}]
+        return self.build_qa_messages(f"{build_packed_text(texts)}\n\n{PACKED_INSTRUCTION}")
+
+    def plan_stage1_units(self, text_chunks, journal=None):
+        """劃分第一階段的請求單元；啟用合併時，尚未生成響應的文本段按token預算合併"""
+        if not self.config.pack_chunks:
+            return [[index] for index in range(len(text_chunks))]
+        done = set(journal.qa_results) | set(journal.raw_responses) if journal is not None else set()
+        pending = [index for index in range(len(text_chunks)) if index not in done]
+        token_counts = [count_tokens(text_chunks[index].page_content, self.config.model_name) for index in pending]
+        packs = pack_chunk_indices(token_counts, self.config.chunking_options().chunk_tokens, self.config.pack_max_chunks)
+        return [[index] for index in sorted(done)] + [[pending[position] for position in pack] for pack in packs]
+
+    async def get_completion_async(
+        self, async_client, prompt, model=None, temperature=None, max_tokens=None, failure_context=None, stream_parser=None,
+        response_info=None,
+    ):
+        """異步獲取模型的響應（prompt可以是字符串或消息列表），失敗時記錄到死信列表並返回None；緩存命中時不會調用stream_parser
+
+        傳入response_info字典時寫入響應的finish_reason（緩存命中時不寫入）；因輸出長度上限被截斷的響應不寫入緩存。
+        """
+        params = self._completion_params(model, temperature, max_tokens)
+        messages = prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
+
+        cache = self.get_cache()
+        cache_key = CompletionCache.make_key(messages=messages, **params)
+        if cache is not None:
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+        reservation = await self.reserve_budget(messages, params, 1, failure_context)
+        if reservation is None:
+            return None
+
+        try:
+            response = await self._create_completion_async(async_client, messages, params, stream_parser=stream_parser)
+            if isinstance(response, dict):
+                content, finish_reason = response["choices"][0]["message"]["content"], response["choices"][0]["finish_reason"]
+            else:
+                content, finish_reason = response.choices[0].message.content, response.choices[0].finish_reason
+            if response_info is not None:
+                response_info["finish_reason"] = finish_reason
+            if cache is not None and finish_reason != "length":
+                cache.set(cache_key, content)
+            return content
+        except Exception as e:
+            self.report_error(f"調用API時發生錯誤: {e}")
+            self.record_dead_letter(failure_context, e)
+            return None
+        finally:
+            self.release_budget(reservation)
+
+    async def process_raw_qa_to_json_async(self, async_client, raw_response, source_chunk, failure_context=None):
+        """異步將原始QA響應轉換為結構化的JSON格式，失敗時記錄到死信列表"""
+        try:
+            messages = self.get_json_conversion_messages(raw_response)
+            params = self.get_json_conversion_params()
+
+            cache = self.get_cache()
+            cache_key = CompletionCache.make_key(messages=messages, **params)
+            json_response = cache.get(cache_key) if cache is not None else None
+            if json_response is None:
+                reservation = await self.reserve_budget(messages, params, 2, failure_context)
+                if reservation is None:
+                    return []
+                try:
+                    response = await self._create_completion_async(async_client, messages, params, stage=2)
+                finally:
+                    self.release_budget(reservation)
+                json_response = response.choices[0].message.content
+
+            qa_list = parse_json_qa_response(json_response, source_chunk)
+            if cache is not None and qa_list:
+                cache.set(cache_key, json_response)
+            return qa_list
+        except Exception as e:
+            self.report_error(f"API調用失敗: {e}")
+            self.record_dead_letter(failure_context, e)
+            return []
+
+    async def generate_raw_qa_async(self, async_client, index, chunk, on_qa_pairs=None):
+        """第一階段：為單個文本段生成Q:/A:格式的原始響應；啟用流式輸出時每解析出一個問答塊調用on_qa_pairs"""
+        stream_parser = None
+        if self.config.stream_responses:
+            stream_parser = IncrementalQAParser(chunk.page_content, on_qa_pairs)
+        return await self.get_completion_async(
+            async_client,
+            self.build_qa_messages(chunk.page_content),
+            failure_context={"chunk_index": index, "stage": 1, "source_chunk": chunk.page_content},
+            stream_parser=stream_parser,
+        )
+
+    async def convert_raw_qa_async(self, async_client, index, chunk, raw_response, stats, semaphore):
+        """第二階段：優先在本地解析原始響應，無法解析時在semaphore限制下調用LLM轉換為JSON"""
+        local_qa_pairs = parse_raw_qa_locally(raw_response, chunk.page_content) if self.config.use_local_parser else None
+        if local_qa_pairs is not None:
+            stats["local_parsed"] += 1
+            return local_qa_pairs
+        async with semaphore:
+            qa_pairs = await self.process_raw_qa_to_json_async(
+                async_client,
+                raw_response,
+                chunk.page_content,
+                failure_context={"chunk_index": index, "stage": 2, "source_chunk": chunk.page_content, "raw_response": raw_response},
+            )
+        stats["llm_converted"] += 1
+        return qa_pairs
+
+    def open_job_journal(self, text_chunks):
+        """打開與當前文件和設定對應的任務檢查點日誌"""
+        job_id = JobJournal.compute_job_id([chunk.page_content for chunk in text_chunks], self.config.job_settings())
+        return JobJournal(job_id)
+
+    async def run_qa_pipeline(self, text_chunks, on_progress=None, stats=None, journal=None, on_qa_pairs=None):
+        """流水線執行兩階段生成：每個原始響應完成後立即進入JSON轉換，兩階段各自限制並發數
+
+        on_qa_pairs(文本段序號, 問答對列表) 在文本段的問答對更新時調用，列表為該文本段目前的全部結果；
+        啟用流式輸出時，每解析出一個完整的問答塊就會調用一次。
+        """
+        stage1_semaphore = asyncio.Semaphore(max(1, int(self.config.concurrency)))
+        stage2_semaphore = asyncio.Semaphore(max(1, int(self.config.json_concurrency)))
+        results = [[] for _ in text_chunks]
+        progress = {"stage1": 0, "stage2": 0}
+        stats = stats if stats is not None else {}
+        stats.setdefault("local_parsed", 0)
+        stats.setdefault("llm_converted", 0)
+        stats.setdefault("resumed", 0)
+        started = time.perf_counter()
+
+        def report():
+            if on_progress:
+                on_progress(progress["stage1"], progress["stage2"], len(text_chunks))
+
+        def publish(index, qa_pairs):
+            if qa_pairs and "first_qa_seconds" not in stats:
+                stats["first_qa_seconds"] = round(time.perf_counter() - started, 3)
+            if on_qa_pairs:
+                on_qa_pairs(index, qa_pairs)
+
+        async def convert(index, chunk, raw_response):
+            if raw_response:
+                results[index] = await self.convert_raw_qa_async(
+                    async_client, index, chunk, raw_response, stats, stage2_semaphore
+                )
+                if results[index] and journal is not None:
+                    journal.record_qa_pairs(index, results[index])
+            publish(index, results[index])
+            progress["stage2"] += 1
+            report()
+
+        async def worker(index, chunk):
+            # 已在檢查點中完成的文本段直接恢復
+            if journal is not None and index in journal.qa_results:
+                results[index] = journal.qa_results[index]
+                stats["resumed"] += 1
+                progress["stage1"] += 1
+                progress["stage2"] += 1
+                publish(index, results[index])
+                report()
+                return
+
+            raw_response = journal.raw_responses.get(index) if journal is not None else None
+            if raw_response is None:
+                async with stage1_semaphore:
+                    raw_response = await self.generate_raw_qa_async(
+                        async_client, index, chunk, lambda qa_pairs: publish(index, qa_pairs)
+                    )
+                if raw_response and journal is not None:
+                    journal.record_raw_response(index, raw_response)
+            progress["stage1"] += 1
+            report()
+            await convert(index, chunk, raw_response)
+
+        async def packed_worker(indices):
+            # 多個短文本段共用一個第一階段請求，響應按分節拆回各文本段
+            # 合併請求不使用流式輸出，問答對在分節拆分後推送
+            response_info = {}
+            async with stage1_semaphore:
+                raw_response = await self.get_completion_async(
+                    async_client,
+                    self.build_packed_qa_messages([text_chunks[index].page_content for index in indices]),
+                    failure_context={
+                        "chunk_indices": list(indices),
+                        "stage": 1,
+                        "source_chunks": [text_chunks[index].page_content for index in indices],
+                    },
+                    response_info=response_info,
+                )
+            stats["packed_requests"] += 1
+            if raw_response is None:
+                # 請求失敗（已記錄死信）或因預算跳過（已計入跳過數）時，各文本段不再單獨請求
+                progress["stage1"] += len(indices)
+                await asyncio.gather(*(convert(index, text_chunks[index], None) for index in indices))
+                return
+            # 被截斷的響應中最後一個分節可能不完整，改為單獨請求
+            sections = split_packed_response(raw_response, len(indices), complete=response_info.get("finish_reason") != "length")
+            tasks = []
+            for position, index in enumerate(indices):
+                if position not in sections:
+                    # 響應缺少該分節時改為單獨請求
+                    stats["pack_fallbacks"] += 1
+                    tasks.append(worker(index, text_chunks[index]))
+                    continue
+                stats["packed_chunks"] += 1
+                if journal is not None:
+                    journal.record_raw_response(index, sections[position])
+                progress["stage1"] += 1
+                tasks.append(convert(index, text_chunks[index], sections[position]))
+            report()
+            await asyncio.gather(*tasks)
+
+        units = self.plan_stage1_units(text_chunks, journal)
+        if self.config.pack_chunks:
+            stats.update(packed_requests=0, packed_chunks=0, pack_fallbacks=0)
+        self.scheduler = self.create_scheduler()
+        async with self.create_async_client() as async_client:
+            await asyncio.gather(*(
+                worker(unit[0], text_chunks[unit[0]]) if len(unit) == 1 else packed_worker(unit)
+                for unit in units
+            ))
+        stats["retries"] = self.scheduler.retries
+        stats["rate_limited"] = self.scheduler.rate_limited
+
+        # 按文本段順序合併結果
+        return [qa for chunk_qa_pairs in results for qa in chunk_qa_pairs]
+
+    async def stream_qa_pipeline(self, chunk_iter, on_progress=None, stats=None, window=0):
+        """從文本段迭代器邊讀取邊生成，按讀取順序逐個產出每個文本段的問答對列表
+
+        迭代器在線程中讀取，文件載入與API調用重疊進行；進行中的文本段數以window（默認為並發數的4倍）為上限，
+        內存佔用與語料大小無關。近似重複的文本段在讀取時即被跳過。不支持檢查點、合併請求和增量處理。
+        """
+        window = window or max(1, int(self.config.concurrency)) * 4
+        stage1_semaphore = asyncio.Semaphore(max(1, int(self.config.concurrency)))
+        stage2_semaphore = asyncio.Semaphore(max(1, int(self.config.json_concurrency)))
+        progress = {"read": 0, "stage1": 0, "stage2": 0}
+        stats = stats if stats is not None else {}
+        stats.setdefault("local_parsed", 0)
+        stats.setdefault("llm_converted", 0)
+        dedup_index = None
+        if self.config.chunk_dedup:
+            dedup_index = NearDuplicateIndex(threshold=self.config.dedup_threshold, ngram=5)
+            stats.setdefault("chunks_deduplicated", 0)
+
+        def report():
+            if on_progress:
+                on_progress(progress["stage1"], progress["stage2"], progress["read"])
+
+        async def worker(index, chunk):
+            async with stage1_semaphore:
+                raw_response = await self.generate_raw_qa_async(async_client, index, chunk)
+            progress["stage1"] += 1
+            report()
+            qa_pairs = []
+            if raw_response:
+                qa_pairs = await self.convert_raw_qa_async(async_client, index, chunk, raw_response, stats, stage2_semaphore)
+            progress["stage2"] += 1
+            report()
+            return qa_pairs
+
+        chunk_iter = iter(chunk_iter)
+        pending = collections.deque()
+        self.scheduler = self.create_scheduler()
+        async with self.create_async_client() as async_client:
+            try:
+                while True:
+                    chunk = await asyncio.to_thread(next, chunk_iter, None)
+                    if chunk is None:
+                        break
+                    if dedup_index is not None and dedup_index.add(chunk.page_content) is not None:
+                        stats["chunks_deduplicated"] += 1
+                        continue
+                    pending.append(asyncio.create_task(worker(progress["read"], chunk)))
+                    progress["read"] += 1
+                    # 窗口已滿時等待最早的文本段完成，保證按讀取順序產出
+                    while len(pending) >= window or (pending and pending[0].done()):
+                        yield await pending.popleft()
+                while pending:
+                    yield await pending.popleft()
+            finally:
+                for task in pending:
+                    task.cancel()
+        stats["retries"] = self.scheduler.retries
+        stats["rate_limited"] = self.scheduler.rate_limited
+
+    def apply_grounding_check(self, qa_pairs, stats):
+        """按設定計算依據分數並丟棄或標記低於閾值的QA對，數量累加到 stats"""
+        qa_pairs, below = filter_ungrounded(qa_pairs, self.config.grounding_threshold, self.config.grounding_mode)
+        key = "grounding_dropped" if self.config.grounding_mode == "drop" else "grounding_flagged"
+        stats[key] = stats.get(key, 0) + below
+        return qa_pairs
+
+    def iter_qa_pairs(self, chunk_iter, on_progress=None):
+        """同步迭代流式生成的問答對（已按設定去重），文本段邊載入邊生成；迭代結束後統計信息保存在 last_stats
+
+        消費方處理產出的問答對（如寫入文件）期間，進行中的請求暫停推進。
+        """
+        stats = {}
+        self.dead_letters = []
+        self.start_budget()
+        qa_index = None
+        if self.config.qa_dedup:
+            qa_index = NearDuplicateIndex(threshold=self.config.dedup_threshold, ngram=2)
+            stats["qa_pairs_deduplicated"] = 0
+        cache = self.get_run_cache()
+        cache_hits_before, cache_misses_before = (cache.hits, cache.misses) if cache else (0, 0)
+        qa_count = 0
+        started = time.perf_counter()
+        loop = asyncio.new_event_loop()
+        pipeline = self.stream_qa_pipeline(chunk_iter, on_progress, stats)
+        try:
+            while True:
+                try:
+                    chunk_qa_pairs = loop.run_until_complete(pipeline.__anext__())
+                except StopAsyncIteration:
+                    break
+                if self.config.grounding_check:
+                    chunk_qa_pairs = self.apply_grounding_check(chunk_qa_pairs, stats)
+                for qa in chunk_qa_pairs:
+                    if qa_index is not None and qa_index.add(qa_dedup_text(qa)) is not None:
+                        stats["qa_pairs_deduplicated"] += 1
+                        continue
+                    if not qa_count:
+                        stats["first_qa_seconds"] = round(time.perf_counter() - started, 3)
+                    qa_count += 1
+                    yield qa
+        finally:
+            loop.run_until_complete(pipeline.aclose())
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+            self.metrics.observe_stage("generate", time.perf_counter() - started)
+
+        if cache is not None:
+            stats["cache_hits"] = cache.hits - cache_hits_before
+            stats["cache_misses"] = cache.misses - cache_misses_before
+        if len(self.pool.endpoints) > 1:
+            stats["endpoints"] = self.pool.snapshot()
+        stats["qa_pairs"] = qa_count
+        stats["dead_letters"] = len(self.dead_letters)
+        if self.budget_skipped:
+            stats["budget_skipped"] = self.budget_skipped
+        self.last_stats = stats
+
+    def run_batch_pipeline(self, text_chunks, on_progress=None, stats=None, journal=None):
+        """使用Batch API執行兩階段生成：先批量提交全部QA生成請求，再批量提交本地解析失敗的JSON轉換請求"""
+        stats = stats if stats is not None else {}
+        stats.setdefault("local_parsed", 0)
+        stats.setdefault("llm_converted", 0)
+        stats.setdefault("resumed", 0)
+        total = len(text_chunks)
+        results = [[] for _ in text_chunks]
+        raw_responses = {}
+        cache = self.get_cache()
+
+        def report(stage1_done, stage2_done):
+            if on_progress:
+                on_progress(stage1_done, stage2_done, total)
+
+        def cached_or_request(stage, index, messages, params, requests):
+            cache_key = CompletionCache.make_key(messages=messages, **params)
+            cached_response = cache.get(cache_key) if cache is not None else None
+            if cached_response is None:
+                requests[make_custom_id(stage, index)] = (messages, params, cache_key)
+            return cached_response
+
+        # 第一階段：已完成或已緩存的文本段不再提交
+        stage1_requests = {}
+        for index, chunk in enumerate(text_chunks):
+            if journal is not None and index in journal.qa_results:
+                results[index] = journal.qa_results[index]
+                stats["resumed"] += 1
+                continue
+            raw_response = journal.raw_responses.get(index) if journal is not None else None
+            if raw_response is None:
+                messages = self.build_qa_messages(chunk.page_content)
+                raw_response = cached_or_request(1, index, messages, self._completion_params(), stage1_requests)
+            if raw_response is not None:
+                raw_responses[index] = raw_response
+
+        stage1_requests = self.fit_batch_budget(stage1_requests, stage=1)
+        stage1_base = total - len(stage1_requests)
+        report(stage1_base, stats["resumed"])
+        def record_batch_response(custom_id, body, error):
+            stage = 1 if custom_id.startswith(make_custom_id(1, "")) else 2
+            model = (body or {}).get("model") or (self.config.model_name if stage == 1 else self.config.effective_json_model)
+            if error is not None:
+                self.metrics.observe_call(stage, model, error=error)
+            else:
+                self.metrics.observe_response(stage, model, body, None, batch=True)
+
+        runner = BatchJobRunner(
+            self.client,
+            poll_interval=self.config.batch_poll_interval,
+            completion_window=self.config.batch_completion_window,
+            on_poll=lambda done: report(stage1_base + done, stats["resumed"]),
+            on_response=record_batch_response,
+        )
+        stage1_results = runner.run(
+            ((custom_id, messages, params) for custom_id, (messages, params, _) in stage1_requests.items()),
+            metadata={"stage": "1"},
+        )
+        for custom_id, (content, error) in stage1_results.items():
+            index = parse_custom_id(custom_id)
+            if content:
+                raw_responses[index] = content
+                if cache is not None:
+                    cache.set(stage1_requests[custom_id][2], content)
+                if journal is not None:
+                    journal.record_raw_response(index, content)
+            else:
+                self.report_error(f"批量請求失敗（文本段 {index}）: {error}")
+                self.record_dead_letter(
+                    {"chunk_index": index, "stage": 1, "source_chunk": text_chunks[index].page_content},
+                    RuntimeError(error),
+                )
+        report(total, stats["resumed"])
+
+        # 第二階段：本地解析失敗的響應才需要JSON轉換
+        stage2_requests = {}
+        converted = {}
+        for index in sorted(raw_responses):
+            source_chunk = text_chunks[index].page_content
+            local_qa_pairs = parse_raw_qa_locally(raw_responses[index], source_chunk) if self.config.use_local_parser else None
+            if local_qa_pairs is not None:
+                results[index] = local_qa_pairs
+                stats["local_parsed"] += 1
+                continue
+            messages = self.get_json_conversion_messages(raw_responses[index])
+            json_response = cached_or_request(2, index, messages, self.get_json_conversion_params(), stage2_requests)
+            if json_response is not None:
+                converted[index] = json_response
+        stats["llm_converted"] = len(raw_responses) - stats["local_parsed"]
+        stage2_requests = self.fit_batch_budget(stage2_requests, stage=2)
+
+        stage2_base = total - len(stage2_requests)
+        report(total, stage2_base)
+        runner.on_poll = lambda done: report(total, stage2_base + done)
+        stage2_results = runner.run(
+            ((custom_id, messages, params) for custom_id, (messages, params, _) in stage2_requests.items()),
+            metadata={"stage": "2"},
+        )
+        for custom_id, (content, error) in stage2_results.items():
+            index = parse_custom_id(custom_id)
+            if content:
+                converted[index] = content
+                continue
+            self.report_error(f"批量請求失敗（文本段 {index}）: {error}")
+            self.record_dead_letter(
+                {"chunk_index": index, "stage": 2, "source_chunk": text_chunks[index].page_content, "raw_response": raw_responses[index]},
+                RuntimeError(error),
+            )
+
+        for index, json_response in converted.items():
+            source_chunk = text_chunks[index].page_content
+            try:
+                results[index] = parse_json_qa_response(json_response, source_chunk)
+            except Exception as e:
+                self.report_error(f"API調用失敗: {e}")
+                self.record_dead_letter(
+                    {"chunk_index": index, "stage": 2, "source_chunk": source_chunk, "raw_response": raw_responses[index]},
+                    e,
+                )
+                continue
+            request = stage2_requests.get(make_custom_id(2, index))
+            if cache is not None and request is not None and results[index]:
+                cache.set(request[2], json_response)
+
+        if journal is not None:
+            for index in raw_responses:
+                if results[index]:
+                    journal.record_qa_pairs(index, results[index])
+        report(total, total)
+        stats["batch_requests"] = len(stage1_requests) + len(stage2_requests)
+        return [qa for chunk_qa_pairs in results for qa in chunk_qa_pairs]
+
+    def generate_qa_pairs(self, text_chunks, on_progress=None, on_qa_pairs=None):
+        """同步執行完整的生成流程，統計信息保存在 last_stats"""
+        stats = {}
+        self.dead_letters = []
+        self.start_budget()
+        if self.config.chunk_dedup:
+            text_chunks, stats["chunks_deduplicated"] = dedup_chunks(text_chunks, self.config.dedup_threshold)
+
+        # 增量處理：內容未變的文本段直接復用已保存的QA對，只生成新增或修改的文本段
+        store = self.get_incremental_store()
+        all_chunks = text_chunks
+        if store is not None:
+            settings_key = make_key(self.config.job_settings())
+            chunk_hashes = [content_hash(chunk.page_content) for chunk in all_chunks]
+            stored_results = store.get_results(settings_key, chunk_hashes)
+            text_chunks = [chunk for chunk, chunk_hash in zip(all_chunks, chunk_hashes) if chunk_hash not in stored_results]
+            stats["incremental_reused"] = len(all_chunks) - len(text_chunks)
+            stats["incremental_generated"] = len(text_chunks)
+
+        journal = self.open_job_journal(text_chunks) if self.config.use_journal else None
+
+        cache = self.get_run_cache()
+        cache_hits_before, cache_misses_before = (cache.hits, cache.misses) if cache else (0, 0)
+        try:
+            with self.metrics.time_stage("generate"):
+                if self.config.use_batch_api:
+                    qa_pairs = self.run_batch_pipeline(text_chunks, on_progress, stats, journal)
+                else:
+                    qa_pairs = asyncio.run(self.run_qa_pipeline(text_chunks, on_progress, stats, journal, on_qa_pairs))
+        finally:
+            if journal is not None:
+                journal.close()
+        if store is not None:
+            new_results = {}
+            for qa in qa_pairs:
+                new_results.setdefault(content_hash(qa.get("source_chunk", "")), []).append(qa)
+            store.put_results(settings_key, new_results)
+            # 按文本段順序合併復用和新生成的結果；已不存在的文本段不會出現在結果中
+            qa_pairs = [
+                qa
+                for chunk_hash in dict.fromkeys(chunk_hashes)
+                for qa in stored_results.get(chunk_hash) or new_results.get(chunk_hash, [])
+            ]
+        if cache is not None:
+            stats["cache_hits"] = cache.hits - cache_hits_before
+            stats["cache_misses"] = cache.misses - cache_misses_before
+        # 先剔除無依據的QA對，避免去重時保留的是其中無依據的一條
+        if self.config.grounding_check:
+            qa_pairs = self.apply_grounding_check(qa_pairs, stats)
+        if self.config.qa_dedup:
+            qa_pairs, stats["qa_pairs_deduplicated"] = dedup_qa_pairs(qa_pairs, self.config.dedup_threshold)
+        if len(self.pool.endpoints) > 1:
+            stats["endpoints"] = self.pool.snapshot()
+        stats["dead_letters"] = len(self.dead_letters)
+        if self.budget_skipped:
+            stats["budget_skipped"] = self.budget_skipped
+
+        self.last_stats = stats
+        return qa_pairs
+
+
+def build_json_export(qa_pairs, generated_timestamp=""):
+    """構建標準JSON格式的導出內容"""
+    json_data = {
+        "qa_pairs": qa_pairs,
+        "total_count": len(qa_pairs),
+        "generated_timestamp": generated_timestamp
+    }
+    # 格式化JSON數據以提高可讀性
+    return json.dumps(json_data, ensure_ascii=False, indent=4)
+
+
+def build_sft_export(qa_pairs, system_prompt=DEFAULT_SFT_SYSTEM_PROMPT):
+    """構建SFTTrainer格式的導出內容"""
+    sft_data = []
+    for qa in qa_pairs:
+        sft_entry = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": qa.get('question', '')},
+                {"role": "assistant", "content": qa.get('answer', '')}
+            ]
+        }
+        sft_data.append(sft_entry)
+    return json.dumps(sft_data, ensure_ascii=False, indent=2)
@@ -0,0 +1,37 @@
+def classify_question(question):
+    """按問句開頭粗略判斷問題類型"""
+    question = question.strip()
+    if question.startswith('什麼'):
+        return '什麼'
+    if question.startswith('如何') or question.startswith('怎樣'):
+        return '如何/怎樣'
+    if question.startswith('為什麼'):
+        return '為什麼'
+    if '？' in question:
+        return '其他問句'
+    return '陳述式'
+
+
+class QAPairStats:
+    """逐條累加的QA對統計，界面重繪時直接讀取而無需遍歷全部QA對"""
+
+    def __init__(self, qa_pairs=()):
+        self.total = 0
+        self.question_types = {}
+        self._sources = set()
+        self.extend(qa_pairs)
+
+    def add(self, qa):
+        self.total += 1
+        q_type = classify_question(qa.get('question', ''))
+        self.question_types[q_type] = self.question_types.get(q_type, 0) + 1
+        if 'source_chunk' in qa:
+            self._sources.add(qa['source_chunk'])
+
+    def extend(self, qa_pairs):
+        for qa in qa_pairs:
+            self.add(qa)
+
+    @property
+    def unique_sources(self):
+        return len(self._sources)
@@ -0,0 +1,111 @@
+"""任務隊列worker
+
+從共享的隊列文件租用文本段並執行兩階段生成，可在多台機器上同時運行。生成設定（提示詞、模型等）
+以提交任務時的設定為準，API Key、端點、並發和限速使用本worker的設定。示例：
+    python Code/queue_worker.py --queue /shared/jobs.sqlite3 --api-key sk-... --concurrency 16
+    python Code/queue_worker.py --queue /shared/jobs.sqlite3 --endpoint http://localhost:8000/v1,EMPTY --keep-running
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from client_pool import parse_endpoint_spec
+from metrics import DEFAULT_REGISTRY, MetricsRegistry, start_metrics_server
+from qa_engine import EngineConfig
+from work_queue import DEFAULT_QUEUE_PATH, QueueWorker, WorkQueue
+
+logger = logging.getLogger("queue_worker")
+
+
+def build_config(args):
+    """合併配置文件、環境變量和命令行參數，後者優先"""
+    values = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            values.update(json.load(f))
+    if os.environ.get("OPENAI_API_KEY"):
+        values.setdefault("api_key", os.environ["OPENAI_API_KEY"])
+    if os.environ.get("OPENAI_BASE_URL"):
+        values.setdefault("base_url", os.environ["OPENAI_BASE_URL"])
+    overrides = {
+        "api_key": args.api_key,
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "json_concurrency": args.json_concurrency,
+        "rpm_limit": args.rpm_limit,
+        "tpm_limit": args.tpm_limit,
+        "max_retries": args.max_retries,
+    }
+    values.update({key: value for key, value in overrides.items() if value is not None})
+    if args.endpoint:
+        values["endpoints"] = [parse_endpoint_spec(spec) for spec in args.endpoint]
+    if args.stream:
+        values["stream_responses"] = True
+    if args.no_cache:
+        values["use_cache"] = False
+    return EngineConfig.from_dict(values)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="從任務隊列租用文本段並生成QA對")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="隊列文件路徑")
+    parser.add_argument("--job", help="只處理指定的任務ID")
+    parser.add_argument("--config", help="JSON配置文件，鍵名與EngineConfig字段一致")
+    parser.add_argument("--api-key", help="API Key，默認讀取 OPENAI_API_KEY")
+    parser.add_argument("--base-url", help="API的基礎URL，默認讀取 OPENAI_BASE_URL")
+    parser.add_argument("--endpoint", action="append", help="API端點 URL[,API Key[,權重]]，可重複指定")
+    parser.add_argument("--concurrency", type=int, help="第一階段並發請求數")
+    parser.add_argument("--json-concurrency", type=int, help="第二階段並發請求數")
+    parser.add_argument("--rpm-limit", type=int, help="每分鐘請求數上限")
+    parser.add_argument("--tpm-limit", type=int, help="每分鐘token數上限")
+    parser.add_argument("--max-retries", type=int, help="可重試錯誤的最大重試次數")
+    parser.add_argument("--stream", action="store_true", help="以流式方式接收第一階段響應")
+    parser.add_argument("--no-cache", action="store_true", help="停用本地響應緩存")
+    parser.add_argument("--batch-size", type=int, default=0, help="每次租用的任務數，默認為並發數的兩倍")
+    parser.add_argument("--lease-seconds", type=float, default=300.0, help="租約時長，worker崩潰後任務在此時間後被重新租用")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="隊列為空時的輪詢間隔秒數")
+    parser.add_argument("--keep-running", action="store_true", help="隊列中的任務完成後繼續等待新任務")
+    parser.add_argument("--metrics-port", type=int, help="在此端口提供OpenMetrics格式的 /metrics 端點")
+    parser.add_argument("--verbose", "-v", action="store_true", help="輸出調試日誌")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    if not args.verbose:
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    config = build_config(args)
+    if not all(endpoint["api_key"] for endpoint in config.endpoint_list()):
+        logger.error("請通過 --api-key、--endpoint、配置文件或 OPENAI_API_KEY 設定API Key")
+        return 2
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    worker = QueueWorker(
+        WorkQueue(args.queue),
+        config,
+        batch_size=args.batch_size,
+        lease_seconds=args.lease_seconds,
+        poll_interval=args.poll_interval,
+        metrics=MetricsRegistry(parent=DEFAULT_REGISTRY),
+    )
+    logger.info("worker %s 已啟動，隊列：%s", worker.worker_id, args.queue)
+    try:
+        processed = worker.run(args.job, exit_when_idle=not args.keep_running)
+    except KeyboardInterrupt:
+        # 未完成的任務在租約過期後由其他worker接手
+        logger.info("已停止，租用中的任務將在租約過期後重新分配")
+        return 130
+    logger.info("worker %s 共處理 %d 個文本段", worker.worker_id, processed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import random
+import time
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# 可重試的錯誤：限流、超時、連接失敗和服務端錯誤
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """按每分鐘速率補充的令牌桶，容量決定允許的突發量"""
+
+    def __init__(self, rate_per_minute, burst_seconds=6.0):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate_per_second * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    async def acquire(self, amount=1.0):
+        """等待直到有足夠令牌；超過容量的請求按容量扣減以免永久阻塞"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate_per_second)
+
+
+def get_retry_after(error):
+    """從響應頭讀取服務端建議的等待秒數"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class RequestScheduler:
+    """統一調度API請求：按RPM/TPM限速，對可重試錯誤做帶抖動的指數退避"""
+
+    def __init__(
+        self, rpm_limit=0, tpm_limit=0, max_retries=5, base_delay=1.0, max_delay=60.0, on_retry=None, can_failover=None
+    ):
+        self.request_bucket = TokenBucket(rpm_limit) if rpm_limit else None
+        self.token_bucket = TokenBucket(tpm_limit) if tpm_limit else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_retry = on_retry
+        # 返回True時表示還有其他可用端點，失敗的請求立即在其他端點重試，不做退避和全局暫停
+        self.can_failover = can_failover
+        self.retries = 0
+        self.rate_limited = 0
+        self._paused_until = 0.0
+
+    async def _wait_for_pause(self):
+        # 收到429後所有請求一起暫停，避免其他請求繼續觸發限流
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def backoff_delay(self, attempt, error):
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, make_request, estimated_tokens=0):
+        """執行請求，重試次數用盡或遇到不可重試的錯誤時拋出最後一個異常"""
+        attempt = 0
+        while True:
+            await self._wait_for_pause()
+            if self.request_bucket is not None:
+                await self.request_bucket.acquire(1)
+            if self.token_bucket is not None and estimated_tokens:
+                await self.token_bucket.acquire(estimated_tokens)
+            try:
+                return await make_request()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                if isinstance(e, openai.RateLimitError):
+                    self.rate_limited += 1
+                if self.can_failover is not None and self.can_failover():
+                    delay = 0.0
+                else:
+                    delay = self.backoff_delay(attempt, e)
+                    if isinstance(e, openai.RateLimitError):
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self.retries += 1
+                if self.on_retry is not None:
+                    self.on_retry(e)
+                attempt += 1
+                logger.warning("請求失敗（%s），%.1f 秒後第 %d 次重試", type(e).__name__, delay, attempt)
+                await asyncio.sleep(delay)
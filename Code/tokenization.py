@@ -0,0 +1,78 @@
+import functools
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken為可選依賴，未安裝時使用估算
+    tiktoken = None
+
+# CJK字符（漢字、假名、諺文及全形標點）通常每個字符約佔一個token
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+# 拉丁文字平均每個token約4個字符
+LATIN_CHARS_PER_TOKEN = 4
+
+# 常見模型的上下文窗口（token），未列出的模型使用默認值
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name):
+    """獲取模型對應的tiktoken編碼，不可用時返回None"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning("無法載入tiktoken編碼，改用估算: %s", e)
+            return None
+    except Exception as e:
+        # 離線環境下無法下載編碼文件
+        logger.warning("無法載入tiktoken編碼，改用估算: %s", e)
+        return None
+
+
+def estimate_tokens(text):
+    """按CJK與拉丁字符的平均token密度估算token數"""
+    cjk_count = len(CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / LATIN_CHARS_PER_TOKEN)
+
+
+def count_tokens(text, model_name="gpt-4.1-nano"):
+    """計算文本的token數，優先使用本地tokenizer"""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_context_window(model_name):
+    """按模型名稱前綴匹配上下文窗口大小"""
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def fit_chunk_tokens(chunk_tokens, model_name, prompt_tokens, max_tokens):
+    """將文本段token預算限制在模型上下文窗口內（需扣除提示詞和輸出預留）"""
+    available = get_context_window(model_name) - prompt_tokens - max_tokens
+    return max(1, min(chunk_tokens, available))
@@ -0,0 +1,532 @@
+"""基於SQLite的持久化任務隊列
+
+文本段作為任務寫入隊列文件，任意數量的worker進程（可在多台機器上共享同一隊列文件）租用一批任務，
+執行兩階段生成後寫回結果。租約到期未完成的任務會被其他worker重新租用，因此worker崩潰不會丟失任務。
+示例：
+    python Code/qa_cli.py --input ./docs --output qa.json --queue jobs.sqlite3 --queue-workers 4
+    python Code/queue_worker.py --queue jobs.sqlite3 --api-key sk-...
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from langchain_core.documents import Document
+
+from dedup import dedup_chunks, dedup_qa_pairs
+from grounding import filter_ungrounded
+from job_journal import JobJournal
+from qa_engine import EngineConfig, QAEngine, failure_context_indices
+
+logger = logging.getLogger(__name__)
+
+# 默認隊列位置，可通過環境變量 SQA_QUEUE_PATH 覆蓋
+DEFAULT_QUEUE_PATH = os.environ.get(
+    "SQA_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".qa_jobs", "queue.sqlite3"),
+)
+# 最近這麼多秒內有心跳的worker視為活躍
+WORKER_ACTIVE_SECONDS = 60.0
+# 設定了預算的任務，worker除每次預留預算前同步外，處理期間每隔這麼多秒同步一次用量，所有worker共用同一預算
+BUDGET_SYNC_SECONDS = 0.5
+# 舊版隊列文件中沒有的jobs列
+JOB_BUDGET_COLUMNS = {
+    "budget_tokens": "INTEGER NOT NULL DEFAULT 0",
+    "budget_usd": "REAL NOT NULL DEFAULT 0",
+    "spent_tokens": "INTEGER NOT NULL DEFAULT 0",
+    "spent_usd": "REAL NOT NULL DEFAULT 0",
+}
+
+
+@dataclass
+class QueueTask:
+    job_id: str
+    chunk_index: int
+    chunk: Document
+    attempts: int
+
+
+class WorkQueue:
+    """任務隊列：每個任務對應一個文本段，狀態為 pending → leased → done / failed / skipped
+
+    skipped 表示因任務預算用盡而未生成，重新提交同一任務時放回隊列。
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 多進程共享同一文件，寫鎖衝突時最多等待30秒；事務由代碼顯式控制
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                settings TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in JOB_BUDGET_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tasks (
+                job_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                chunk TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, chunk_index)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, lease_expires)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                processed INTEGER NOT NULL DEFAULT 0,
+                last_seen REAL NOT NULL
+            )"""
+        )
+        # 各worker處理任務時記錄的計數器（調用次數、token、成本等）按任務累加
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS job_metrics (
+                job_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (job_id, name, labels)
+            )"""
+        )
+
+    def _transaction(self, operation):
+        """在 BEGIN IMMEDIATE 事務中執行，保證多個進程之間的租用操作互斥"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def submit(self, job_id, text_chunks, settings, budget_tokens=0, budget_usd=0.0):
+        """寫入任務，返回job_id；相同job_id的任務已存在時不重複寫入，只更新預算並將因預算跳過的任務放回隊列
+
+        預算為整個任務（所有worker合計）的token數和估算成本上限，0表示不限制。
+        """
+        now = time.time()
+
+        def operation(conn):
+            conn.execute(
+                "INSERT INTO jobs (job_id, settings, total, created_at, budget_tokens, budget_usd) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET budget_tokens = excluded.budget_tokens, budget_usd = excluded.budget_usd",
+                (job_id, json.dumps(settings, ensure_ascii=False), len(text_chunks), now, budget_tokens or 0, budget_usd or 0.0),
+            )
+            conn.execute(
+                "UPDATE tasks SET status = 'pending', error = NULL, updated_at = ? WHERE job_id = ? AND status = 'skipped'",
+                (now, job_id),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (job_id, chunk_index, chunk, updated_at) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        job_id,
+                        index,
+                        json.dumps(
+                            {"page_content": chunk.page_content, "metadata": chunk.metadata}, ensure_ascii=False, default=str
+                        ),
+                        now,
+                    )
+                    for index, chunk in enumerate(text_chunks)
+                ],
+            )
+
+        self._transaction(operation)
+        return job_id
+
+    def job_settings(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT settings FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def job_budget(self, job_id):
+        """任務的預算和所有worker已同步的用量"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT budget_tokens, budget_usd, spent_tokens, spent_usd FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(("budget_tokens", "budget_usd", "spent_tokens", "spent_usd"), row or (0, 0.0, 0, 0.0)))
+
+    def add_spent(self, job_id, tokens, cost):
+        """累加任務的用量，返回累加後的 (token數, 成本)"""
+
+        def operation(conn):
+            conn.execute(
+                "UPDATE jobs SET spent_tokens = spent_tokens + ?, spent_usd = spent_usd + ? WHERE job_id = ?",
+                (tokens, cost, job_id),
+            )
+            row = conn.execute("SELECT spent_tokens, spent_usd FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return tuple(row) if row else (0, 0.0)
+
+        return self._transaction(operation)
+
+    def add_metrics(self, job_id, counters):
+        """累加worker記錄的計數器增量 {(名稱, 標籤): 值}"""
+        rows = [(job_id, name, json.dumps(labels, ensure_ascii=False), value) for (name, labels), value in counters.items() if value]
+        if not rows:
+            return
+
+        def operation(conn):
+            conn.executemany(
+                "INSERT INTO job_metrics (job_id, name, labels, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(job_id, name, labels) DO UPDATE SET value = value + excluded.value",
+                rows,
+            )
+
+        self._transaction(operation)
+
+    def job_metrics(self, job_id):
+        """任務目前為止所有worker累計的計數器 {(名稱, 標籤): 值}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, labels, value FROM job_metrics WHERE job_id = ?", (job_id,)).fetchall()
+        return {(name, tuple(tuple(item) for item in json.loads(labels))): value for name, labels, value in rows}
+
+    def lease(self, worker_id, limit, lease_seconds, job_id=None):
+        """租用同一任務中最多limit個待處理或租約已過期的任務；租約多次過期的任務標記為失敗"""
+        now = time.time()
+
+        def operation(conn):
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', error = '租約多次過期，worker可能已崩潰', updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            available = "(status = 'pending' OR (status = 'leased' AND lease_expires < ?))"
+            if job_id is None:
+                row = conn.execute(f"SELECT job_id FROM tasks WHERE {available} ORDER BY rowid LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    return []
+                target_job = row[0]
+            else:
+                target_job = job_id
+            rows = conn.execute(
+                f"SELECT chunk_index, chunk, attempts FROM tasks WHERE job_id = ? AND {available} "
+                "ORDER BY chunk_index LIMIT ?",
+                (target_job, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE job_id = ? AND chunk_index = ?",
+                [(worker_id, now + lease_seconds, now, target_job, row[0]) for row in rows],
+            )
+            tasks = []
+            for chunk_index, chunk, attempts in rows:
+                chunk = json.loads(chunk)
+                document = Document(page_content=chunk["page_content"], metadata=chunk["metadata"])
+                tasks.append(QueueTask(target_job, chunk_index, document, attempts + 1))
+            return tasks
+
+        return self._transaction(operation)
+
+    def renew(self, worker_id, tasks, lease_seconds):
+        """延長仍由該worker持有的租約"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE tasks SET lease_expires = ? WHERE job_id = ? AND chunk_index = ? AND status = 'leased' AND lease_owner = ?",
+                [(now + lease_seconds, task.job_id, task.chunk_index, worker_id) for task in tasks],
+            )
+
+    def complete(self, worker_id, task, qa_pairs):
+        """寫回結果；任務已被其他worker重新租用並完成時忽略"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_owner = NULL, updated_at = ? "
+                "WHERE job_id = ? AND chunk_index = ? AND status != 'done' AND (lease_owner = ? OR status = 'pending')",
+                (json.dumps(qa_pairs, ensure_ascii=False), time.time(), task.job_id, task.chunk_index, worker_id),
+            )
+
+    def fail(self, worker_id, task, error):
+        """記錄失敗；嘗試次數未用完時放回隊列"""
+        status = "failed" if task.attempts >= self.max_attempts else "pending"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, lease_owner = NULL, updated_at = ? "
+                "WHERE job_id = ? AND chunk_index = ? AND status = 'leased' AND lease_owner = ?",
+                (status, error, time.time(), task.job_id, task.chunk_index, worker_id),
+            )
+
+    def skip(self, worker_id, task, reason):
+        """因預算用盡未生成的任務，不計入嘗試次數，重新提交任務時放回隊列"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = 'skipped', attempts = attempts - 1, error = ?, lease_owner = NULL, updated_at = ? "
+                "WHERE job_id = ? AND chunk_index = ? AND status = 'leased' AND lease_owner = ?",
+                (reason, time.time(), task.job_id, task.chunk_index, worker_id),
+            )
+
+    def heartbeat(self, worker_id, processed=0):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO workers (worker_id, host, pid, processed, last_seen) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET processed = processed + excluded.processed, last_seen = excluded.last_seen",
+                (worker_id, socket.gethostname(), os.getpid(), processed, time.time()),
+            )
+
+    def progress(self, job_id):
+        """返回任務的總數、各狀態的數量以及活躍worker數"""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'pending' ELSE status END, COUNT(*) "
+                "FROM tasks WHERE job_id = ? GROUP BY 1",
+                (now, job_id),
+            ).fetchall())
+            active_workers = self._conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE last_seen > ?", (now - WORKER_ACTIVE_SECONDS,)
+            ).fetchone()[0]
+        progress = {status: counts.get(status, 0) for status in ("pending", "leased", "done", "failed", "skipped")}
+        progress["total"] = sum(counts.values())
+        progress["active_workers"] = active_workers
+        return progress
+
+    def has_unfinished(self, job_id=None):
+        """是否還有待處理或租用中的任務（不指定job_id時檢查全部任務）"""
+        query = "SELECT 1 FROM tasks WHERE status IN ('pending', 'leased')"
+        with self._lock:
+            if job_id is None:
+                return self._conn.execute(query + " LIMIT 1").fetchone() is not None
+            return self._conn.execute(query + " AND job_id = ? LIMIT 1", (job_id,)).fetchone() is not None
+
+    def results(self, job_id):
+        """按文本段順序返回已完成任務的QA對"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM tasks WHERE job_id = ? AND status = 'done' ORDER BY chunk_index", (job_id,)
+            ).fetchall()
+        return [qa for (result,) in rows for qa in json.loads(result)]
+
+    def failures(self, job_id):
+        """失敗的任務，格式與死信記錄一致"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_index, chunk, error FROM tasks WHERE job_id = ? AND status = 'failed' ORDER BY chunk_index",
+                (job_id,),
+            ).fetchall()
+        return [
+            {"chunk_index": chunk_index, "source_chunk": json.loads(chunk)["page_content"], "error": error}
+            for chunk_index, chunk, error in rows
+        ]
+
+    def close(self):
+        self._conn.close()
+
+
+def submit_job(queue, config, text_chunks):
+    """按設定去重文本段後寫入隊列，返回 (job_id, 去重跳過的文本段數)；config中的預算作為整個任務的預算"""
+    skipped = 0
+    if config.chunk_dedup:
+        text_chunks, skipped = dedup_chunks(text_chunks, config.dedup_threshold)
+    job_id = JobJournal.compute_job_id([chunk.page_content for chunk in text_chunks], config.job_settings())
+    queue.submit(job_id, text_chunks, config.job_settings(), config.budget_tokens, config.budget_usd)
+    return job_id, skipped
+
+
+def collect_job_results(queue, config, job_id):
+    """讀取任務的全部結果並按設定做依據檢查和去重，返回 (QA對列表, 失敗記錄)"""
+    qa_pairs = queue.results(job_id)
+    if config.grounding_check:
+        qa_pairs, _ = filter_ungrounded(qa_pairs, config.grounding_threshold, config.grounding_mode)
+    if config.qa_dedup:
+        qa_pairs, _ = dedup_qa_pairs(qa_pairs, config.dedup_threshold)
+    return qa_pairs, queue.failures(job_id)
+
+
+class QueueWorker:
+    """從隊列租用文本段並執行兩階段生成；API Key、端點、並發和限速使用worker自己的設定，生成設定以任務為準"""
+
+    def __init__(self, queue, config, worker_id=None, batch_size=0, lease_seconds=300.0, poll_interval=2.0, metrics=None):
+        self.queue = queue
+        self.config = config
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # 每批任務數默認為並發數的兩倍，保證第一階段的並發槽位不空閒
+        self.batch_size = batch_size or max(1, int(config.concurrency)) * 2
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.metrics = metrics
+        self.processed = 0
+        self._engines = {}
+        # 本worker已因預算跳過文本段的任務及當時的預算；預算未提高前直接跳過該任務的後續文本段
+        self._exhausted_budgets = {}
+
+    def get_engine(self, job_id):
+        if job_id not in self._engines:
+            settings = self.queue.job_settings(job_id) or {}
+            config = EngineConfig.from_dict({**self.config.to_dict(), **settings})
+            self._engines[job_id] = QAEngine(config, error_handler=logger.error, metrics=self.metrics)
+        return self._engines[job_id]
+
+    def process(self, tasks):
+        """執行一批任務；處理期間定期續租，重試後仍失敗的文本段交回隊列，因預算用盡未生成的文本段標記為跳過
+
+        任務設定了預算時，各worker在每次預留預算前和處理期間定期把用量（含進行中請求的預留）累加到隊列中，
+        並以所有worker的合計用量判斷是否已達上限。每批結束後本批的調用計數器累加到隊列，供提交任務的一方匯總。
+        """
+        job_id = tasks[0].job_id
+        engine = self.get_engine(job_id)
+        engine.dead_letters = []
+        engine.start_budget()
+        budget = self.queue.job_budget(job_id)
+        engine.config.budget_tokens = budget["budget_tokens"]
+        engine.config.budget_usd = budget["budget_usd"]
+        engine.budget_offset = (budget["spent_tokens"], budget["spent_usd"])
+        budget_limits = (budget["budget_tokens"], budget["budget_usd"])
+        if engine.budget_reached() or self._exhausted_budgets.get(job_id) == budget_limits:
+            logger.debug("任務 %s 的預算已用盡，跳過 %d 個文本段", job_id[:8], len(tasks))
+            for task in tasks:
+                self.queue.skip(self.worker_id, task, "已達任務預算上限")
+            return
+        flushed = [0, 0.0]
+        sync_lock = threading.Lock()
+        stop_renewing = threading.Event()
+
+        def sync_budget():
+            # 本批的用量和進行中請求的預留中未同步的部分累加到任務，其他worker的用量和預留計入本worker的預算判斷
+            with sync_lock:
+                tokens, cost = engine.budget_spent()
+                reserved_tokens, reserved_cost = engine.budget_reserved
+                tokens += reserved_tokens - engine.budget_offset[0]
+                cost += reserved_cost - engine.budget_offset[1]
+                total_tokens, total_cost = self.queue.add_spent(job_id, tokens - flushed[0], cost - flushed[1])
+                flushed[:] = [tokens, cost]
+                engine.budget_offset = (total_tokens - tokens, total_cost - cost)
+
+        def renew_leases():
+            interval = self.lease_seconds / 3
+            if engine.has_budget:
+                interval = min(interval, BUDGET_SYNC_SECONDS)
+            next_renewal = time.monotonic() + self.lease_seconds / 3
+            while not stop_renewing.wait(interval):
+                if engine.has_budget:
+                    sync_budget()
+                if time.monotonic() >= next_renewal:
+                    next_renewal += self.lease_seconds / 3
+                    self.queue.renew(self.worker_id, tasks, self.lease_seconds)
+                    self.queue.heartbeat(self.worker_id)
+
+        # 每個文本段最後一次推送的問答對即為其最終結果
+        results = {}
+        counters_before = engine.metrics.counter_snapshot()
+        engine.budget_sync = sync_budget if engine.has_budget else None
+        renewer = threading.Thread(target=renew_leases, daemon=True)
+        renewer.start()
+        try:
+            asyncio.run(engine.run_qa_pipeline(
+                [task.chunk for task in tasks], on_qa_pairs=lambda index, qa_pairs: results.__setitem__(index, qa_pairs)
+            ))
+        except Exception as e:
+            logger.error("worker %s 處理任務失敗: %s", self.worker_id, e)
+            for task in tasks:
+                self.queue.fail(self.worker_id, task, f"{type(e).__name__}: {e}")
+            return
+        finally:
+            stop_renewing.set()
+            renewer.join()
+            engine.budget_sync = None
+            if engine.has_budget:
+                sync_budget()
+            counters = engine.metrics.counter_snapshot()
+            self.queue.add_metrics(job_id, {key: value - counters_before.get(key, 0.0) for key, value in counters.items()})
+
+        if engine.budget_skipped_chunks:
+            self._exhausted_budgets[job_id] = budget_limits
+        failed = {index: item["error"] for item in engine.dead_letters for index in failure_context_indices(item)}
+        for position, task in enumerate(tasks):
+            if position in failed:
+                self.queue.fail(self.worker_id, task, failed[position])
+            elif position in engine.budget_skipped_chunks:
+                self.queue.skip(self.worker_id, task, "已達任務預算上限")
+            else:
+                self.queue.complete(self.worker_id, task, results.get(position, []))
+        self.processed += len(tasks)
+        self.queue.heartbeat(self.worker_id, len(tasks))
+
+    def run(self, job_id=None, exit_when_idle=True, should_stop=None):
+        """循環租用並處理任務，返回處理的任務數
+
+        exit_when_idle時，所有任務都已完成或失敗即退出；其他worker租用中的任務仍需等待，以便其租約過期後接手。
+        """
+        self.queue.heartbeat(self.worker_id)
+        while should_stop is None or not should_stop():
+            tasks = self.queue.lease(self.worker_id, self.batch_size, self.lease_seconds, job_id)
+            if tasks:
+                logger.info("worker %s 租用 %d 個任務（%s）", self.worker_id, len(tasks), tasks[0].job_id[:8])
+                self.process(tasks)
+                continue
+            if exit_when_idle and not self.queue.has_unfinished(job_id):
+                break
+            self.queue.heartbeat(self.worker_id)
+            time.sleep(self.poll_interval)
+        return self.processed
+
+
+def run_worker_process(queue_path, config_values, job_id=None, lease_seconds=300.0):
+    """在子進程中運行worker直到隊列中沒有可租用的任務"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    worker = QueueWorker(WorkQueue(queue_path), EngineConfig.from_dict(config_values), lease_seconds=lease_seconds)
+    worker.run(job_id)
+
+
+def wait_for_job(queue, job_id, processes=(), on_progress=None, poll_interval=1.0, idle_timeout=WORKER_ACTIVE_SECONDS):
+    """等待任務完成，每次輪詢時以隊列進度調用on_progress；返回任務是否已全部完成
+
+    本機worker進程都已退出、且隊列中超過idle_timeout秒沒有活躍的worker時停止等待並返回False，
+    避免worker全部退出後無限等待；未完成的文本段保留在隊列中，重新提交任務後繼續處理。
+    """
+    last_active = time.monotonic()
+    while True:
+        progress = queue.progress(job_id)
+        if on_progress is not None:
+            on_progress(progress)
+        if not queue.has_unfinished(job_id):
+            return True
+        if progress["active_workers"] or any(process.is_alive() for process in processes):
+            last_active = time.monotonic()
+        elif time.monotonic() - last_active > idle_timeout:
+            return False
+        time.sleep(poll_interval)
+
+
+def start_local_workers(queue_path, config, count, job_id=None, lease_seconds=300.0):
+    """啟動count個本機worker進程；使用spawn啟動方式，避免複製父進程（如Streamlit）的線程狀態"""
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(count):
+        process = context.Process(
+            target=run_worker_process, args=(queue_path, config.to_dict(), job_id, lease_seconds), daemon=True
+        )
+        process.start()
+        processes.append(process)
+    return processes
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# 模塊以 Code/ 為根目錄互相導入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code"))
+
+# 默認的緩存、檢查點和隊列位置在導入模塊時確定，測試期間指向臨時目錄，不寫入 Code/ 下
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="sqa-tests-")
+os.environ["SQA_CACHE_PATH"] = os.path.join(TEST_DATA_DIR, "completions.sqlite3")
+os.environ["SQA_INCREMENTAL_PATH"] = os.path.join(TEST_DATA_DIR, "incremental.sqlite3")
+os.environ["SQA_JOURNAL_DIR"] = os.path.join(TEST_DATA_DIR, "jobs")
+os.environ["SQA_QUEUE_PATH"] = os.path.join(TEST_DATA_DIR, "queue.sqlite3")
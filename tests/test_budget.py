@@ -0,0 +1,88 @@
+import asyncio
+
+from batch_mode import make_custom_id
+from metrics import MetricsRegistry
+from planner import STAGE1_OUTPUT_RATIO, count_message_tokens, estimate_request_usage
+from qa_engine import EngineConfig, QAEngine
+
+
+def chunk_text(index):
+    return f"第 {index:02d} 段文本，" * 20
+
+
+def make_engine(budget_tokens=0, completion_ratio=STAGE1_OUTPUT_RATIO):
+    """返回引擎和調用記錄；假響應的提示詞token按實際消息計算，輸出token為提示詞的completion_ratio倍"""
+    engine = QAEngine(EngineConfig(api_key="x", use_cache=False, budget_tokens=budget_tokens), metrics=MetricsRegistry())
+    state = {"in_flight": 0, "max_in_flight": 0, "calls": 0}
+
+    async def fake_schedule(async_client, messages, params, stream_parser=None):
+        state["calls"] += 1
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        prompt_tokens = count_message_tokens(messages, params["model"])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": int(prompt_tokens * completion_ratio)}
+        return {"choices": [{"message": {"content": "Q: 問題？\nA: 答案"}, "finish_reason": "stop"}], "usage": usage}
+
+    engine._schedule_completion_async = fake_schedule
+    engine.start_budget()
+    return engine, state
+
+
+def request_tokens(engine):
+    return estimate_request_usage(engine.build_qa_messages(chunk_text(0)), engine._completion_params(), 1)[0]
+
+
+async def run_requests(engine, count):
+    return await asyncio.gather(*(
+        engine.get_completion_async(
+            None, engine.build_qa_messages(chunk_text(index)), failure_context={"chunk_index": index, "stage": 1}
+        )
+        for index in range(count)
+    ))
+
+
+def test_concurrent_requests_stay_within_token_cap():
+    engine, state = make_engine()
+    engine.config.budget_tokens = request_tokens(engine) * 5
+    responses = asyncio.run(run_requests(engine, 20))
+    assert state["calls"] == 5
+    assert engine.budget_spent()[0] <= engine.config.budget_tokens
+    assert sum(response is not None for response in responses) == 5
+    assert engine.budget_skipped == len(engine.budget_skipped_chunks) == 15
+    assert engine.budget_reserved == (0, 0.0)
+
+
+def test_requests_wait_for_in_flight_usage_to_settle():
+    # 實際輸出遠少於預估：放不下的請求等進行中的請求按實際用量結算後仍可發送
+    engine, state = make_engine(completion_ratio=0)
+    engine.config.budget_tokens = request_tokens(engine) * 3
+    asyncio.run(run_requests(engine, 4))
+    assert state["calls"] == 4
+    assert state["max_in_flight"] == 3
+    assert engine.budget_skipped == 0
+
+
+def test_cost_cap_skips_requests_beyond_the_budget():
+    engine, state = make_engine()
+    messages = engine.build_qa_messages(chunk_text(0))
+    request_cost = estimate_request_usage(messages, engine._completion_params(), 1, prices=engine.metrics.prices)[1]
+    engine.config.budget_usd = request_cost * 3.5
+    responses = asyncio.run(run_requests(engine, 10))
+    assert state["calls"] == 3
+    assert engine.budget_spent()[1] <= engine.config.budget_usd
+    assert sum(response is not None for response in responses) == 3
+    assert engine.budget_skipped == 7
+
+
+def test_batch_submission_keeps_only_requests_within_the_budget():
+    engine, _ = make_engine()
+    params = engine._completion_params()
+    requests = {
+        make_custom_id(1, index): (engine.build_qa_messages(chunk_text(index)), params, f"key-{index}") for index in range(6)
+    }
+    engine.config.budget_tokens = estimate_request_usage(requests[make_custom_id(1, 0)][0], params, 1, batch=True)[0] * 4
+    kept = engine.fit_batch_budget(requests, 1)
+    assert list(kept) == [make_custom_id(1, index) for index in range(4)]
+    assert engine.budget_skipped == 2 and engine.budget_skipped_chunks == {4, 5}
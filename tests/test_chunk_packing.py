@@ -0,0 +1,95 @@
+import asyncio
+
+from langchain_core.documents import Document
+
+from chunk_packing import build_packed_text, pack_chunk_indices, split_packed_response
+from metrics import MetricsRegistry
+from qa_engine import EngineConfig, QAEngine
+
+
+def test_packs_are_consecutive_and_bounded_by_tokens_and_count():
+    assert pack_chunk_indices([100, 200, 300, 500, 50, 50], 600) == [[0, 1, 2], [3, 4, 5]]
+    # 超出預算的文本段單獨成組
+    assert pack_chunk_indices([100, 900, 100], 600) == [[0], [1], [2]]
+    assert pack_chunk_indices([10] * 5, 600, max_chunks=2) == [[0, 1], [2, 3], [4]]
+    assert pack_chunk_indices([], 600) == []
+
+
+def test_split_packed_response_maps_sections_back_to_chunks():
+    assert build_packed_text(["甲", "乙"]) == "[[SECTION 1]]\n甲\n\n[[SECTION 2]]\n乙"
+    raw = (
+        "[[SECTION 1]]\nQ: 甲？\nA: 甲。\n\n"
+        "**[[ SECTION 3 ]]**\nQ: 丙？\nA: 丙。\n\n"
+        "[[SECTION 1]]\nQ: 甲二？\nA: 甲二。\n\n"
+        "[[SECTION 4]]\nQ: 多出的分節？\nA: 忽略。\n\n"
+        "[[SECTION 2]]\n"
+    )
+    # 重複的分節合併，超出範圍和內容為空的分節不包含在結果中
+    assert split_packed_response(raw, 3) == {0: "Q: 甲？\nA: 甲。\n\n\nQ: 甲二？\nA: 甲二。", 2: "Q: 丙？\nA: 丙。"}
+    assert split_packed_response("Q: 沒有分節標記？\nA: 是。", 2) == {}
+
+
+def test_split_packed_response_drops_last_section_of_truncated_response():
+    raw = "[[SECTION 1]]\nQ: 一？\nA: 一。\n\n**[[SECTION 2]]**\nQ: 二？\nA: 二"
+    assert set(split_packed_response(raw, 2)) == {0, 1}
+    assert split_packed_response(raw, 2, complete=False) == {0: "Q: 一？\nA: 一。"}
+
+
+def make_pack_engine(respond, budget_tokens=0):
+    """返回啟用合併請求的引擎和請求記錄；respond(消息列表) 返回 (響應文本, finish_reason)，拋出異常表示請求失敗"""
+    engine = QAEngine(
+        EngineConfig(api_key="x", use_cache=False, pack_chunks=True, chunk_dedup=False, budget_tokens=budget_tokens),
+        metrics=MetricsRegistry(),
+    )
+    requests = []
+
+    async def fake_schedule(async_client, messages, params, stream_parser=None):
+        requests.append(messages[-1]["content"])
+        content, finish_reason = respond(messages)
+        usage = {"prompt_tokens": 10, "completion_tokens": 10}
+        return {"choices": [{"message": {"content": content}, "finish_reason": finish_reason}], "usage": usage}
+
+    engine._schedule_completion_async = fake_schedule
+    engine.start_budget()
+    return engine, requests
+
+
+def run_pipeline(engine, texts):
+    stats = {}
+    chunks = [Document(page_content=text) for text in texts]
+    qa_pairs = asyncio.run(engine.run_qa_pipeline(chunks, stats=stats))
+    return qa_pairs, stats
+
+
+def test_truncated_packed_response_retries_its_last_section_alone():
+    def respond(messages):
+        if "[[SECTION" in messages[-1]["content"]:
+            return "[[SECTION 1]]\nQ: 甲是什麼？\nA: 甲。\n\n[[SECTION 2]]\nQ: 乙是什麼？\nA: 乙", "length"
+        return "Q: 乙是什麼？\nA: 乙是第二段。", "stop"
+
+    engine, requests = make_pack_engine(respond)
+    qa_pairs, stats = run_pipeline(engine, ["甲段落", "乙段落"])
+    assert [qa["answer"] for qa in qa_pairs] == ["甲。", "乙是第二段。"]
+    assert (stats["packed_requests"], stats["packed_chunks"], stats["pack_fallbacks"]) == (1, 1, 1)
+    assert len(requests) == 2
+
+
+def test_failed_pack_is_one_dead_letter_with_all_chunk_indices():
+    def respond(messages):
+        raise RuntimeError("服務不可用")
+
+    engine, requests = make_pack_engine(respond)
+    engine.config.max_retries = 0
+    qa_pairs, stats = run_pipeline(engine, ["甲段落", "乙段落", "丙段落"])
+    assert qa_pairs == [] and len(requests) == 1
+    assert stats["pack_fallbacks"] == 0
+    assert [(item["chunk_indices"], item["stage"]) for item in engine.dead_letters] == [([0, 1, 2], 1)]
+    assert engine.dead_letters[0]["source_chunks"] == ["甲段落", "乙段落", "丙段落"]
+
+
+def test_budget_skipped_pack_counts_each_chunk_once():
+    engine, requests = make_pack_engine(lambda messages: ("Q: 問？\nA: 答。", "stop"), budget_tokens=1)
+    qa_pairs, stats = run_pipeline(engine, ["甲段落", "乙段落"])
+    assert qa_pairs == [] and requests == []
+    assert engine.budget_skipped == 2
+    assert engine.budget_skipped_chunks == {0, 1}
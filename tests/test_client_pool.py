@@ -0,0 +1,21 @@
+from client_pool import parse_endpoint_lines, parse_endpoint_spec
+from qa_cli import build_config, parse_args
+from qa_engine import EngineConfig, QAEngine
+
+
+def test_endpoint_without_key_uses_main_api_key():
+    assert parse_endpoint_spec("http://gpu1:8000/v1") == {"base_url": "http://gpu1:8000/v1"}
+    config = EngineConfig(api_key="sk-real", endpoints=parse_endpoint_lines("http://gpu1:8000/v1\nhttp://gpu2:8000/v1,EMPTY,2"))
+    assert [endpoint["api_key"] for endpoint in config.endpoint_list()] == ["sk-real", "EMPTY"]
+    pool = QAEngine(config).pool
+    assert [endpoint.api_key for endpoint in pool.endpoints] == ["sk-real", "EMPTY"]
+
+
+def test_empty_endpoint_key_falls_back_to_main_api_key():
+    config = EngineConfig(api_key="sk-real", endpoints=[{"base_url": "http://gpu1:8000/v1", "api_key": ""}])
+    assert config.endpoint_list()[0]["api_key"] == "sk-real"
+
+
+def test_cli_endpoint_without_key():
+    args = parse_args(["--input", "docs", "--output", "qa.json", "--api-key", "sk-real", "--endpoint", "http://gpu1:8000/v1"])
+    assert all(endpoint["api_key"] == "sk-real" for endpoint in build_config(args).endpoint_list())
@@ -0,0 +1,12 @@
+from dedup import dedup_qa_pairs
+
+
+def test_same_question_with_different_answers_is_kept():
+    qa_pairs = [
+        {"question": "公司的總部設在哪裡？", "answer": "公司總部位於台北市信義區。"},
+        {"question": "公司的總部設在哪裡？", "answer": "2020年起總部遷至新竹科學園區，台北改為辦事處。"},
+        {"question": "公司的總部設在哪裡？", "answer": "公司總部位於台北市信義區。"},
+    ]
+    kept, merged = dedup_qa_pairs(qa_pairs)
+    assert kept == qa_pairs[:2]
+    assert merged == 1
@@ -0,0 +1,53 @@
+import json
+import os
+
+import pandas as pd
+
+from exporters import chunk_id_for, chunks_path_for, export_jsonl, export_parquet, export_sft_jsonl
+
+QA_PAIRS = [
+    {"question": "甲是什麼？", "answer": "甲是第一段。", "source_chunk": "第一段"},
+    {"question": "甲在哪裡？", "answer": "在開頭。", "source_chunk": "第一段"},
+    {"question": "乙是什麼？", "answer": "乙是第二段。", "source_chunk": "第二段"},
+]
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_jsonl_export_writes_each_chunk_once_and_references_it_by_id(tmp_path):
+    qa_path = str(tmp_path / "out" / "qa.jsonl")
+    assert export_jsonl(iter(QA_PAIRS), qa_path) == (3, 2)
+    assert chunks_path_for(qa_path) == str(tmp_path / "out" / "qa.chunks.jsonl")
+
+    records = read_jsonl(qa_path)
+    assert all("source_chunk" not in record for record in records)
+    assert [record["chunk_id"] for record in records] == [chunk_id_for("第一段")] * 2 + [chunk_id_for("第二段")]
+    chunks = {chunk["chunk_id"]: chunk["text"] for chunk in read_jsonl(chunks_path_for(qa_path))}
+    assert [chunks[record["chunk_id"]] for record in records] == [qa["source_chunk"] for qa in QA_PAIRS]
+
+
+def test_sft_jsonl_export_writes_chat_messages(tmp_path):
+    path = str(tmp_path / "sft.jsonl")
+    assert export_sft_jsonl(QA_PAIRS, path, "系統提示") == 3
+    assert read_jsonl(path)[2]["messages"] == [
+        {"role": "system", "content": "系統提示"},
+        {"role": "user", "content": "乙是什麼？"},
+        {"role": "assistant", "content": "乙是第二段。"},
+    ]
+
+
+def test_parquet_export_splits_rows_into_shards(tmp_path):
+    directory = str(tmp_path / "parquet")
+    shards = export_parquet(iter(QA_PAIRS), directory, rows_per_shard=2, sft_system_prompt="系統提示")
+    assert {name: [os.path.basename(path) for path in paths] for name, paths in shards.items()} == {
+        "qa": ["qa-00000.parquet", "qa-00001.parquet"],
+        "chunks": ["chunks-00000.parquet"],
+        "sft": ["sft-00000.parquet", "sft-00001.parquet"],
+    }
+    qa = pd.concat([pd.read_parquet(path) for path in shards["qa"]], ignore_index=True)
+    assert list(qa["question"]) == [qa_pair["question"] for qa_pair in QA_PAIRS]
+    chunks = pd.read_parquet(shards["chunks"][0])
+    assert dict(zip(chunks["chunk_id"], chunks["text"])) == {chunk_id_for("第一段"): "第一段", chunk_id_for("第二段"): "第二段"}
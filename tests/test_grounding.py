@@ -0,0 +1,52 @@
+import pytest
+
+from dedup import normalize_text
+from grounding import filter_ungrounded, grounding_scores
+
+CHUNK = "台積電成立於1987年，總部位於新竹科學園區，是全球最大的專業積體電路製造服務公司。"
+OTHER_CHUNK = "玉山是台灣最高峰，海拔3952公尺，位於南投縣與嘉義縣交界。"
+
+
+def reference_score(answer, chunk, ngram=3):
+    """逐個n-gram比對的參考實現"""
+    answer, chunk = normalize_text(answer), normalize_text(chunk)
+    chunk_ngrams = {chunk[i:i + ngram] for i in range(len(chunk) - ngram + 1)}
+    answer_ngrams = [answer[i:i + ngram] for i in range(len(answer) - ngram + 1)]
+    return round(sum(item in chunk_ngrams for item in answer_ngrams) / len(answer_ngrams), 4)
+
+
+def test_scores_measure_answer_overlap_with_its_own_chunk():
+    qa_pairs = [
+        {"answer": "總部位於新竹科學園區", "source_chunk": CHUNK},
+        {"answer": "台積電成立於1990年，總部在台北", "source_chunk": CHUNK},
+        {"answer": "海拔3952公尺", "source_chunk": CHUNK},
+        {"answer": "海拔3952公尺", "source_chunk": OTHER_CHUNK},
+        {"answer": "是", "source_chunk": CHUNK},
+        {"answer": "沒有來源"},
+    ]
+    scores = grounding_scores(qa_pairs)
+    assert scores[0] == 1.0
+    assert 0 < scores[1] < 1 and scores[1] == reference_score(qa_pairs[1]["answer"], CHUNK)
+    # 答案只與所屬文本段比較，出現在其他文本段中不算有依據
+    assert scores[2] == 0.0 and scores[3] == 1.0
+    assert scores[4:] == [None, None]
+
+
+def test_filter_drops_or_flags_answers_below_threshold():
+    qa_pairs = [
+        {"answer": "總部位於新竹科學園區", "source_chunk": CHUNK},
+        {"answer": "海拔3952公尺", "source_chunk": CHUNK},
+        {"answer": "是", "source_chunk": CHUNK},
+    ]
+    kept, below = filter_ungrounded(qa_pairs, 0.5)
+    assert below == 1
+    assert [qa["answer"] for qa in kept] == ["總部位於新竹科學園區", "是"]
+    assert [qa["grounding_score"] for qa in kept] == [1.0, None]
+
+    flagged, below = filter_ungrounded(qa_pairs, 0.5, mode="flag")
+    assert below == 1
+    assert [qa["grounded"] for qa in flagged] == [True, False, True]
+    assert "grounding_score" not in qa_pairs[0]
+
+    with pytest.raises(ValueError):
+        filter_ungrounded(qa_pairs, 0.5, mode="keep")
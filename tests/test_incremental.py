@@ -0,0 +1,69 @@
+from langchain_core.documents import Document
+
+from incremental import IncrementalStore, content_hash, ingest_sources_incremental
+from ingestion import IngestionReport, IngestionSource
+from metrics import MetricsRegistry
+from qa_engine import EngineConfig, QAEngine
+
+
+def report_for(name, texts):
+    return IngestionReport(name=name, chunks=[Document(page_content=text) for text in texts])
+
+
+def test_unchanged_files_reuse_their_split(tmp_path):
+    store = IncrementalStore(str(tmp_path / "incremental.sqlite3"))
+    first = ingest_sources_incremental([IngestionSource(name="a.txt", data="第一版".encode("utf-8"))], store, max_workers=1)
+    assert not first[0].reused
+
+    same = ingest_sources_incremental([IngestionSource(name="a.txt", data="第一版".encode("utf-8"))], store, max_workers=1)
+    assert same[0].reused
+    assert [chunk.page_content for chunk in same[0].chunks] == [chunk.page_content for chunk in first[0].chunks]
+
+    changed = ingest_sources_incremental([IngestionSource(name="a.txt", data="第二版".encode("utf-8"))], store, max_workers=1)
+    assert not changed[0].reused
+    assert [chunk.page_content for chunk in changed[0].chunks] == ["第二版"]
+    assert changed[0].removed_chunks == 1
+    store.close()
+
+
+def test_results_of_removed_chunks_are_deleted_unless_another_file_uses_them(tmp_path):
+    store = IncrementalStore(str(tmp_path / "incremental.sqlite3"))
+    store.put_file("a.txt", "v1", "options", report_for("a.txt", ["共用段", "舊段"]))
+    store.put_file("b.txt", "v1", "options", report_for("b.txt", ["共用段"]))
+    hashes = {text: content_hash(text) for text in ("共用段", "舊段", "新段")}
+    store.put_results("settings", {hashes["共用段"]: [{"question": "共"}], hashes["舊段"]: [{"question": "舊"}]})
+
+    assert store.put_file("a.txt", "v2", "options", report_for("a.txt", ["新段"])) == 2
+    assert set(store.get_results("settings", hashes.values())) == {hashes["共用段"]}
+    store.close()
+
+
+def test_only_new_or_changed_chunks_are_generated(tmp_path):
+    engine = QAEngine(
+        EngineConfig(
+            api_key="x", use_cache=False, use_journal=False, incremental=True, chunk_dedup=False, qa_dedup=False,
+            cache_friendly_prompts=True,
+        ),
+        metrics=MetricsRegistry(),
+    )
+    engine._incremental_store = IncrementalStore(str(tmp_path / "incremental.sqlite3"))
+    requested = []
+
+    async def fake_schedule(async_client, messages, params, stream_parser=None):
+        # 前綴緩存佈局下，用戶消息即文本段內容
+        text = messages[-1]["content"]
+        requested.append(text)
+        content = f"Q: {text}講了什麼？\nA: {text}的內容。"
+        return {"choices": [{"message": {"content": content}, "finish_reason": "stop"}], "usage": None}
+
+    engine._schedule_completion_async = fake_schedule
+
+    qa_pairs = engine.generate_qa_pairs([Document(page_content=text) for text in ("甲段", "乙段")])
+    assert sorted(requested) == ["乙段", "甲段"]
+    assert len(qa_pairs) == 2
+
+    requested.clear()
+    qa_pairs = engine.generate_qa_pairs([Document(page_content=text) for text in ("甲段", "丙段")])
+    assert requested == ["丙段"]
+    assert [qa["source_chunk"] for qa in qa_pairs] == ["甲段", "丙段"]
+    assert (engine.last_stats["incremental_reused"], engine.last_stats["incremental_generated"]) == (1, 1)
@@ -0,0 +1,48 @@
+import pytest
+from langchain_core.documents import Document
+
+import ingestion
+from ingestion import IngestionSource, iter_source_documents, load_source, register_lazy_loader, register_loader
+
+
+@pytest.fixture(autouse=True)
+def isolated_registries(monkeypatch):
+    for name in ("LOADER_MAPPING", "IN_MEMORY_LOADERS", "LAZY_LOADERS"):
+        monkeypatch.setattr(ingestion, name, dict(getattr(ingestion, name)))
+
+
+class UpperTextLoader:
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def load(self):
+        with open(self.file_path, encoding="utf-8") as f:
+            return [Document(page_content=f.read().upper(), metadata={"loader": "override"})]
+
+
+def test_registered_loader_overrides_builtin_for_uploaded_source():
+    register_loader(".txt", UpperTextLoader)
+    source = IngestionSource(name="notes.txt", data=b"hello")
+    assert [doc.page_content for doc in load_source(source)] == ["HELLO"]
+    assert [doc.metadata["loader"] for doc in iter_source_documents(source)] == ["override"]
+
+
+def test_registered_lazy_loader_overrides_builtin_for_uploaded_source():
+    def iter_lines(file, name):
+        for line in file.read().decode("utf-8").splitlines():
+            yield Document(page_content=line, metadata={"source": name})
+
+    register_lazy_loader(".txt", iter_lines)
+    source = IngestionSource(name="notes.txt", data="第一行\n第二行".encode("utf-8"))
+    assert [doc.page_content for doc in load_source(source)] == ["第一行", "第二行"]
+    assert [doc.page_content for doc in iter_source_documents(source)] == ["第一行", "第二行"]
+
+
+def test_ingest_sources_keeps_input_order_in_spawned_pool(tmp_path):
+    sources = []
+    for name, text in (("a.txt", "第一個文件"), ("b.txt", "第二個文件")):
+        (tmp_path / name).write_text(text, encoding="utf-8")
+        sources.append(IngestionSource(name=name, path=str(tmp_path / name)))
+    reports = ingestion.ingest_sources(sources, max_workers=2)
+    assert [(report.name, report.error) for report in reports] == [("a.txt", None), ("b.txt", None)]
+    assert [[chunk.page_content for chunk in report.chunks] for report in reports] == [["第一個文件"], ["第二個文件"]]
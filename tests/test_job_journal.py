@@ -0,0 +1,21 @@
+import json
+
+from job_journal import JobJournal
+
+
+def test_torn_last_line_is_truncated_before_appending(tmp_path):
+    journal = JobJournal("job", str(tmp_path))
+    journal.record_raw_response(0, "Q: 一\nA: 二")
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"chunk_index": 1, "stage": 1, "raw_')
+
+    journal = JobJournal("job", str(tmp_path))
+    assert journal.raw_responses == {0: "Q: 一\nA: 二"}
+    journal.record_qa_pairs(0, [{"question": "一", "answer": "二"}])
+    journal.close()
+    with open(journal.path, encoding="utf-8") as f:
+        assert [json.loads(line)["stage"] for line in f] == [1, 2]
+    journal = JobJournal("job", str(tmp_path))
+    assert journal.qa_results == {0: [{"question": "一", "answer": "二"}]}
+    journal.close()
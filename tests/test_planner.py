@@ -0,0 +1,64 @@
+from langchain_core.documents import Document
+
+from metrics import MetricsRegistry
+from planner import LOCAL_PARSE_FALLBACK_RATE, count_message_tokens, plan_job
+from qa_engine import EngineConfig, QAEngine
+
+
+def make_chunks(count, text="第 {index:03d} 號產品的規格與保固條款說明。"):
+    return [Document(page_content=text.format(index=index) * 5) for index in range(count)]
+
+
+def make_engine(**settings):
+    return QAEngine(EngineConfig(api_key="x", **settings), metrics=MetricsRegistry())
+
+
+def test_plan_counts_requests_and_prompt_tokens_per_chunk():
+    engine = make_engine()
+    chunks = make_chunks(20)
+    plan = plan_job(engine, chunks)
+    assert (plan.chunks, plan.skipped_chunks, plan.stage1_calls) == (20, 0, 20)
+    assert plan.stage2_calls == round(20 * LOCAL_PARSE_FALLBACK_RATE)
+
+    stage1_prompt = sum(count_message_tokens(engine.build_qa_messages(chunk.page_content), "gpt-4.1-nano") for chunk in chunks)
+    # 模板只計算一次，與逐條計算的提示詞token數只差分詞邊界
+    assert abs(plan.prompt_tokens - stage1_prompt) < stage1_prompt * 0.2
+    assert plan.total_tokens <= plan.max_total_tokens and plan.cost_usd <= plan.max_cost_usd
+
+
+def test_plan_reflects_dedup_packing_parser_and_batch_settings():
+    chunks = make_chunks(20) + make_chunks(5)
+    base = plan_job(make_engine(), chunks)
+    assert (base.chunks, base.skipped_chunks) == (20, 5)
+
+    packed = plan_job(make_engine(pack_chunks=True, pack_max_chunks=4), chunks)
+    assert packed.stage1_calls == 5 and packed.prompt_tokens < base.prompt_tokens
+
+    no_parser = plan_job(make_engine(use_local_parser=False), chunks)
+    assert no_parser.stage2_calls == no_parser.stage1_calls == 20
+
+    batch = plan_job(make_engine(use_batch_api=True), chunks)
+    assert batch.seconds is None and batch.cost_usd < base.cost_usd
+    assert base.seconds is not None
+
+
+def test_plan_uses_observed_ratios_and_latency_from_history():
+    engine = make_engine()
+    history = MetricsRegistry()
+    history.observe_call(1, "gpt-4.1-nano", 2.0, {"prompt_tokens": 1000, "completion_tokens": 2000})
+    default_plan = plan_job(engine, make_chunks(4))
+    observed_plan = plan_job(engine, make_chunks(4), history=history)
+    # 觀測到的輸出比例（2.0）高於默認比例，且記錄中沒有LLM轉換請求
+    assert observed_plan.completion_tokens > default_plan.completion_tokens
+    assert observed_plan.stage2_calls == 0
+    # 4 個請求、每個 2 秒、並發 8
+    assert observed_plan.seconds == 4 * 2.0 / 8
+
+
+def test_budget_warning_compares_plan_with_caps():
+    engine = make_engine()
+    plan = plan_job(engine, make_chunks(10))
+    assert plan.budget_warning(engine.config) is None
+    assert "tokens" in plan.budget_warning(EngineConfig(api_key="x", budget_tokens=plan.total_tokens - 1))
+    assert "$" in plan.budget_warning(EngineConfig(api_key="x", budget_usd=plan.cost_usd / 2))
+    assert plan.budget_warning(EngineConfig(api_key="x", budget_tokens=plan.total_tokens)) is None
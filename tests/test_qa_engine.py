@@ -0,0 +1,93 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from metrics import MetricsRegistry
+from qa_engine import EngineConfig, IncrementalQAParser, QAEngine, parse_raw_qa_locally
+
+
+def test_update_config_keeps_pool_and_cache_when_their_settings_are_unchanged():
+    engine = QAEngine(EngineConfig(api_key="x", endpoints=[{"base_url": "http://gpu1:8000/v1"}]))
+    pool, cache = engine.pool, engine.get_cache()
+
+    engine.update_config(EngineConfig(api_key="x", endpoints=[{"base_url": "http://gpu1:8000/v1"}], temperature=0.2))
+    assert engine.pool is pool and engine.get_cache() is cache
+    assert engine.config.temperature == 0.2
+
+    engine.update_config(EngineConfig(api_key="x", endpoints=[{"base_url": "http://gpu2:8000/v1"}], cache_max_entries=10))
+    assert engine.pool is not pool and engine.get_cache() is not cache
+    assert [endpoint.base_url for endpoint in engine.pool.endpoints] == ["http://gpu2:8000/v1"]
+
+
+def test_local_parser_splits_questions_and_keeps_multi_paragraph_answers():
+    raw = "Q: 什麼是A？什麼是B？\nA: 兩者都是字母。\n\n第二段說明。\n\n\nQ2： 為什麼？\nA2： 因為如此。"
+    qa_pairs = parse_raw_qa_locally(raw, "原文")
+    assert [(qa["question"], qa["answer"]) for qa in qa_pairs] == [
+        ("什麼是A？", "兩者都是字母。\n\n第二段說明。"),
+        ("什麼是B？", "兩者都是字母。\n\n第二段說明。"),
+        ("為什麼？", "因為如此。"),
+    ]
+    assert all(qa["source_chunk"] == "原文" for qa in qa_pairs)
+
+
+def test_local_parser_rejects_text_outside_qa_pairs():
+    assert parse_raw_qa_locally("Q: a?\nA: b\n\n希望這些問答對有幫助！", "") is None
+    assert parse_raw_qa_locally("以下是生成的問答對：\n\nQ: a?\nA: b", "") is None
+    assert parse_raw_qa_locally("Q: a?\nA: b\n\n\n補充說明。\n\n\nQ: c?\nA: d", "") is None
+    assert parse_raw_qa_locally("Q: a?\nA: b\nA: c", "") is None
+    assert parse_raw_qa_locally("沒有問答對", "") is None
+
+
+def test_local_parser_accepts_numbered_and_bold_markers():
+    raw = "**Q1：** 產品保固多久？\n**A1：** 兩年。\n\n\nQ 2: 請說明退貨流程\nA 2: 七天內可退貨。"
+    assert [(qa["question"], qa["answer"]) for qa in parse_raw_qa_locally(raw, "")] == [
+        ("產品保固多久？", "兩年。"),
+        ("請說明退貨流程", "七天內可退貨。"),
+    ]
+    # 整行不全是問句時不拆分
+    assert parse_raw_qa_locally("Q: 什麼是A？請舉例說明\nA: 字母。", "")[0]["question"] == "什麼是A？請舉例說明"
+
+
+def run_conversion_pipeline(raw_responses, **settings):
+    """第一階段按文本段返回raw_responses中的響應，返回 (QA對, 統計, JSON轉換請求數)"""
+    engine = QAEngine(
+        EngineConfig(api_key="x", use_cache=False, use_journal=False, chunk_dedup=False, cache_friendly_prompts=True, **settings),
+        metrics=MetricsRegistry(),
+    )
+    conversions = []
+
+    async def fake_schedule(async_client, messages, params, stream_parser=None):
+        if messages[0]["content"] == engine.config.json_system_prompt:
+            conversions.append(messages[-1]["content"])
+            content = json.dumps([{"question": "轉換的問題？", "answer": "轉換的答案。"}], ensure_ascii=False)
+        else:
+            content = raw_responses[messages[-1]["content"]]
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+    engine._schedule_completion_async = fake_schedule
+    stats = {}
+    chunks = [Document(page_content=text) for text in raw_responses]
+    qa_pairs = asyncio.run(engine.run_qa_pipeline(chunks, stats=stats))
+    return qa_pairs, stats, len(conversions)
+
+
+def test_only_responses_the_local_parser_rejects_are_converted_by_the_llm():
+    raw_responses = {"甲段": "Q: 甲？\nA: 甲。", "乙段": "以下是問答對：\n\nQ: 乙？\nA: 乙。"}
+    qa_pairs, stats, conversions = run_conversion_pipeline(raw_responses)
+    assert (stats["local_parsed"], stats["llm_converted"], conversions) == (1, 1, 1)
+    assert [(qa["question"], qa["source_chunk"]) for qa in qa_pairs] == [("甲？", "甲段"), ("轉換的問題？", "乙段")]
+
+    _, stats, conversions = run_conversion_pipeline(raw_responses, use_local_parser=False)
+    assert (stats["local_parsed"], stats["llm_converted"], conversions) == (0, 2, 2)
+
+
+def test_incremental_parser_pushes_completed_blocks():
+    pushed = []
+    parser = IncrementalQAParser("原文", pushed.append)
+    for delta in ["Q: 一？\nA: 第一段。\n\n第二", "段。\n\n\nQ: 二？\n", "A: 答案二。"]:
+        parser.feed(delta)
+    assert [[qa["answer"] for qa in qa_pairs] for qa_pairs in pushed] == [["第一段。\n\n第二段。"]]
+    assert len(parse_raw_qa_locally(parser.text, "原文")) == 2
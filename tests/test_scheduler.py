@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from client_pool import ClientPool
+from scheduler import RequestScheduler
+
+
+def api_error(error_class, status_code, headers=None):
+    request = httpx.Request("POST", "http://gpu1:8000/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_class("錯誤", response=response, body=None)
+
+
+def failing_request(errors, result="ok"):
+    """依次拋出errors中的異常，之後返回result；返回請求函數和調用次數記錄"""
+    calls = []
+
+    async def make_request():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return make_request, calls
+
+
+def test_retryable_errors_are_retried_with_server_retry_after():
+    scheduler = RequestScheduler(max_retries=3, base_delay=100)
+    make_request, calls = failing_request([
+        api_error(openai.RateLimitError, 429, {"retry-after-ms": "1"}),
+        api_error(openai.InternalServerError, 500, {"retry-after": "0"}),
+    ])
+    assert asyncio.run(scheduler.run(make_request)) == "ok"
+    assert len(calls) == 3
+    assert (scheduler.retries, scheduler.rate_limited) == (2, 1)
+
+
+def test_last_error_is_raised_when_retries_run_out():
+    scheduler = RequestScheduler(max_retries=1, base_delay=0)
+    make_request, calls = failing_request([api_error(openai.InternalServerError, 500)] * 3)
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(scheduler.run(make_request))
+    assert len(calls) == 2 and scheduler.retries == 1
+
+
+def test_non_retryable_errors_are_raised_immediately():
+    scheduler = RequestScheduler(max_retries=3)
+    make_request, calls = failing_request([api_error(openai.BadRequestError, 400)])
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(scheduler.run(make_request))
+    assert len(calls) == 1 and scheduler.retries == 0
+
+
+def test_failover_retries_on_another_endpoint_without_backoff():
+    pool = ClientPool(
+        [{"base_url": "http://gpu1:8000/v1", "api_key": "x"}, {"base_url": "http://gpu2:8000/v1", "api_key": "x"}],
+        failover_delay=60,
+        seed=0,
+    )
+    # 退避時間很長：未立即切換端點時測試會超時
+    scheduler = RequestScheduler(max_retries=3, base_delay=60, can_failover=pool.has_available_endpoint)
+    used = []
+
+    async def make_request():
+        # 第一個請求所在的端點被限流
+        endpoint = pool.acquire()
+        used.append(endpoint.name)
+        if len(used) == 1:
+            error = api_error(openai.RateLimitError, 429)
+            pool.release(endpoint, error)
+            raise error
+        pool.release(endpoint)
+        return endpoint.name
+
+    async def run_twice():
+        return [await asyncio.wait_for(scheduler.run(make_request), timeout=5) for _ in range(2)]
+
+    other = asyncio.run(run_twice())
+    # 限流的端點在暫停期間不再被選中，切換端點時也不觸發全局暫停
+    assert other[0] == other[1] != used[0]
+    assert used == [used[0], other[0], other[0]]
+    assert pool.snapshot()[used[0]]["available"] is False
+    assert scheduler._paused_until == 0.0
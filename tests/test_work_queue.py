@@ -0,0 +1,54 @@
+from langchain_core.documents import Document
+
+from metrics import MetricsRegistry
+from work_queue import WorkQueue, wait_for_job
+
+
+def test_budget_skipped_tasks_return_to_queue_on_resubmit(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    chunks = [Document(page_content=f"段落 {i}") for i in range(3)]
+    queue.submit("job", chunks, {}, budget_tokens=100)
+    tasks = queue.lease("w1", 3, 60)
+    queue.complete("w1", tasks[0], [])
+    for task in tasks[1:]:
+        queue.skip("w1", task, "已達任務預算上限")
+    assert queue.add_spent("job", 120, 0.01) == (120, 0.01)
+    progress = queue.progress("job")
+    assert (progress["done"], progress["skipped"], progress["pending"]) == (1, 2, 0)
+
+    queue.submit("job", chunks, {}, budget_tokens=500)
+    assert queue.job_budget("job")["budget_tokens"] == 500
+    progress = queue.progress("job")
+    assert (progress["done"], progress["skipped"], progress["pending"]) == (1, 0, 2)
+    retried = queue.lease("w1", 3, 60)
+    assert [task.chunk_index for task in retried] == [1, 2]
+    assert all(task.attempts == 1 for task in retried)
+    queue.close()
+
+
+def test_wait_for_job_stops_when_no_worker_is_active(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    queue.submit("job", [Document(page_content="段落")], {})
+    polled = []
+    assert wait_for_job(queue, "job", on_progress=polled.append, poll_interval=0.01, idle_timeout=0.05) is False
+    assert polled and polled[-1]["pending"] == 1
+
+    queue.complete("w1", queue.lease("w1", 1, 60)[0], [])
+    assert wait_for_job(queue, "job", poll_interval=0.01, idle_timeout=0.05) is True
+    queue.close()
+
+
+def test_worker_counters_are_summed_per_job(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    worker_metrics = MetricsRegistry()
+    worker_metrics.observe_call(1, "gpt-4.1-nano", 0.1, {"prompt_tokens": 100, "completion_tokens": 20})
+    queue.add_metrics("job", worker_metrics.counter_snapshot())
+    queue.add_metrics("job", worker_metrics.counter_snapshot())
+
+    run_metrics = MetricsRegistry()
+    run_metrics.merge_counters(queue.job_metrics("job"))
+    summary = run_metrics.summary()
+    assert summary["tokens"]["prompt"] == 200 and summary["tokens"]["completion"] == 40
+    assert summary["calls"]["stage1"]["calls"] == 2
+    assert summary["estimated_cost_usd"] == round(2 * worker_metrics.summary()["estimated_cost_usd"], 6)
+    queue.close()